@@ -0,0 +1,454 @@
+"""
+Per-offender and per-reporter aggregation index.
+
+analyze_incident scores every report on its own, and the repetition keywords
+only see repetition inside one text. AggregationIndex keeps, for every offender
+and every reporter identifier, running category and severity counts of the
+reports that involve them, so a pattern across separate reports can raise the
+severity of the next one without rescanning history. Only the offender's
+pattern, and their history with the reporter, escalates a report; the
+reporter's rollup is context for the moderator.
+
+Counts decay exponentially with a configurable half-life: a report counts 1
+when it arrives, 1/2 one half-life later, and so on. They are stored with
+forward decay: a report at time t adds 2 ** ((t - epoch) / half_life) and a
+count is read by scaling back to the query time. Recording a report is then one
+UPSERT per identifier that never reads the old row, and rows stored at
+different times stay comparable, so "top offenders" is a plain ORDER BY on an
+index. The store is a SQLite file (the standard library's sqlite3).
+
+    index = AggregationIndex('aggregation.db')
+    result = detector.analyze_incident(text)
+    index.add(result, offender='user-17', reporter='user-4')
+    result = index.escalate(result, offender='user-17', reporter='user-4')
+
+Usage:
+    python aggregation.py add reports.jsonl [--db aggregation.db]
+    python aggregation.py show offender|reporter ID [--db aggregation.db]
+    python aggregation.py top [--kind offender] [--limit 20] [--db aggregation.db]
+
+Report files are JSON lines with ``text``, ``offender``, ``reporter`` and an
+optional ``time`` (epoch seconds or ISO 8601).
+"""
+
+import argparse
+import itertools
+import json
+import math
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from batch_rules import SEVERITY_LEVELS
+from detector import CATEGORY_DISPLAY, HarassmentDetector
+
+AGGREGATION_DB_PATH = 'aggregation.db'
+DEFAULT_HALF_LIFE_DAYS = 30.0
+KINDS = ('offender', 'reporter')
+
+CATEGORIES = [key for key in CATEGORY_DISPLAY if key != 'non-harassment']
+_CATEGORY_KEYS = {CATEGORY_DISPLAY[key]: key for key in CATEGORIES}
+SEVERITY_COLUMNS = [level.lower() for level in SEVERITY_LEVELS]
+# Decayed counts per identifier. Severity and category counts only include harassment
+# reports; ``counterparts`` counts distinct reporters who reported harassment by an offender
+# (and distinct offenders of a reporter), as of each pair's first harassment report
+DECAYED_COLUMNS = ['reports', 'flagged'] + SEVERITY_COLUMNS + CATEGORIES + ['counterparts']
+
+# Pattern thresholds, in decayed reports. They sit halfway between whole counts so
+# recent reports count fully while reports a few half-lives old drop out
+REPEATED = 1.5          # about two harassment reports
+PERSISTENT = 2.5        # about three
+SEVERE_REPEATED = 1.5   # about two High or Critical reports
+MULTIPLE_COUNTERPARTS = 1.5
+
+# Rebase stored weights before 2 ** exponent gets anywhere near float overflow
+_MAX_EXPONENT = 512.0
+
+Timestamp = Union[float, int, datetime, None]
+
+
+def _seconds(timestamp: Timestamp) -> float:
+    if timestamp is None:
+        return time.time()
+    if isinstance(timestamp, datetime):
+        return timestamp.timestamp()
+    return float(timestamp)
+
+
+def pattern_severity(rollup: Dict) -> Tuple[Optional[str], List[str]]:
+    """
+    The severity a rollup's pattern warrants (None without a pattern) and the
+    reasons for it.
+    """
+    reasons = []
+    level = -1
+    severe = rollup['high'] + rollup['critical']
+    if severe >= SEVERE_REPEATED:
+        reasons.append(f"{severe:.1f} recent High/Critical reports")
+        level = max(level, SEVERITY_LEVELS.index('Critical'))
+    other = 'reporters' if rollup['kind'] == 'offender' else 'offenders'
+    if rollup['counterparts'] >= MULTIPLE_COUNTERPARTS and rollup['flagged'] >= REPEATED:
+        reasons.append(f"harassment involving {rollup['counterparts']:.1f} recent distinct {other}")
+        level = max(level, SEVERITY_LEVELS.index('Critical'))
+    if rollup['flagged'] >= PERSISTENT:
+        reasons.append(f"{rollup['flagged']:.1f} recent harassment reports")
+        level = max(level, SEVERITY_LEVELS.index('High'))
+    elif rollup['flagged'] >= REPEATED:
+        reasons.append(f"{rollup['flagged']:.1f} recent harassment reports")
+        level = max(level, SEVERITY_LEVELS.index('Medium'))
+    return (SEVERITY_LEVELS[level] if level >= 0 else None), reasons
+
+
+def pair_severity(flagged: int) -> Tuple[Optional[str], List[str]]:
+    """
+    The severity an offender's harassment reports from one reporter warrant (None
+    below two) and the reasons for it. Pair counts do not decay: the same person
+    targeted again and again is a pattern however spread out the reports are.
+    """
+    if flagged >= PERSISTENT:
+        return 'High', [f"{flagged} harassment reports from this reporter"]
+    if flagged >= REPEATED:
+        return 'Medium', [f"{flagged} harassment reports from this reporter"]
+    return None, []
+
+
+class AggregationIndex:
+    """
+    Time-decayed report rollups per offender and per reporter, in a SQLite store
+    (``':memory:'`` for a throwaway index). The half-life is fixed when the store is
+    created.
+    """
+
+    def __init__(self, path: str = AGGREGATION_DB_PATH, half_life_days: Optional[float] = None):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL NOT NULL)")
+        decayed = ', '.join(f"{column} REAL NOT NULL" for column in DECAYED_COLUMNS)
+        self.connection.execute(
+            f"CREATE TABLE IF NOT EXISTS rollups (kind TEXT NOT NULL, entity TEXT NOT NULL, {decayed}, "
+            "total_reports INTEGER NOT NULL, first_seen REAL NOT NULL, last_seen REAL NOT NULL, "
+            "last_flagged REAL, PRIMARY KEY (kind, entity))"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS rollups_flagged ON rollups (kind, flagged)")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS pairs (offender TEXT NOT NULL, reporter TEXT NOT NULL, "
+            "reports INTEGER NOT NULL, flagged INTEGER NOT NULL, first_seen REAL NOT NULL, "
+            "last_seen REAL NOT NULL, PRIMARY KEY (offender, reporter))"
+        )
+
+        meta = dict(self.connection.execute("SELECT key, value FROM meta"))
+        if 'half_life' in meta:
+            self.half_life = meta['half_life']
+            if half_life_days is not None and not math.isclose(half_life_days * 86400, self.half_life):
+                raise ValueError(f"{path} was created with a half-life of {self.half_life / 86400:g} days")
+            self.epoch = meta['epoch']
+        else:
+            self.half_life = (half_life_days or DEFAULT_HALF_LIFE_DAYS) * 86400
+            if self.half_life <= 0:
+                raise ValueError("half_life_days must be positive")
+            self.epoch = time.time()
+            with self.connection:
+                self.connection.executemany("INSERT INTO meta VALUES (?, ?)",
+                                            [('half_life', self.half_life), ('epoch', self.epoch)])
+        self.connection.commit()
+
+        increments = ', '.join(f"{column} = {column} + excluded.{column}" for column in DECAYED_COLUMNS)
+        self._upsert = (
+            f"INSERT INTO rollups (kind, entity, {', '.join(DECAYED_COLUMNS)}, total_reports, "
+            f"first_seen, last_seen, last_flagged) VALUES ({', '.join('?' * (len(DECAYED_COLUMNS) + 6))}) "
+            f"ON CONFLICT (kind, entity) DO UPDATE SET {increments}, "
+            "total_reports = total_reports + excluded.total_reports, "
+            "first_seen = min(first_seen, excluded.first_seen), "
+            "last_seen = max(last_seen, excluded.last_seen), "
+            "last_flagged = max(coalesce(last_flagged, excluded.last_flagged), "
+            "coalesce(excluded.last_flagged, last_flagged))"
+        )
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self) -> 'AggregationIndex':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _weight(self, seconds: float) -> float:
+        """Forward-decay weight of a report at ``seconds``."""
+        exponent = (seconds - self.epoch) / self.half_life
+        if exponent > _MAX_EXPONENT:
+            self._rebase(seconds)
+            exponent = 0.0
+        return 2.0 ** exponent
+
+    def _rebase(self, seconds: float):
+        """
+        Move the epoch to ``seconds``, rescaling every stored count (rare: once per
+        ~500 half-lives). Runs inside the caller's transaction (see _transaction).
+        """
+        scale = 2.0 ** (-(seconds - self.epoch) / self.half_life)
+        self.connection.execute(
+            f"UPDATE rollups SET {', '.join(f'{column} = {column} * ?' for column in DECAYED_COLUMNS)}",
+            [scale] * len(DECAYED_COLUMNS)
+        )
+        self.connection.execute("UPDATE meta SET value = ? WHERE key = 'epoch'", (seconds,))
+        self.epoch = seconds
+
+    @contextmanager
+    def _transaction(self):
+        """One write transaction; if it rolls back, so does a rebase's in-memory epoch."""
+        epoch = self.epoch
+        try:
+            with self.connection:
+                yield
+        except BaseException:
+            self.epoch = epoch
+            raise
+
+    def _record(self, offender: Optional[str], reporter: Optional[str], seconds: float,
+                is_harassment: bool, category: str, severity: str):
+        weight = self._weight(seconds)
+        counterpart = 0.0
+        if offender is not None and reporter is not None:
+            key = (offender, reporter)
+            self.connection.execute("INSERT OR IGNORE INTO pairs VALUES (?, ?, 0, 0, ?, ?)",
+                                    key + (seconds, seconds))
+            if is_harassment:
+                flagged, = self.connection.execute(
+                    "SELECT flagged FROM pairs WHERE offender = ? AND reporter = ?", key).fetchone()
+                if not flagged:
+                    counterpart = weight
+            self.connection.execute(
+                "UPDATE pairs SET reports = reports + 1, flagged = flagged + ?, first_seen = min(first_seen, ?), "
+                "last_seen = max(last_seen, ?) WHERE offender = ? AND reporter = ?",
+                (int(is_harassment), seconds, seconds) + key
+            )
+
+        values = dict.fromkeys(DECAYED_COLUMNS, 0.0)
+        values['reports'] = weight
+        if is_harassment:
+            values['flagged'] = weight
+            values[severity.lower()] = weight
+            if category in _CATEGORY_KEYS:
+                values[_CATEGORY_KEYS[category]] = weight
+        values['counterparts'] = counterpart
+        decayed = list(values.values())
+        last_flagged = seconds if is_harassment else None
+        for kind, entity in zip(KINDS, (offender, reporter)):
+            if entity is not None:
+                self.connection.execute(self._upsert, [kind, entity] + decayed
+                                        + [1, seconds, seconds, last_flagged])
+
+    def add(self, result: Dict, offender: Optional[str] = None, reporter: Optional[str] = None,
+            timestamp: Timestamp = None):
+        """
+        Record one report analyzed with analyze_incident (any dict with is_harassment,
+        category and severity). ``timestamp`` defaults to now; reports may arrive out of
+        order.
+        """
+        if offender is None and reporter is None:
+            return
+        with self._transaction():
+            self._record(offender, reporter, _seconds(timestamp), bool(result['is_harassment']),
+                         result['category'], result['severity'])
+
+    def add_batch(self, scores: Dict, offenders: Sequence[Optional[str]], reporters: Sequence[Optional[str]],
+                  timestamps: Optional[Sequence[Timestamp]] = None) -> int:
+        """
+        Record a batch scored with HarassmentDetector.score_batch in one transaction.
+        Returns the number of reports recorded.
+        """
+        if timestamps is None:
+            timestamps = itertools.repeat(None)
+        recorded = 0
+        with self._transaction():
+            for i, (offender, reporter, timestamp) in enumerate(zip(offenders, reporters, timestamps)):
+                if offender is None and reporter is None:
+                    continue
+                self._record(offender, reporter, _seconds(timestamp), bool(scores['is_harassment'][i]),
+                             scores['category'][i], scores['severity'][i])
+                recorded += 1
+        return recorded
+
+    def _rollup(self, row: Sequence, now: float) -> Dict:
+        kind, entity = row[:2]
+        scale = 2.0 ** (-(now - self.epoch) / self.half_life)
+        rollup = {'kind': kind, 'entity': entity}
+        rollup.update((column, value * scale) for column, value in zip(DECAYED_COLUMNS, row[2:]))
+        total_reports, first_seen, last_seen, last_flagged = row[2 + len(DECAYED_COLUMNS):]
+        rollup.update(total_reports=total_reports, first_seen=first_seen,
+                      last_seen=last_seen, last_flagged=last_flagged)
+        top_category = max(CATEGORIES, key=rollup.__getitem__)
+        rollup['category'] = CATEGORY_DISPLAY[top_category] if rollup[top_category] > 0 else None
+        rollup['pattern_severity'], rollup['reasons'] = pattern_severity(rollup)
+        return rollup
+
+    def rollup(self, kind: str, entity: str, now: Timestamp = None) -> Optional[Dict]:
+        """
+        An identifier's counts decayed to ``now`` (default: the current time), its
+        most frequent harassment category and pattern severity; None if never seen.
+        """
+        if kind not in KINDS:
+            raise ValueError(f"kind must be one of {KINDS}")
+        row = self.connection.execute("SELECT * FROM rollups WHERE kind = ? AND entity = ?",
+                                      (kind, entity)).fetchone()
+        return self._rollup(row, _seconds(now)) if row else None
+
+    def top(self, kind: str = 'offender', limit: int = 20, now: Timestamp = None) -> List[Dict]:
+        """Rollups with the most decayed harassment reports, highest first."""
+        if kind not in KINDS:
+            raise ValueError(f"kind must be one of {KINDS}")
+        # Forward-decayed counts share one scale, so stored values order like current ones
+        rows = self.connection.execute(
+            "SELECT * FROM rollups WHERE kind = ? ORDER BY flagged DESC LIMIT ?", (kind, limit)
+        ).fetchall()
+        seconds = _seconds(now)
+        return [self._rollup(row, seconds) for row in rows]
+
+    def reporters(self, offender: str) -> List[Tuple[str, int, int, float]]:
+        """
+        (reporter, reports, harassment reports, last seen) for everyone who reported
+        ``offender``, most recent first.
+        """
+        return self.connection.execute(
+            "SELECT reporter, reports, flagged, last_seen FROM pairs WHERE offender = ? ORDER BY last_seen DESC",
+            (offender,)
+        ).fetchall()
+
+    def pair(self, offender: str, reporter: str) -> Optional[Tuple[int, int, float, float]]:
+        """(reports, harassment reports, first seen, last seen) of one offender and reporter."""
+        return self.connection.execute(
+            "SELECT reports, flagged, first_seen, last_seen FROM pairs WHERE offender = ? AND reporter = ?",
+            (offender, reporter)
+        ).fetchone()
+
+    def escalate(self, result: Dict, offender: Optional[str] = None, reporter: Optional[str] = None,
+                 now: Timestamp = None) -> Dict:
+        """
+        A copy of ``result`` with its severity raised to what the offender's pattern,
+        and the offender's history with this reporter, warrant, plus a ``pattern``
+        entry with the reasons. The reporter's own rollup is returned there for
+        context only: reporting many people says nothing about this offender.
+        Only harassment results are escalated; record the report with ``add`` first
+        so it counts towards its own pattern.
+        """
+        result = dict(result)
+        patterns = []
+        if offender is not None:
+            rollup = self.rollup('offender', offender, now)
+            if rollup is not None:
+                patterns.append((f"offender {offender}", rollup['pattern_severity'], rollup['reasons']))
+            if reporter is not None:
+                pair = self.pair(offender, reporter)
+                if pair is not None:
+                    patterns.append((f"offender {offender} and reporter {reporter}", *pair_severity(pair[1])))
+
+        severity = result['severity']
+        reasons = []
+        for source, pattern, pattern_reasons in patterns:
+            if pattern is None:
+                continue
+            reasons.extend(f"{source}: {reason}" for reason in pattern_reasons)
+            if SEVERITY_LEVELS.index(pattern) > SEVERITY_LEVELS.index(severity):
+                severity = pattern
+
+        escalated = result['is_harassment'] and severity != result['severity']
+        result['pattern'] = {
+            'reasons': reasons,
+            'escalated_from': result['severity'] if escalated else None,
+            'reporter': self.rollup('reporter', reporter, now) if reporter is not None else None
+        }
+        if escalated:
+            result['severity'] = severity
+        return result
+
+
+def _parse_time(value) -> Timestamp:
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    return datetime.fromisoformat(value)
+
+
+def _read_reports(path: str, text_field: str) -> Iterator[Tuple[str, Optional[str], Optional[str], Timestamp]]:
+    """Yield (text, offender, reporter, time) from a JSON lines file."""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                offender, reporter = record.get('offender'), record.get('reporter')
+                yield (record[text_field],
+                       None if offender is None else str(offender),
+                       None if reporter is None else str(reporter),
+                       _parse_time(record.get('time')))
+
+
+def index_reports(index: AggregationIndex, reports: Iterable[Tuple[str, Optional[str], Optional[str], Timestamp]],
+                  detector: Optional[HarassmentDetector] = None, batch_size: int = 10000) -> int:
+    """Score (text, offender, reporter, time) reports in batches and record them."""
+    detector = detector or HarassmentDetector()
+    iterator = iter(reports)
+    recorded = 0
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return recorded
+        texts, offenders, reporters, timestamps = zip(*batch)
+        recorded += index.add_batch(detector.score_batch(list(texts)), offenders, reporters, timestamps)
+
+
+def _format_rollup(rollup: Dict) -> str:
+    severities = ', '.join(f"{level} {rollup[level.lower()]:.1f}" for level in SEVERITY_LEVELS)
+    lines = [
+        f"{rollup['kind']} {rollup['entity']}: {rollup['total_reports']} reports, "
+        f"{rollup['flagged']:.1f} recent harassment reports ({severities})",
+        f"  top category: {rollup['category'] or '-'}, distinct counterparts: {rollup['counterparts']:.1f}",
+        f"  pattern severity: {rollup['pattern_severity'] or '-'}"
+    ]
+    lines.extend(f"  - {reason}" for reason in rollup['reasons'])
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', default=AGGREGATION_DB_PATH)
+    parser.add_argument('--half-life-days', type=float, help='only used when the store is created')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add = commands.add_parser('add', help='score a JSON lines file of reports and record them')
+    add.add_argument('input')
+    add.add_argument('--text-field', default='text')
+    add.add_argument('--batch-size', type=int, default=10000)
+
+    show = commands.add_parser('show', help="show one identifier's rollup")
+    show.add_argument('kind', choices=KINDS)
+    show.add_argument('entity')
+
+    top = commands.add_parser('top', help='identifiers with the most recent harassment reports')
+    top.add_argument('--kind', choices=KINDS, default='offender')
+    top.add_argument('--limit', type=int, default=20)
+
+    args = parser.parse_args(argv)
+    with AggregationIndex(args.db, args.half_life_days) as index:
+        if args.command == 'add':
+            recorded = index_reports(index, _read_reports(args.input, args.text_field),
+                                     batch_size=args.batch_size)
+            print(f"Recorded {recorded} reports in {args.db}")
+        elif args.command == 'show':
+            rollup = index.rollup(args.kind, args.entity)
+            if rollup is None:
+                print(f"No reports for {args.kind} {args.entity}", file=sys.stderr)
+                return 1
+            print(_format_rollup(rollup))
+        else:
+            for rollup in index.top(args.kind, args.limit):
+                print(_format_rollup(rollup))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,6 +6,7 @@ import os
 
 # Import custom modules
 from detector import HarassmentDetector
+from profiling import install as install_profiler
 from utils import format_confidence_score, get_severity_color
 
 # Page configuration
@@ -72,7 +73,8 @@ st.markdown("""
 # Initialize detector
 @st.cache_resource
 def load_detector():
-    return HarassmentDetector()
+    # Profiling hooks are only added when HARASSMENT_PROFILE_* is set
+    return install_profiler(HarassmentDetector())
 
 detector = load_detector()
 
@@ -0,0 +1,294 @@
+"""
+Vectorized rule engine for batch keyword scoring.
+
+Computes the same result as HarassmentDetector._rule_based_check, but for many
+documents at once: keyword hits are collected into a sparse documents x keywords
+matrix and every score is derived from it with a handful of array operations.
+Obfuscated spellings found by an optional FuzzyMatcher are added as a second,
+weighted matrix over the same keyword columns.
+"""
+
+import bisect
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from scipy import sparse
+
+from preprocess import as_document
+
+SEVERITY_LEVELS = ['Low', 'Medium', 'High', 'Critical']
+SEVERITY_WEIGHTS = {'high': 10, 'medium': 5, 'low': 2}
+
+# Intents that escalate severity by one level each (see _rule_based_check)
+BOUNDARY_INTENTS = ('ignoring_boundaries', 'coercion', 'no_consent')
+
+# Separates documents in the joined corpus; no keyword or intent pattern can match across it
+_DOC_SEPARATOR = '\x00'
+
+
+def _is_word_char(char: str) -> bool:
+    """Same definition of a word character as the re module's \\w."""
+    return char.isalnum() or char == '_'
+
+
+class BatchRuleResult:
+    """Rule scores for a batch of documents, one row per document."""
+
+    def __init__(self, engine: 'BatchRuleEngine', hits: sparse.csr_matrix,
+                 intents: np.ndarray, category_scores: np.ndarray,
+                 severity: np.ndarray, final_severity: np.ndarray,
+                 fuzzy: Optional[List[List]] = None):
+        self.engine = engine
+        self.hits = hits                        # docs x keywords, bool
+        self.fuzzy = fuzzy                      # FuzzyMatch lists per document, if enabled
+        self.intents = intents                  # docs x intent patterns, bool
+        self.category_scores = category_scores  # docs x categories, int
+        self.severity = severity                # rule severity level (index into SEVERITY_LEVELS)
+        self.final_severity = final_severity    # after the score/multi-category Critical rules
+
+    def __len__(self) -> int:
+        return self.category_scores.shape[0]
+
+    @property
+    def score(self) -> np.ndarray:
+        return self.category_scores.sum(axis=1)
+
+    @property
+    def category_count(self) -> np.ndarray:
+        return np.count_nonzero(self.category_scores, axis=1)
+
+    @property
+    def boundary_intents(self) -> np.ndarray:
+        """Number of boundary-violating intents (BOUNDARY_INTENTS) matched per document."""
+        return self.intents[:, self.engine._boundary_mask].sum(axis=1)
+
+    @property
+    def primary_category(self) -> np.ndarray:
+        """Index of the highest scoring category, -1 where nothing matched."""
+        primary = self.category_scores.argmax(axis=1)
+        primary[self.score == 0] = -1
+        return primary
+
+    def rule_result(self, i: int) -> Dict:
+        """Rebuild the _rule_based_check dictionary for document ``i``."""
+        engine = self.engine
+        hits = self.hits
+        columns = np.sort(hits.indices[hits.indptr[i]:hits.indptr[i + 1]])
+        matched_keywords = [engine.labels[j] for j in columns]
+        fuzzy_matches = self.fuzzy[i] if self.fuzzy is not None else []
+        matched_keywords.extend(match.label for match in fuzzy_matches)
+        intent_matches = [engine.intent_names[j] for j in np.flatnonzero(self.intents[i])]
+        scores = self.category_scores[i]
+        category_scores = {
+            engine.categories[c]: int(scores[c]) for c in np.flatnonzero(scores)
+        }
+        return {
+            'category': engine.categories[scores.argmax()] if category_scores else None,
+            'severity': SEVERITY_LEVELS[self.severity[i]],
+            'score': int(scores.sum()),
+            'matched_keywords': matched_keywords,
+            'intent_matches': intent_matches,
+            'category_scores': category_scores,
+            'fuzzy_matches': [match.as_dict() for match in fuzzy_matches]
+        }
+
+    def rule_results(self) -> List[Dict]:
+        return [self.rule_result(i) for i in range(len(self))]
+
+    @staticmethod
+    def concatenate(parts: List['BatchRuleResult']) -> 'BatchRuleResult':
+        """One result from the results of consecutive chunks."""
+        return BatchRuleResult(
+            parts[0].engine,
+            sparse.vstack([p.hits for p in parts], format='csr'),
+            np.vstack([p.intents for p in parts]),
+            np.vstack([p.category_scores for p in parts]),
+            np.concatenate([p.severity for p in parts]),
+            np.concatenate([p.final_severity for p in parts]),
+            [m for p in parts for m in p.fuzzy] if parts[0].fuzzy is not None else None
+        )
+
+
+class BatchRuleEngine:
+    """
+    Sparse-matrix version of the keyword and intent rules.
+
+    Every (category, severity, keyword) entry of the lexicon becomes one column.
+    The batch is lowercased and joined into one corpus string, each distinct
+    keyword is located with a single C-level str.find scan over that corpus, and
+    the hit positions are mapped back to documents with np.searchsorted.
+    """
+
+    def __init__(self, keywords: Dict[str, Dict[str, List[str]]],
+                 intent_patterns: Sequence[Tuple[str, str]], fuzzy=None):
+        self.fuzzy = fuzzy
+        self.categories = list(keywords)
+        self.labels = []        # column -> "keyword (category, severity)"
+        self.columns = []       # column -> (category, severity, keyword)
+        column_terms = []
+        column_category = []
+        column_weight = []
+        column_level = []
+        for c, (category, severity_dict) in enumerate(keywords.items()):
+            for severity, terms in severity_dict.items():
+                for term in terms:
+                    self.labels.append(f"{term} ({category}, {severity})")
+                    self.columns.append((category, severity, term))
+                    column_terms.append(term)
+                    column_category.append(c)
+                    column_weight.append(SEVERITY_WEIGHTS.get(severity, 2))
+                    # Keyword matches alone never go past High
+                    column_level.append({'high': 2, 'medium': 1}.get(severity, 0))
+        n_columns = len(column_terms)
+
+        # The same keyword may appear under several categories; scan for it once
+        self.terms = list(dict.fromkeys(column_terms))
+        term_index = {term: t for t, term in enumerate(self.terms)}
+        self._term_columns = sparse.csr_matrix(
+            (np.ones(n_columns, dtype=np.int32),
+             ([term_index[term] for term in column_terms], np.arange(n_columns))),
+            shape=(len(self.terms), n_columns)
+        )
+
+        # keyword -> category weight matrix
+        self.weights = sparse.csr_matrix(
+            (np.array(column_weight, dtype=np.int32),
+             (np.arange(n_columns), np.array(column_category))),
+            shape=(n_columns, len(self.categories))
+        )
+        self.column_level = np.array(column_level, dtype=np.int8)
+        # keyword -> category indicator, for the already weighted fuzzy hits
+        self._column_categories = (self.weights != 0).astype(np.int32)
+
+        self.intent_names = [name for _, name in intent_patterns]
+        # A leading \b defeats the regex engine's literal-prefix scan, so it is
+        # stripped here and checked by hand on each candidate match instead
+        self._intent_regexes = []
+        for pattern, _ in intent_patterns:
+            if pattern.startswith(r'\b'):
+                self._intent_regexes.append((re.compile(pattern[2:]), True))
+            else:
+                self._intent_regexes.append((re.compile(pattern), False))
+        self._boundary_mask = np.array(
+            [name in BOUNDARY_INTENTS for name in self.intent_names], dtype=bool
+        )
+
+    def _term_hits(self, corpus: str, starts: np.ndarray) -> sparse.csr_matrix:
+        """Sparse docs x keywords matrix of every keyword occurring in each document."""
+        positions = []
+        term_ids = []
+        find = corpus.find
+        for t, term in enumerate(self.terms):
+            position = find(term)
+            while position != -1:
+                positions.append(position)
+                term_ids.append(t)
+                position = find(term, position + 1)
+        doc_ids = np.searchsorted(starts, np.array(positions, dtype=np.int64), side='right') - 1
+        hits = sparse.csr_matrix(
+            (np.ones(len(term_ids), dtype=np.int32), (doc_ids, np.array(term_ids, dtype=np.int64))),
+            shape=(len(starts), len(self.terms))
+        )
+        return hits @ self._term_columns
+
+    def _intent_hits(self, corpus: str, starts: np.ndarray) -> np.ndarray:
+        """Dense docs x intent patterns matrix; each document only needs its first match."""
+        doc_starts = starts.tolist()
+        intents = np.zeros((len(starts), len(self._intent_regexes)), dtype=bool)
+        for p, (regex, word_boundary) in enumerate(self._intent_regexes):
+            search = regex.search
+            match = search(corpus)
+            while match is not None:
+                position = match.start()
+                if word_boundary and position and _is_word_char(corpus[position - 1]):
+                    match = search(corpus, position + 1)
+                    continue
+                doc = bisect.bisect_right(doc_starts, position) - 1
+                intents[doc, p] = True
+                if doc + 1 == len(doc_starts):
+                    break
+                match = search(corpus, doc_starts[doc + 1])
+        return intents
+
+    def score(self, texts: Sequence, chunk_size: Optional[int] = 50000) -> BatchRuleResult:
+        """
+        Score ``texts`` (strings or preprocessed Documents).
+        Documents are processed in chunks of ``chunk_size`` to bound the size of the joined corpus.
+        """
+        if chunk_size and len(texts) > chunk_size:
+            return BatchRuleResult.concatenate([self.score(texts[i:i + chunk_size], chunk_size=None)
+                                                for i in range(0, len(texts), chunk_size)])
+
+        documents = [as_document(text) for text in texts]
+        corpus, starts = self.corpus(documents)
+        hits = self.keyword_hits(corpus, starts)
+        intents = self.intent_hits(corpus, starts)
+        category_scores, severity = self.keyword_scores(hits)
+
+        fuzzy = None
+        if self.fuzzy is not None:
+            fuzzy = [self.fuzzy.find(document) for document in documents]
+            category_scores, severity = self.add_fuzzy(fuzzy, category_scores, severity)
+
+        severity, final_severity = self.escalate(intents, category_scores, severity)
+        return BatchRuleResult(self, hits, intents, category_scores, severity, final_severity, fuzzy)
+
+    # The steps of score, also used to merge tenant overlays into the base lexicon (tenants.py)
+
+    @staticmethod
+    def corpus(documents: Sequence) -> Tuple[str, np.ndarray]:
+        """The lowercased documents joined into one string, and each document's start offset."""
+        lowered = [document.lower for document in documents]
+        lengths = np.fromiter((len(text) + 1 for text in lowered), dtype=np.int64, count=len(lowered))
+        starts = np.cumsum(lengths) - lengths
+        return _DOC_SEPARATOR.join(lowered), starts
+
+    def keyword_hits(self, corpus: str, starts: np.ndarray) -> sparse.csr_matrix:
+        """Bool docs x keyword columns matrix."""
+        return self._term_hits(corpus, starts).astype(bool).tocsr()
+
+    def intent_hits(self, corpus: str, starts: np.ndarray) -> np.ndarray:
+        """Bool docs x intent patterns matrix."""
+        return self._intent_hits(corpus, starts)
+
+    def keyword_scores(self, hits: sparse.csr_matrix) -> Tuple[np.ndarray, np.ndarray]:
+        """Category scores and highest keyword severity level of each document."""
+        category_scores = np.asarray((hits.astype(np.int32) @ self.weights).todense())
+        # Highest keyword severity per document
+        level_hits = hits.multiply(self.column_level).tocsr()
+        severity = np.zeros(hits.shape[0], dtype=np.int8)
+        if level_hits.nnz:
+            severity = np.asarray(level_hits.max(axis=1).todense()).ravel().astype(np.int8)
+        return category_scores, severity
+
+    def add_fuzzy(self, fuzzy: List[List], category_scores: np.ndarray,
+                  severity: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Add the discounted weights and severity of each document's FuzzyMatches."""
+        entries = [(i, match.column, match.weight) for i, matches in enumerate(fuzzy) for match in matches]
+        if not entries:
+            return category_scores, severity
+        rows, columns, weights = (np.array(values) for values in zip(*entries))
+        fuzzy_weights = sparse.csr_matrix((weights.astype(np.int32), (rows, columns)),
+                                          shape=(len(fuzzy), len(self.labels)))
+        category_scores = category_scores + np.asarray(
+            (fuzzy_weights @ self._column_categories).todense())
+        fuzzy_levels = (fuzzy_weights != 0).multiply(self.column_level).tocsr()
+        if fuzzy_levels.nnz:
+            severity = np.maximum(
+                severity, np.asarray(fuzzy_levels.max(axis=1).todense()).ravel().astype(np.int8))
+        return category_scores, severity
+
+    def escalate(self, intents: np.ndarray, category_scores: np.ndarray,
+                 severity: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Rule severity and final severity after the intent and multi-category rules."""
+        # Each boundary-violating intent escalates by one level, up to High
+        escalation = intents[:, self._boundary_mask].sum(axis=1)
+        severity = np.where(severity >= 2, severity, np.minimum(severity + escalation, 2)).astype(np.int8)
+
+        # Three or more categories indicate a more serious situation
+        category_count = np.count_nonzero(category_scores, axis=1)
+        severity[category_count >= 3] = 2
+
+        final_severity = severity.copy()
+        final_severity[(category_scores.sum(axis=1) > 20) | (category_count >= 3)] = 3
+        return severity, final_severity
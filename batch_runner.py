@@ -0,0 +1,332 @@
+"""
+Checkpointed, resumable batch scoring jobs.
+
+A job splits its input into numbered shards inside a job directory. Local worker
+processes claim shards from a file-lock protected queue, score them with
+HarassmentDetector and write each shard's results atomically, so a crashed or
+redeployed run resumes exactly where it stopped.
+
+A claim names the worker by a random token, and the worker holds an flock on
+``workers/<token>.lock`` for as long as it lives. The kernel drops that lock
+when the process dies, so a claim is stale exactly when its lock can be taken.
+That check cannot be fooled by a reused PID.
+
+Usage:
+    python batch_runner.py init JOB_DIR reports.jsonl --shard-size 10000
+    python batch_runner.py run JOB_DIR --workers 4
+    python batch_runner.py status JOB_DIR
+
+Input may be JSON lines (``--text-field``, default "text"), CSV (``--text-field``
+names the column) or plain text with one report per line.
+"""
+
+import argparse
+import fcntl
+import gc
+import json
+import multiprocessing
+import os
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from utils import json_default, read_records
+
+MANIFEST = 'manifest.json'
+STATE = 'state.json'
+LOCK = 'queue.lock'
+WORKERS = 'workers'
+
+
+def _write_atomic(path: str, data: str):
+    """Write ``data`` to ``path`` so readers see either the old file or the complete new one."""
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _shard_path(job_dir: str, shard: int, kind: str) -> str:
+    return os.path.join(job_dir, 'shards', f"{shard:05d}.{kind}.jsonl")
+
+
+class WorkerLease:
+    """A worker's token in the queue state, with the lock file it holds while alive."""
+
+    def __init__(self, job_dir: str):
+        self.token = uuid.uuid4().hex
+        directory = os.path.join(job_dir, WORKERS)
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{self.token}.lock")
+        self._file = open(self.path, 'w')
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    @staticmethod
+    def is_held(job_dir: str, token) -> bool:
+        """Whether the worker behind ``token`` is still alive. Claims without a token are stale."""
+        if not isinstance(token, str):
+            return False
+        path = os.path.join(job_dir, WORKERS, f"{token}.lock")
+        try:
+            lock = open(path)
+        except FileNotFoundError:
+            return False
+        with lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+            # The worker is gone: clean up its lock file
+            os.remove(path)
+            fcntl.flock(lock, fcntl.LOCK_UN)
+        return False
+
+
+class BatchJob:
+    """A job directory: manifest, per-shard inputs/results and the shared queue state."""
+
+    def __init__(self, job_dir: str):
+        self.job_dir = job_dir
+        with open(os.path.join(job_dir, MANIFEST), encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self.lease = None       # WorkerLease, taken on the first claim
+
+    @classmethod
+    def create(cls, job_dir: str, input_path: str, shard_size: int = 10000,
+               text_field: str = 'text') -> 'BatchJob':
+        """Split ``input_path`` into shards of ``shard_size`` records, streaming."""
+        if os.path.exists(os.path.join(job_dir, MANIFEST)):
+            raise FileExistsError(f"{job_dir} already contains a job")
+        os.makedirs(os.path.join(job_dir, 'shards'), exist_ok=True)
+
+        num_shards, num_records, shard_file = 0, 0, None
+        for record_id, text in read_records(input_path, text_field):
+            if num_records % shard_size == 0:
+                if shard_file:
+                    shard_file.close()
+                shard_file = open(_shard_path(job_dir, num_shards, 'input'), 'w', encoding='utf-8')
+                num_shards += 1
+            shard_file.write(json.dumps({'id': record_id, 'text': text}) + '\n')
+            num_records += 1
+        if shard_file:
+            shard_file.close()
+
+        manifest = {
+            'input': os.path.abspath(input_path),
+            'shard_size': shard_size,
+            'num_shards': num_shards,
+            'num_records': num_records,
+            'created': time.time()
+        }
+        _write_atomic(os.path.join(job_dir, STATE), json.dumps({}))
+        _write_atomic(os.path.join(job_dir, MANIFEST), json.dumps(manifest, indent=2))
+        return cls(job_dir)
+
+    @contextmanager
+    def _locked_state(self):
+        """Exclusive access to the queue state across processes."""
+        with open(os.path.join(self.job_dir, LOCK), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(os.path.join(self.job_dir, STATE), encoding='utf-8') as f:
+                    state = json.load(f)
+                yield state
+                _write_atomic(os.path.join(self.job_dir, STATE), json.dumps(state))
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _recovered_entry(self, shard: int) -> Dict:
+        """State entry for a shard whose worker died after writing its results but before complete()."""
+        path = _shard_path(self.job_dir, shard, 'result')
+        with open(path, encoding='utf-8') as f:
+            records = sum(1 for _ in f)
+        return {'status': 'done', 'records': records, 'seconds': 0.0,
+                'finished_at': os.path.getmtime(path), 'recovered': True}
+
+    def claim(self) -> Optional[int]:
+        """
+        Claim the next shard that is neither done nor held by a live worker.
+        Shards whose result file exists are recorded as done on the way.
+        """
+        if self.lease is None:
+            self.lease = WorkerLease(self.job_dir)
+        with self._locked_state() as state:
+            for shard in range(self.manifest['num_shards']):
+                entry = state.get(str(shard), {})
+                if entry.get('status') == 'done':
+                    continue
+                if os.path.exists(_shard_path(self.job_dir, shard, 'result')):
+                    state[str(shard)] = self._recovered_entry(shard)
+                    continue
+                if entry.get('status') == 'claimed' and WorkerLease.is_held(self.job_dir, entry.get('worker')):
+                    continue
+                state[str(shard)] = {'status': 'claimed', 'worker': self.lease.token, 'pid': os.getpid(),
+                                     'claimed_at': time.time()}
+                return shard
+        return None
+
+    def release(self):
+        """Give up this process's worker lease (its claims become stale)."""
+        if self.lease is not None:
+            self.lease.release()
+            self.lease = None
+
+    def complete(self, shard: int, records: int, seconds: float):
+        with self._locked_state() as state:
+            state[str(shard)] = {'status': 'done', 'records': records, 'seconds': seconds,
+                                 'finished_at': time.time()}
+
+    def process_shard(self, detector, shard: int, batch_size: int = 1000) -> int:
+        """Score one shard and write its results atomically. Returns the number of records."""
+        with open(_shard_path(self.job_dir, shard, 'input'), encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+
+        lines = []
+        for i in range(0, len(records), batch_size):
+            batch = records[i:i + batch_size]
+            results = detector.analyze_batch([record['text'] for record in batch])
+            lines.extend(json.dumps({'id': record['id'], **result}, default=json_default)
+                         for record, result in zip(batch, results))
+        _write_atomic(_shard_path(self.job_dir, shard, 'result'),
+                      '\n'.join(lines) + ('\n' if lines else ''))
+        return len(records)
+
+    def progress(self, since: Optional[float] = None) -> Dict:
+        """
+        Done shards and records from the queue state, with throughput and ETA
+        measured over shards finished after ``since`` (the start of the current run).
+        """
+        with open(os.path.join(self.job_dir, STATE), encoding='utf-8') as f:
+            state = json.load(f)
+        done = [entry for entry in state.values() if entry.get('status') == 'done']
+        records = sum(entry['records'] for entry in done)
+        total = self.manifest['num_records']
+        if since is None:
+            since = min((entry['finished_at'] - entry['seconds'] for entry in done), default=time.time())
+        recent = sum(entry['records'] for entry in done if entry['finished_at'] >= since)
+        elapsed = time.time() - since
+        throughput = recent / elapsed if elapsed > 0 else 0.0
+        return {
+            'shards_done': len(done),
+            'shards_total': self.manifest['num_shards'],
+            'records_done': records,
+            'records_total': total,
+            'throughput': throughput,
+            'eta_seconds': (total - records) / throughput if throughput else None
+        }
+
+    def results(self) -> Iterator[Dict]:
+        """Iterate over every result record, shard by shard."""
+        for shard in range(self.manifest['num_shards']):
+            path = _shard_path(self.job_dir, shard, 'result')
+            if os.path.exists(path):
+                with open(path, encoding='utf-8') as f:
+                    for line in f:
+                        yield json.loads(line)
+
+
+def _worker(job_dir: str, detector, batch_size: int):
+    job = BatchJob(job_dir)
+    try:
+        while True:
+            shard = job.claim()
+            if shard is None:
+                return
+            start = time.time()
+            records = job.process_shard(detector, shard, batch_size)
+            job.complete(shard, records, time.time() - start)
+    finally:
+        job.release()
+
+
+def _format_progress(progress: Dict) -> str:
+    eta = progress['eta_seconds']
+    return (f"{progress['shards_done']}/{progress['shards_total']} shards, "
+            f"{progress['records_done']}/{progress['records_total']} records, "
+            f"{progress['throughput']:.0f} records/s, "
+            f"ETA {'n/a' if eta is None else f'{eta:.0f}s'}")
+
+
+def run(job_dir: str, workers: int = 1, batch_size: int = 1000, report_interval: float = 5.0) -> Dict:
+    """
+    Run local worker processes until every shard is done, reporting progress.
+    The detector is preloaded once in this process so forked workers share it; the
+    gc.freeze() that preload applies is undone once the workers have exited.
+    Raises RuntimeError if a worker fails or shards are left unfinished (e.g. held by
+    another run's live workers).
+    """
+    from memory import preload
+
+    job = BatchJob(job_dir)
+    started = time.time()
+    detector = preload()
+    try:
+        processes = [multiprocessing.Process(target=_worker, args=(job_dir, detector, batch_size))
+                     for _ in range(workers)]
+        for process in processes:
+            process.start()
+
+        while any(process.is_alive() for process in processes):
+            deadline = time.time() + report_interval
+            for process in processes:
+                process.join(timeout=max(0.0, deadline - time.time()))
+            print(_format_progress(job.progress(since=started)), file=sys.stderr)
+    finally:
+        # preload froze this process's heap for the workers' sake; collect it normally again
+        gc.unfreeze()
+
+    failed = [process.exitcode for process in processes if process.exitcode]
+    if failed:
+        raise RuntimeError(f"{len(failed)} worker(s) exited with errors; rerun to resume")
+    progress = job.progress(since=started)
+    if progress['shards_done'] < progress['shards_total']:
+        raise RuntimeError(f"Only {_format_progress(progress)}; "
+                           "unfinished shards are claimed by live workers of another run")
+    return progress
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    init = commands.add_parser('init', help='split an input file into a new job')
+    init.add_argument('job_dir')
+    init.add_argument('input')
+    init.add_argument('--shard-size', type=int, default=10000)
+    init.add_argument('--text-field', default='text')
+
+    run_parser = commands.add_parser('run', help='score (or resume) a job')
+    run_parser.add_argument('job_dir')
+    run_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    run_parser.add_argument('--batch-size', type=int, default=1000)
+    run_parser.add_argument('--report-interval', type=float, default=5.0)
+
+    status = commands.add_parser('status', help='show job progress')
+    status.add_argument('job_dir')
+
+    args = parser.parse_args(argv)
+    if args.command == 'init':
+        job = BatchJob.create(args.job_dir, args.input, args.shard_size, args.text_field)
+        print(f"Created {job.manifest['num_shards']} shards "
+              f"({job.manifest['num_records']} records) in {args.job_dir}")
+    elif args.command == 'run':
+        print(_format_progress(run(args.job_dir, args.workers, args.batch_size, args.report_interval)))
+    else:
+        print(_format_progress(BatchJob(args.job_dir).progress()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
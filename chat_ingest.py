@@ -0,0 +1,464 @@
+"""
+Streaming ingestion of chat exports.
+
+Evidence usually arrives as a whole chat export rather than one paragraph. The
+readers here turn WhatsApp ``.txt`` (or ``.zip``) exports, Telegram Desktop JSON
+exports and mbox mailboxes into ChatMessage records one at a time; messages are
+scored through HarassmentDetector in batches and folded into a per-sender,
+per-day severity timeline. Nothing holds more than one batch of messages, so
+memory stays flat for exports with hundreds of thousands of messages.
+
+Usage:
+    python chat_ingest.py chat.txt|chat.zip|result.json|mail.mbox [--format whatsapp] \\
+        [--dayfirst|--monthfirst] [--batch-size 1000] [--csv timeline.csv]
+"""
+
+import argparse
+import csv
+import email
+import email.errors
+import email.header
+import email.utils
+import html
+import io
+import itertools
+import json
+import os
+import re
+import sys
+import zipfile
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import IO, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from batch_rules import SEVERITY_LEVELS
+from detector import HarassmentDetector
+
+Source = Union[str, os.PathLike, IO]
+
+
+class ChatMessage(NamedTuple):
+    """One message of an export."""
+    timestamp: Optional[datetime]
+    sender: str
+    text: str
+
+
+@contextmanager
+def _open_text(source: Source):
+    """Text stream over a path or an open (text or binary) file, e.g. a Streamlit upload."""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, encoding='utf-8-sig', errors='replace') as f:
+            yield f
+    elif isinstance(source, io.TextIOBase):
+        yield source
+    else:
+        wrapper = io.TextIOWrapper(source, encoding='utf-8-sig', errors='replace')
+        try:
+            yield wrapper
+        finally:
+            # Leave the caller's file open
+            wrapper.detach()
+
+
+@contextmanager
+def _open_binary(source: Source):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            yield f
+    else:
+        yield source
+
+
+def _source_name(source: Source) -> str:
+    if isinstance(source, (str, os.PathLike)):
+        return os.fspath(source)
+    return getattr(source, 'name', '') or ''
+
+
+# WhatsApp -----------------------------------------------------------------
+
+# "31/12/20, 9:15 pm - Name: text" (Android) and "[31.12.20, 21:15:03] Name: text" (iOS)
+_WHATSAPP_LINE = re.compile(
+    r"^\[?(\d{1,4})[/.\-](\d{1,2})[/.\-](\d{1,4}),?\s+(\d{1,2})[:.](\d{2})(?:[:.](\d{2}))?"
+    r"(?:\s*([ap])\.?\s?m\.?)?\]?(?:\s+-)?\s+(.*)$",
+    re.IGNORECASE
+)
+# Direction marks WhatsApp puts around names and attachments, and a byte order mark
+_WHATSAPP_MARKS = str.maketrans('', '', '‎‏‪‬\ufeff')
+_WHATSAPP_PLACEHOLDER = re.compile(
+    r"^<?(?:media omitted|(?:image|video|audio|sticker|gif|document) omitted|attached: .*"
+    r"|this message was deleted|you deleted this message|null)>?$",
+    re.IGNORECASE
+)
+
+
+def _whatsapp_timestamp(match, dayfirst: bool) -> Optional[datetime]:
+    first, second, third, hour, minute, seconds, meridiem = match.groups()[:7]
+    if len(first) == 4:
+        year, month, day = int(first), int(second), int(third)
+    else:
+        day, month, year = int(first), int(second), int(third)
+        if not dayfirst:
+            day, month = month, day
+        # The export's date order follows the phone's locale; an impossible month means the other order
+        if month > 12 >= day:
+            day, month = month, day
+        if year < 100:
+            year += 2000
+    hour = int(hour)
+    if meridiem:
+        hour = hour % 12 + (12 if meridiem.lower() == 'p' else 0)
+    try:
+        return datetime(year, month, day, hour, int(minute), int(seconds or 0))
+    except ValueError:
+        return None
+
+
+def _whatsapp_lines(source: Source) -> Iterator[str]:
+    """Lines of a chat export, reading the chat text file from inside a .zip export."""
+    if _source_name(source).endswith('.zip'):
+        with zipfile.ZipFile(source) as archive:
+            chats = [name for name in archive.namelist() if name.endswith('.txt')]
+            if not chats:
+                raise ValueError(f"No chat .txt file in {_source_name(source)}")
+            chats.sort(key=lambda name: not os.path.basename(name).startswith('_chat'))
+            with archive.open(chats[0]) as member, _open_text(member) as f:
+                yield from f
+    else:
+        with _open_text(source) as f:
+            yield from f
+
+
+def read_whatsapp(source: Source, dayfirst: bool = True) -> Iterator[ChatMessage]:
+    """
+    Messages of a WhatsApp "Export chat" file. Lines without a timestamp continue
+    the previous message; system notices and media placeholders are skipped.
+    Dates are read day first unless ``dayfirst`` is False.
+    """
+    current = None
+    for line in _whatsapp_lines(source):
+        line = line.rstrip('\r\n').translate(_WHATSAPP_MARKS)
+        match = _WHATSAPP_LINE.match(line)
+        if match is None:
+            if current is not None:
+                current[2].append(line)
+            continue
+        if current is not None and not _WHATSAPP_PLACEHOLDER.match(current[2][0]):
+            yield ChatMessage(current[0], current[1], '\n'.join(current[2]))
+        sender, separator, text = match.group(8).partition(': ')
+        # Notices ("Messages and calls are end-to-end encrypted", "X added Y") have no sender
+        current = (_whatsapp_timestamp(match, dayfirst), sender.strip(), [text]) if separator else None
+    if current is not None and not _WHATSAPP_PLACEHOLDER.match(current[2][0]):
+        yield ChatMessage(current[0], current[1], '\n'.join(current[2]))
+
+
+# Telegram -----------------------------------------------------------------
+
+def _json_array_items(f: IO[str], key: str, chunk_size: int = 1 << 16) -> Iterator:
+    """
+    Items of every ``"key": [...]`` array in a JSON stream, decoded one at a time
+    with JSONDecoder.raw_decode so only the unread part of the current chunk is buffered.
+    """
+    decoder = json.JSONDecoder()
+    opening = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    separators = re.compile(r'[\s,]*')
+    buffer, pos, eof, in_array = '', 0, False, False
+    while True:
+        if not in_array:
+            match = opening.search(buffer, pos)
+            if match:
+                pos, in_array = match.end(), True
+                continue
+            if eof:
+                return
+            # Keep enough of the tail to catch an opening split across chunks
+            pos = max(pos, len(buffer) - len(key) - 64)
+        else:
+            pos = separators.match(buffer, pos).end()
+            if pos < len(buffer):
+                if buffer[pos] == ']':
+                    pos, in_array = pos + 1, False
+                    continue
+                try:
+                    item, pos = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                else:
+                    yield item
+                    continue
+            elif eof:
+                raise ValueError(f"Unterminated {key!r} array")
+        chunk = f.read(chunk_size)
+        buffer, pos = buffer[pos:] + chunk, 0
+        eof = not chunk
+
+
+def _telegram_text(text) -> str:
+    """Telegram stores formatted text as a list of strings and {"type", "text"} entities."""
+    if isinstance(text, str):
+        return text
+    return ''.join(part if isinstance(part, str) else part.get('text', '') for part in text)
+
+
+def read_telegram(source: Source) -> Iterator[ChatMessage]:
+    """
+    Messages of a Telegram Desktop JSON export (a single chat's result.json, or a
+    full export with every chat). Service messages and media without a caption are skipped.
+    """
+    with _open_text(source) as f:
+        for message in _json_array_items(f, 'messages'):
+            if not isinstance(message, dict) or message.get('type', 'message') != 'message':
+                continue
+            text = _telegram_text(message.get('text', ''))
+            if not text.strip():
+                continue
+            try:
+                timestamp = datetime.fromisoformat(message['date'])
+            except (KeyError, TypeError, ValueError):
+                timestamp = None
+            sender = message.get('from') or message.get('from_id') or ''
+            yield ChatMessage(timestamp, str(sender), text)
+
+
+# mbox ---------------------------------------------------------------------
+
+_MBOXRD_ESCAPE = re.compile(rb"^>(>*From )")
+_TAGS = re.compile(r"<[^>]+>")
+
+
+def _header(message, name: str) -> str:
+    """Decoded header value ("=?utf-8?b?...?=" words included), '' if missing."""
+    value = message.get(name)
+    if value is None:
+        return ''
+    try:
+        return str(email.header.make_header(email.header.decode_header(value)))
+    except (LookupError, UnicodeError, email.errors.HeaderParseError):
+        return str(value)
+
+
+def _email_body(message) -> str:
+    """First plain text part (or tag-stripped HTML part) without quoted reply lines."""
+    parts = [part for part in message.walk()
+             if part.get_content_maintype() == 'text' and not part.get_filename()]
+    part = next((part for part in parts if part.get_content_subtype() == 'plain'),
+                next(iter(parts), None))
+    if part is None:
+        return ''
+    payload = part.get_payload(decode=True) or b''
+    try:
+        body = payload.decode(part.get_content_charset() or 'utf-8', errors='replace')
+    except LookupError:
+        body = payload.decode('utf-8', errors='replace')
+    if part.get_content_subtype() == 'html':
+        body = html.unescape(_TAGS.sub(' ', body))
+    return '\n'.join(line for line in body.splitlines() if not line.lstrip().startswith('>'))
+
+
+def _email_message(lines: List[bytes]) -> Optional[ChatMessage]:
+    # The compat32 policy leaves headers as strings; the default policy's header objects cost ~10x more
+    message = email.message_from_bytes(b''.join(lines))
+    try:
+        timestamp = email.utils.parsedate_to_datetime(message['Date']) if message['Date'] else None
+    except (TypeError, ValueError):
+        timestamp = None
+    name, address = email.utils.parseaddr(_header(message, 'From'))
+    text = '\n'.join(part for part in (_header(message, 'Subject'), _email_body(message)) if part.strip())
+    if not text.strip():
+        return None
+    return ChatMessage(timestamp, address.lower() or name, text)
+
+
+def read_mbox(source: Source) -> Iterator[ChatMessage]:
+    """
+    Messages of an mbox file, split on its "From " lines while streaming instead of
+    through mailbox.mbox, which indexes the whole file first. Subject and body form the text.
+    """
+    with _open_binary(source) as f:
+        lines = []
+        previous_blank = True
+        for line in f:
+            if previous_blank and line.startswith(b'From '):
+                if lines:
+                    message = _email_message(lines)
+                    if message is not None:
+                        yield message
+                lines = []
+                previous_blank = False
+                continue
+            lines.append(_MBOXRD_ESCAPE.sub(rb"\1", line))
+            previous_blank = line in (b'\n', b'\r\n')
+        if lines:
+            message = _email_message(lines)
+            if message is not None:
+                yield message
+
+
+# Dispatch and analysis ----------------------------------------------------
+
+READERS = {
+    'whatsapp': read_whatsapp,
+    'telegram': read_telegram,
+    'mbox': read_mbox
+}
+_EXTENSIONS = {'.txt': 'whatsapp', '.zip': 'whatsapp', '.json': 'telegram', '.mbox': 'mbox', '': 'mbox'}
+
+
+def read_export(source: Source, format: Optional[str] = None, **options) -> Iterator[ChatMessage]:
+    """Messages of an export, with the format taken from the file extension unless given."""
+    if format is None:
+        extension = os.path.splitext(_source_name(source))[1].lower()
+        if extension not in _EXTENSIONS:
+            raise ValueError(f"Cannot tell the export format of {_source_name(source)!r}; "
+                             f"pass one of {sorted(READERS)}")
+        format = _EXTENSIONS[extension]
+    return READERS[format](source, **options)
+
+
+def _batches(items: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(items)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def analyze_messages(detector: HarassmentDetector, messages: Iterable[ChatMessage],
+                     batch_size: int = 1000) -> Iterator[Tuple[ChatMessage, Dict]]:
+    """(message, analyze_incident result) pairs, scored batch by batch through analyze_batch."""
+    for batch in _batches(messages, batch_size):
+        yield from zip(batch, detector.analyze_batch([message.text for message in batch]))
+
+
+class SeverityTimeline:
+    """
+    Counts of messages and flagged messages by severity and category for each
+    (day, sender). Memory grows with the number of senders and days, not messages.
+    """
+
+    def __init__(self):
+        self._buckets: Dict[Tuple[Optional[date], str], Dict] = {}
+
+    def add(self, messages: List[ChatMessage], scores: Dict):
+        """Fold in a batch of messages and their score_batch arrays."""
+        for message, flagged, severity, category in zip(
+                messages, scores['is_harassment'], scores['severity'], scores['category']):
+            day = message.timestamp.date() if message.timestamp else None
+            bucket = self._buckets.get((day, message.sender))
+            if bucket is None:
+                bucket = self._buckets[(day, message.sender)] = {
+                    'messages': 0, 'flagged': 0, 'severity': Counter(), 'categories': Counter()
+                }
+            bucket['messages'] += 1
+            if flagged:
+                bucket['flagged'] += 1
+                bucket['severity'][severity] += 1
+                bucket['categories'][category] += 1
+
+    def _row(self, fields: Dict, buckets: List[Dict]) -> Dict:
+        severity = sum((bucket['severity'] for bucket in buckets), Counter())
+        categories = sum((bucket['categories'] for bucket in buckets), Counter())
+        worst = [level for level in SEVERITY_LEVELS if severity[level]]
+        return {
+            **fields,
+            'messages': sum(bucket['messages'] for bucket in buckets),
+            'flagged': sum(bucket['flagged'] for bucket in buckets),
+            **{level: severity[level] for level in SEVERITY_LEVELS},
+            'max_severity': worst[-1] if worst else None,
+            'top_category': categories.most_common(1)[0][0] if categories else None
+        }
+
+    def _grouped(self, key) -> Dict:
+        groups = {}
+        for (day, sender), bucket in self._buckets.items():
+            groups.setdefault(key(day, sender), []).append(bucket)
+        return groups
+
+    def rows(self) -> List[Dict]:
+        """One row per (day, sender), in date order; undated messages come last."""
+        order = sorted(self._buckets, key=lambda k: (k[0] is None, k[0] or date.min, k[1]))
+        return [self._row({'date': day, 'sender': sender}, [self._buckets[(day, sender)]])
+                for day, sender in order]
+
+    def by_sender(self) -> List[Dict]:
+        """Totals per sender with the first and last day they sent a flagged message, most flagged first."""
+        flagged_days = {}
+        for (day, sender), bucket in self._buckets.items():
+            if bucket['flagged'] and day is not None:
+                flagged_days.setdefault(sender, []).append(day)
+        rows = []
+        for sender, buckets in self._grouped(lambda day, sender: sender).items():
+            days = flagged_days.get(sender)
+            rows.append(self._row({
+                'sender': sender,
+                'first_flagged': min(days) if days else None,
+                'last_flagged': max(days) if days else None
+            }, buckets))
+        return sorted(rows, key=lambda row: (-row['flagged'], row['sender']))
+
+    def by_day(self) -> List[Dict]:
+        """Totals per day across senders, in date order."""
+        groups = self._grouped(lambda day, sender: day)
+        order = sorted(groups, key=lambda day: (day is None, day or date.min))
+        return [self._row({'date': day}, groups[day]) for day in order]
+
+
+def build_timeline(detector: HarassmentDetector, messages: Iterable[ChatMessage],
+                   batch_size: int = 1000) -> SeverityTimeline:
+    """Score messages batch by batch with score_batch and fold them into a SeverityTimeline."""
+    timeline = SeverityTimeline()
+    for batch in _batches(messages, batch_size):
+        timeline.add(batch, detector.score_batch([message.text for message in batch]))
+    return timeline
+
+
+def _format_table(rows: List[Dict], columns: List[str]) -> str:
+    cells = [[str(row[column]) if row[column] is not None else '-' for column in columns] for row in rows]
+    widths = [max([len(column)] + [len(cell[i]) for cell in cells]) for i, column in enumerate(columns)]
+    lines = ['  '.join(column.ljust(width) for column, width in zip(columns, widths)).rstrip()]
+    lines.extend('  '.join(cell.ljust(width) for cell, width in zip(cell_row, widths)).rstrip()
+                 for cell_row in cells)
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('export', help='WhatsApp .txt/.zip, Telegram .json or mbox file')
+    parser.add_argument('--format', choices=sorted(READERS), help='default: from the file extension')
+    order = parser.add_mutually_exclusive_group()
+    order.add_argument('--dayfirst', dest='dayfirst', action='store_true', default=True,
+                       help='WhatsApp dates are day/month (default)')
+    order.add_argument('--monthfirst', dest='dayfirst', action='store_false',
+                       help='WhatsApp dates are month/day')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--csv', help='write the per-day, per-sender timeline to this CSV file')
+    args = parser.parse_args(argv)
+
+    format = args.format
+    if format is None:
+        format = _EXTENSIONS.get(os.path.splitext(args.export)[1].lower())
+    options = {'dayfirst': args.dayfirst} if format == 'whatsapp' else {}
+    messages = read_export(args.export, format, **options)
+    timeline = build_timeline(HarassmentDetector(), messages, args.batch_size)
+
+    severity_columns = ['messages', 'flagged'] + SEVERITY_LEVELS + ['max_severity', 'top_category']
+    print(_format_table(timeline.by_sender(), ['sender'] + severity_columns + ['first_flagged', 'last_flagged']))
+    print()
+    print(_format_table([row for row in timeline.by_day() if row['flagged']], ['date'] + severity_columns))
+
+    if args.csv:
+        rows = timeline.rows()
+        with open(args.csv, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['date', 'sender'] + severity_columns)
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"Wrote {len(rows)} rows to {args.csv}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,230 @@
+"""
+Model compaction: vocabulary pruning and quantized Naive Bayes weights.
+
+A fitted pipeline keeps its vocabulary as a dict of Python strings, ``idf_`` as a
+float64 sparse diagonal and ``feature_log_prob_`` as float64. ``compact_model``
+builds a smaller copy: features are pruned by chi² (or by how much they separate
+the classes), the vocabulary becomes a FlatVocabulary (sorted string table),
+idf is stored as float32 and the class log probabilities as float32 or int8
+with a per-class scale and offset. ``compaction_report`` compares size and
+accuracy against the unpruned model.
+
+Usage:
+    python compact_model.py [labelled.csv|labelled.jsonl ...] --keep 0.5 --dtype int8 \\
+        --output harassment_model.compact.pkl
+"""
+
+import argparse
+import copy
+import pickle
+import sys
+from typing import Dict, List, Optional, Sequence, Union
+import numpy as np
+from scipy import sparse
+from scipy.special import logsumexp
+from sklearn.feature_selection import chi2
+from sklearn.pipeline import Pipeline
+
+from detector import HarassmentDetector
+from evaluate import default_examples, evaluate_configuration, load_labelled
+from memory import deep_sizeof
+from preprocess import Document, vectorize_documents
+from vocabulary import FlatVocabulary
+
+COMPACT_MODEL_PATH = 'harassment_model.compact.pkl'
+
+
+class CompactNB:
+    """
+    Inference-only stand-in for a fitted MultinomialNB.
+
+    With ``dtype='int8'`` each class's log probabilities are stored as
+    ``offset + scale * q`` with q in [-127, 127]; the joint log likelihood is
+    computed from the int8 table directly, so no float copy is kept.
+    """
+
+    def __init__(self, classifier, feature_mask: Optional[np.ndarray] = None, dtype: str = 'int8'):
+        log_prob = classifier.feature_log_prob_
+        if feature_mask is not None:
+            # Renormalize so each class's distribution sums to one over the kept features
+            log_prob = log_prob[:, feature_mask]
+            log_prob = log_prob - logsumexp(log_prob, axis=1, keepdims=True)
+        self.classes_ = classifier.classes_
+        self.class_log_prior_ = classifier.class_log_prior_.astype(np.float32)
+        self.dtype = dtype
+        if dtype == 'int8':
+            low, high = log_prob.min(axis=1), log_prob.max(axis=1)
+            self._offset = ((high + low) / 2).astype(np.float32)
+            self._scale = np.maximum((high - low) / 254, np.finfo(np.float32).tiny).astype(np.float32)
+            quantized = np.round((log_prob - self._offset[:, None]) / self._scale[:, None])
+            self._values = np.clip(quantized, -127, 127).astype(np.int8)
+        elif dtype == 'float32':
+            self._offset = self._scale = None
+            self._values = log_prob.astype(np.float32)
+        else:
+            raise ValueError(f"Unsupported dtype {dtype!r}; use 'int8' or 'float32'")
+
+    @property
+    def feature_log_prob_(self) -> np.ndarray:
+        """Dequantized log probabilities (classes x features), for explanations."""
+        if self._scale is None:
+            return self._values
+        return self._offset[:, None] + self._scale[:, None] * self._values
+
+    def _joint_log_likelihood(self, X) -> np.ndarray:
+        X = sparse.csr_matrix(X)
+        jll = np.asarray(X @ self._values.T, dtype=np.float64)
+        if self._scale is not None:
+            jll = jll * self._scale + np.asarray(X.sum(axis=1)) * self._offset
+        return jll + self.class_log_prior_
+
+    def predict_proba(self, X) -> np.ndarray:
+        jll = self._joint_log_likelihood(X)
+        return np.exp(jll - logsumexp(jll, axis=1, keepdims=True))
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_[self._joint_log_likelihood(X).argmax(axis=1)]
+
+
+def feature_scores(model: Pipeline, texts: Sequence[str], labels: Sequence[str],
+                   method: str = 'chi2') -> np.ndarray:
+    """
+    Relevance of every feature: chi² of its TF-IDF values against ``labels``, or
+    (``method='contribution'``) the spread of its class log probabilities.
+    """
+    if method == 'chi2':
+        X = vectorize_documents(model.named_steps['tfidf'], [Document(text) for text in texts])
+        scores, _ = chi2(X, labels)
+        return np.nan_to_num(scores)
+    if method == 'contribution':
+        log_prob = model.named_steps['classifier'].feature_log_prob_
+        return log_prob.max(axis=0) - log_prob.min(axis=0)
+    raise ValueError(f"Unknown pruning method {method!r}")
+
+
+def compact_model(model: Pipeline, texts: Sequence[str], labels: Sequence[str],
+                  keep: Union[int, float] = 0.5, method: str = 'chi2', dtype: str = 'int8') -> Pipeline:
+    """
+    Pruned, quantized copy of a fitted TF-IDF + MultinomialNB pipeline.
+    ``keep`` is a number of features or a fraction of the vocabulary.
+    """
+    vectorizer = model.named_steps['tfidf']
+    n_features = len(vectorizer.vocabulary_)
+    n_keep = int(round(keep * n_features)) if isinstance(keep, float) else int(keep)
+    n_keep = max(1, min(n_features, n_keep))
+
+    scores = feature_scores(model, texts, labels, method)
+    kept = np.sort(np.argsort(-scores, kind='stable')[:n_keep])
+    mask = np.zeros(n_features, dtype=bool)
+    mask[kept] = True
+
+    # Old feature index -> new contiguous index
+    new_index = np.full(n_features, -1, dtype=np.int64)
+    new_index[kept] = np.arange(n_keep)
+    vocabulary = {term: int(new_index[index]) for term, index in vectorizer.vocabulary_.items()
+                  if mask[index]}
+
+    compact_vectorizer = copy.copy(vectorizer)
+    compact_vectorizer.stop_words_ = None
+    if getattr(vectorizer, 'use_idf', False):
+        idf = vectorizer.idf_[kept].astype(np.float32)
+        compact_vectorizer._tfidf = copy.copy(vectorizer._tfidf)
+        # The idf_ setter would widen to float64; the diagonal is only used by sklearn's transform
+        compact_vectorizer._tfidf._idf_diag = sparse.diags(idf, format='csr')
+        # Keep the pipeline's own transform (and predict on raw text) working after pruning
+        compact_vectorizer._tfidf.n_features_in_ = n_keep
+    else:
+        idf = None
+    compact_vectorizer.vocabulary_ = FlatVocabulary(vocabulary, idf)
+
+    return Pipeline([
+        ('tfidf', compact_vectorizer),
+        ('classifier', CompactNB(model.named_steps['classifier'], mask, dtype))
+    ])
+
+
+def model_size(model: Pipeline) -> Dict[str, int]:
+    """Pickled size and in-memory size of the parts that grow with the vocabulary, in bytes."""
+    vectorizer = model.named_steps['tfidf']
+    classifier = model.named_steps['classifier']
+    idf = getattr(getattr(vectorizer, '_tfidf', None), '_idf_diag', None)
+    return {
+        'features': len(vectorizer.vocabulary_),
+        'pickle': len(pickle.dumps(model)),
+        'vocabulary': deep_sizeof(vectorizer.vocabulary_),
+        'stop_words': deep_sizeof(getattr(vectorizer, 'stop_words_', None)),
+        'idf': 0 if idf is None else idf.data.nbytes + idf.indices.nbytes + idf.indptr.nbytes,
+        'feature_log_prob': (classifier._values.nbytes if isinstance(classifier, CompactNB)
+                             else classifier.feature_log_prob_.nbytes)
+    }
+
+
+def use_model(detector: HarassmentDetector, model: Pipeline) -> HarassmentDetector:
+    """Swap a detector's pipeline, e.g. for one loaded from COMPACT_MODEL_PATH."""
+    detector.model = model
+    detector._ml_explain_tables = None
+    return detector
+
+
+def compaction_report(original: Pipeline, compact: Pipeline, examples: List[Dict]) -> Dict:
+    """
+    Sizes of both models and their ml-only and hybrid accuracy on ``examples``
+    (evaluated with evaluate.evaluate_configuration), plus how often their ML predictions agree.
+    """
+    detector = HarassmentDetector()
+    report = {'original': model_size(original), 'compact': model_size(compact)}
+    predictions = {}
+    for name, model in (('original', original), ('compact', compact)):
+        use_model(detector, model)
+        for configuration in ('ml-only', 'hybrid'):
+            evaluation = evaluate_configuration(detector, configuration, examples, latency_samples=0)
+            report[name][f"{configuration} accuracy"] = evaluation['accuracy']
+        documents = [Document(example['text']) for example in examples]
+        predictions[name], _, _ = detector._ml_classify_batch(documents, explain=False)
+    report['prediction_agreement'] = float(np.mean(predictions['original'] == predictions['compact']))
+    return report
+
+
+def format_report(report: Dict) -> str:
+    lines = [f"{'':<24}{'original':>14}{'compact':>14}{'change':>10}"]
+    for key, original in report['original'].items():
+        compact = report['compact'][key]
+        if key.endswith('accuracy'):
+            lines.append(f"{key:<24}{original:>14.3f}{compact:>14.3f}{compact - original:>+10.3f}")
+        else:
+            change = f"{compact / original - 1:+.0%}" if original else 'n/a'
+            lines.append(f"{key:<24}{original:>14,}{compact:>14,}{change:>10}")
+    lines.append(f"{'prediction agreement':<24}{report['prediction_agreement']:>28.3f}")
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('files', nargs='*', help='labelled CSV or JSON lines files (default: training data)')
+    parser.add_argument('--keep', type=float, default=0.5,
+                        help='features to keep: a fraction (<= 1) or a count')
+    parser.add_argument('--method', choices=['chi2', 'contribution'], default='chi2')
+    parser.add_argument('--dtype', choices=['int8', 'float32'], default='int8')
+    parser.add_argument('--output', default=COMPACT_MODEL_PATH)
+    args = parser.parse_args(argv)
+
+    examples = default_examples()
+    for path in args.files:
+        examples.extend(load_labelled(path))
+
+    original = HarassmentDetector().model
+    keep = args.keep if args.keep <= 1 else int(args.keep)
+    compact = compact_model(original, [e['text'] for e in examples], [e['category'] for e in examples],
+                            keep, args.method, args.dtype)
+    print(format_report(compaction_report(original, compact, examples)))
+
+    with open(args.output, 'wb') as f:
+        pickle.dump(compact, f)
+    print(f"Wrote {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    # Run through the importable module so the pickle refers to compact_model.CompactNB
+    import compact_model
+    sys.exit(compact_model.main())
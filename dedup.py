@@ -0,0 +1,203 @@
+"""
+Near-duplicate detection for bulk ingestion.
+
+Copy-pasted reports and coordinated campaigns produce many near-identical texts.
+A MinHash/LSH index groups them into clusters so analyze_incident runs once per
+cluster representative; every member gets the representative's result plus its
+cluster id, which doubles as a campaign signal.
+"""
+
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import numpy as np
+
+from preprocess import Document, as_document
+
+# Mersenne prime for the universal hash family; a * x stays below 2**62 for 31-bit x
+_PRIME = np.uint64((1 << 31) - 1)
+# Shingles permuted at once: a num_perm x _HASH_CHUNK uint64 block (4 MB for 128 permutations)
+_HASH_CHUNK = 4096
+
+
+def _choose_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """Pick (bands, rows) whose LSH threshold (1/b)^(1/r) is closest to ``threshold``."""
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        distance = abs((1.0 / bands) ** (1.0 / rows) - threshold)
+        if best is None or distance < best[0]:
+            best = (distance, bands, rows)
+    return best[1], best[2]
+
+
+class MinHasher:
+    """MinHash signatures over word shingles of a Document."""
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 3, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, int(_PRIME), size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, int(_PRIME), size=num_perm).astype(np.uint64)
+
+    def shingles(self, document: Document) -> List[str]:
+        tokens = document.tokens
+        n = self.shingle_size
+        if len(tokens) <= n:
+            return [' '.join(tokens)]
+        return [' '.join(tokens[i:i + n]) for i in range(len(tokens) - n + 1)]
+
+    def signature(self, document: Document) -> np.ndarray:
+        return self.signatures([document])[0]
+
+    def signatures(self, documents: List[Document]) -> np.ndarray:
+        """
+        Signatures of a batch as one (documents x num_perm) array. Shingles are hashed in
+        one pass and permuted ``_HASH_CHUNK`` at a time, so memory does not grow with the batch.
+        """
+        shingle_sets = [set(self.shingles(document)) for document in documents]
+        counts = np.fromiter((len(shingles) for shingles in shingle_sets), dtype=np.int64,
+                             count=len(shingle_sets))
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode('utf-8')) for shingles in shingle_sets for shingle in shingles),
+            dtype=np.uint64, count=int(counts.sum())
+        ) % _PRIME
+        # Every document has at least one shingle, so each owns a non-empty run of ``hashes``
+        doc_ids = np.repeat(np.arange(len(documents)), counts)
+        minima = np.full((len(documents), self.num_perm), _PRIME, dtype=np.uint64)
+        for start in range(0, len(hashes), _HASH_CHUNK):
+            chunk_docs = doc_ids[start:start + _HASH_CHUNK]
+            permuted = (self._a[:, None] * hashes[None, start:start + _HASH_CHUNK] + self._b[:, None]) % _PRIME
+            runs = np.flatnonzero(np.r_[True, chunk_docs[1:] != chunk_docs[:-1]])
+            run_docs = chunk_docs[runs]
+            minima[run_docs] = np.minimum(minima[run_docs], np.minimum.reduceat(permuted, runs, axis=1).T)
+        return minima.astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    """
+    Streaming MinHash/LSH index that assigns each document to a cluster.
+
+    A document joins an existing cluster when its estimated Jaccard similarity to
+    the cluster representative is at least ``threshold``. At most ``max_clusters``
+    clusters are kept; the least recently matched ones are evicted, so memory stays
+    bounded when streaming.
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128,
+                 max_clusters: int = 100000, shingle_size: int = 3, seed: int = 1):
+        self.threshold = threshold
+        self.max_clusters = max_clusters
+        self.hasher = MinHasher(num_perm=num_perm, shingle_size=shingle_size, seed=seed)
+        self.bands, self.rows = _choose_bands(num_perm, threshold)
+        self._buckets = {}              # (band, band bytes) -> cluster id
+        self._clusters = OrderedDict()  # cluster id -> cluster record, least recently used first
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return len(self._clusters)
+
+    def _band_keys(self, signature: np.ndarray) -> List[Tuple[int, bytes]]:
+        rows = self.rows
+        return [(band, signature[band * rows:(band + 1) * rows].tobytes())
+                for band in range(self.bands)]
+
+    def assign(self, text: Union[str, Document],
+               signature: Optional[np.ndarray] = None) -> Tuple[int, bool]:
+        """
+        Place ``text`` in a cluster.
+        Returns (cluster_id, is_new) where is_new means the text is the cluster representative.
+        """
+        if signature is None:
+            signature = self.hasher.signature(as_document(text))
+        band_keys = self._band_keys(signature)
+
+        best_id, best_similarity = None, -1.0
+        for cluster_id in {self._buckets.get(key) for key in band_keys} - {None}:
+            similarity = float(np.mean(self._clusters[cluster_id]['signature'] == signature))
+            if similarity > best_similarity:
+                best_id, best_similarity = cluster_id, similarity
+
+        if best_id is not None and best_similarity >= self.threshold:
+            cluster = self._clusters[best_id]
+            cluster['size'] += 1
+            self._clusters.move_to_end(best_id)
+            return best_id, False
+
+        cluster_id = self._next_id
+        self._next_id += 1
+        self._clusters[cluster_id] = {
+            'signature': signature, 'band_keys': band_keys, 'size': 1, 'result': None
+        }
+        for key in band_keys:
+            self._buckets.setdefault(key, cluster_id)
+        if len(self._clusters) > self.max_clusters:
+            self._evict()
+        return cluster_id, True
+
+    def _evict(self):
+        cluster_id, cluster = self._clusters.popitem(last=False)
+        for key in cluster['band_keys']:
+            if self._buckets.get(key) == cluster_id:
+                del self._buckets[key]
+
+    def cluster_size(self, cluster_id: int) -> int:
+        """Number of documents assigned to a cluster so far (0 once evicted)."""
+        cluster = self._clusters.get(cluster_id)
+        return cluster['size'] if cluster else 0
+
+    def get_result(self, cluster_id: int) -> Optional[Dict]:
+        cluster = self._clusters.get(cluster_id)
+        return cluster['result'] if cluster else None
+
+    def set_result(self, cluster_id: int, result: Dict):
+        cluster = self._clusters.get(cluster_id)
+        if cluster is not None:
+            cluster['result'] = result
+
+
+def analyze_deduplicated(detector, texts: Iterable[Union[str, Document]],
+                         index: Optional[NearDuplicateIndex] = None,
+                         batch_size: int = 1000) -> Iterator[Dict]:
+    """
+    Analyze a stream of texts, running the detector once per near-duplicate cluster.
+
+    Each yielded result is the cluster representative's analysis with ``cluster_id``,
+    ``cluster_size`` (members seen so far) and ``is_duplicate`` added.
+    """
+    if index is None:
+        index = NearDuplicateIndex()
+    batch = []
+    for text in texts:
+        batch.append(as_document(text))
+        if len(batch) >= batch_size:
+            yield from _analyze_deduplicated_batch(detector, batch, index)
+            batch = []
+    if batch:
+        yield from _analyze_deduplicated_batch(detector, batch, index)
+
+
+def _analyze_deduplicated_batch(detector, documents: List[Document],
+                                index: NearDuplicateIndex) -> Iterator[Dict]:
+    signatures = index.hasher.signatures(documents)
+    assignments = [index.assign(document, signature)
+                   for document, signature in zip(documents, signatures)]
+
+    # Representatives of new clusters (and of clusters whose result was lost) are analyzed together
+    pending = {}
+    for document, (cluster_id, _) in zip(documents, assignments):
+        if cluster_id not in pending and index.get_result(cluster_id) is None:
+            pending[cluster_id] = document
+    results = dict(zip(pending, detector.analyze_batch(list(pending.values()))))
+    for cluster_id, result in results.items():
+        index.set_result(cluster_id, result)
+
+    for document, (cluster_id, _) in zip(documents, assignments):
+        result = results.get(cluster_id) or index.get_result(cluster_id)
+        yield dict(
+            result,
+            cluster_id=cluster_id,
+            cluster_size=index.cluster_size(cluster_id),
+            is_duplicate=pending.get(cluster_id) is not document
+        )
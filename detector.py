@@ -1,5 +1,5 @@
 import re
-from typing import Dict, List, Tuple
+from typing import Callable, Dict, List, Optional, Tuple, Union
 import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.naive_bayes import MultinomialNB
@@ -7,12 +7,87 @@ from sklearn.pipeline import Pipeline
 import pickle
 import os
 
+from batch_rules import SEVERITY_LEVELS, BatchRuleEngine
+from ensemble import ENSEMBLE_MODEL_PATH, train_ensemble
+from fuzzy_match import FuzzyMatcher
+from preprocess import Document, analyze_document, as_document, vectorize_documents
+
+# Training data with diverse examples (also used as the default evaluation set)
+TRAINING_DATA = [
+    # Sexual harassment
+    ("My boss keeps making sexual comments about my body", "sexual"),
+    ("A colleague sent me explicit photos without my consent", "sexual"),
+    ("Someone touched me inappropriately at work", "sexual"),
+    ("They keep asking me out despite me saying no multiple times", "sexual"),
+    
+    # Threats
+    ("They said they will hurt me if I don't comply", "threat"),
+    ("I received messages saying they know where I live and will come after me", "threat"),
+    ("Someone threatened to leak my private photos", "threat"),
+    ("They warned me there will be consequences if I speak up", "threat"),
+    
+    # Verbal harassment
+    ("My colleague constantly calls me derogatory names", "verbal"),
+    ("They yell at me and insult me in front of others", "verbal"),
+    ("Someone keeps making racist comments towards me", "verbal"),
+    
+    # Physical harassment
+    ("A person pushed me against the wall", "physical"),
+    ("Someone keeps blocking my path and cornering me", "physical"),
+    ("They grabbed my arm forcefully when I tried to leave", "physical"),
+    
+    # Cyber harassment
+    ("Someone created a fake profile pretending to be me", "cyber"),
+    ("I'm receiving hundreds of hateful messages online", "cyber"),
+    ("My private information was posted online without permission", "cyber"),
+    
+    # Stalking
+    ("Someone has been following me for weeks", "stalking"),
+    ("They show up everywhere I go despite me asking them to stop", "stalking"),
+    ("I keep finding them outside my house", "stalking"),
+    
+    # Workplace harassment
+    ("My manager treats me unfairly because of my gender", "workplace"),
+    ("I was passed over for promotion after rejecting advances", "workplace"),
+    ("The environment at work is hostile and discriminatory", "workplace"),
+    
+    # Non-harassment (important for reducing false positives)
+    ("My colleague and I had a disagreement about a project", "non-harassment"),
+    ("I felt uncomfortable when someone gave constructive criticism", "non-harassment"),
+    ("There was a misunderstanding with my friend", "non-harassment"),
+    ("I'm stressed about work deadlines", "non-harassment"),
+    ("Someone accidentally bumped into me", "non-harassment"),
+    ("I had an argument with my partner about household chores", "non-harassment"),
+    ("My neighbor plays loud music sometimes", "non-harassment"),
+    ("I received a rejection email from a job application", "non-harassment"),
+    ("Someone disagreed with my opinion in a meeting", "non-harassment"),
+    ("I feel anxious about an upcoming presentation", "non-harassment"),
+]
+
+# Category keys mapped to display format
+CATEGORY_DISPLAY = {
+    'sexual': 'Sexual Harassment',
+    'threat': 'Threats/Intimidation',
+    'verbal': 'Verbal Harassment',
+    'physical': 'Physical Harassment',
+    'cyber': 'Cyber Harassment',
+    'stalking': 'Stalking',
+    'workplace': 'Workplace Harassment',
+    'non-harassment': 'Non-Harassment'
+}
+
+
 class HarassmentDetector:
     """
     Hybrid harassment detection system combining rule-based and ML approaches.
     Prioritizes harmful intent, bad words, threats, sexual content, and repetition.
     """
     
+    ANALYSIS_STAGES = ('normalize', 'rules', 'ml', 'combine')
+    
+    # Set by profiling.install(); analyze_incident routes through it when present
+    profiler = None
+    
     def __init__(self):
         # Load or create ML model
         self.model = self._load_or_create_model()
@@ -86,6 +161,22 @@ class HarassmentDetector:
             (r'\b(without\s+(consent|permission|asking))', 'no_consent'),
             (r'\b(keeps?|keep|constantly|repeatedly|won\'t stop|multiple times)', 'repetition_detected'),
         ]
+        
+        # Built lazily by batch_rule_engine
+        self._batch_rule_engine = None
+        
+        # Obfuscated spellings ("b1tch", "k i l l you") also count, with a discounted weight
+        self.fuzzy_matching = True
+        self._fuzzy_matcher = None
+        
+        # Number of contributing n-grams reported with each ML prediction
+        self.ml_top_k = 5
+        self._ml_explain_tables = None
+        
+        # Opt-in: classify with NB + logistic regression + linear SVM sharing one
+        # vectorization (see ensemble.py), built on first use
+        self.ensemble = False
+        self._ensemble_model = None
     
     def _load_or_create_model(self):
         """Load pre-trained model or create a new one with training data."""
@@ -100,64 +191,13 @@ class HarassmentDetector:
     
     def _train_model(self):
         """Train ML model with sample data."""
-        # Training data with diverse examples
-        training_data = [
-            # Sexual harassment
-            ("My boss keeps making sexual comments about my body", "sexual"),
-            ("A colleague sent me explicit photos without my consent", "sexual"),
-            ("Someone touched me inappropriately at work", "sexual"),
-            ("They keep asking me out despite me saying no multiple times", "sexual"),
-            
-            # Threats
-            ("They said they will hurt me if I don't comply", "threat"),
-            ("I received messages saying they know where I live and will come after me", "threat"),
-            ("Someone threatened to leak my private photos", "threat"),
-            ("They warned me there will be consequences if I speak up", "threat"),
-            
-            # Verbal harassment
-            ("My colleague constantly calls me derogatory names", "verbal"),
-            ("They yell at me and insult me in front of others", "verbal"),
-            ("Someone keeps making racist comments towards me", "verbal"),
-            
-            # Physical harassment
-            ("A person pushed me against the wall", "physical"),
-            ("Someone keeps blocking my path and cornering me", "physical"),
-            ("They grabbed my arm forcefully when I tried to leave", "physical"),
-            
-            # Cyber harassment
-            ("Someone created a fake profile pretending to be me", "cyber"),
-            ("I'm receiving hundreds of hateful messages online", "cyber"),
-            ("My private information was posted online without permission", "cyber"),
-            
-            # Stalking
-            ("Someone has been following me for weeks", "stalking"),
-            ("They show up everywhere I go despite me asking them to stop", "stalking"),
-            ("I keep finding them outside my house", "stalking"),
-            
-            # Workplace harassment
-            ("My manager treats me unfairly because of my gender", "workplace"),
-            ("I was passed over for promotion after rejecting advances", "workplace"),
-            ("The environment at work is hostile and discriminatory", "workplace"),
-            
-            # Non-harassment (important for reducing false positives)
-            ("My colleague and I had a disagreement about a project", "non-harassment"),
-            ("I felt uncomfortable when someone gave constructive criticism", "non-harassment"),
-            ("There was a misunderstanding with my friend", "non-harassment"),
-            ("I'm stressed about work deadlines", "non-harassment"),
-            ("Someone accidentally bumped into me", "non-harassment"),
-            ("I had an argument with my partner about household chores", "non-harassment"),
-            ("My neighbor plays loud music sometimes", "non-harassment"),
-            ("I received a rejection email from a job application", "non-harassment"),
-            ("Someone disagreed with my opinion in a meeting", "non-harassment"),
-            ("I feel anxious about an upcoming presentation", "non-harassment"),
-        ]
-        
-        texts = [item[0] for item in training_data]
-        labels = [item[1] for item in training_data]
+        texts = [item[0] for item in TRAINING_DATA]
+        labels = [item[1] for item in TRAINING_DATA]
         
         # Create pipeline with TF-IDF and Naive Bayes
+        # (the analyzer reads the unigrams and bigrams cached on each Document)
         model = Pipeline([
-            ('tfidf', TfidfVectorizer(max_features=1000, ngram_range=(1, 2))),
+            ('tfidf', TfidfVectorizer(max_features=1000, analyzer=analyze_document)),
             ('classifier', MultinomialNB())
         ])
         
@@ -169,17 +209,50 @@ class HarassmentDetector:
         
         return model
     
-    def _rule_based_check(self, text: str) -> Dict:
+    def _load_or_create_ensemble(self):
+        """Load the ensemble for the current vectorizer, or train and save a new one."""
+        if os.path.exists(ENSEMBLE_MODEL_PATH):
+            with open(ENSEMBLE_MODEL_PATH, 'rb') as f:
+                ensemble = pickle.load(f)
+            if ensemble.matches(self.model):
+                return ensemble
+        
+        texts = [item[0] for item in TRAINING_DATA]
+        labels = [item[1] for item in TRAINING_DATA]
+        ensemble = train_ensemble(self.model, texts, labels)
+        
+        with open(ENSEMBLE_MODEL_PATH, 'wb') as f:
+            pickle.dump(ensemble, f)
+        
+        return ensemble
+    
+    @property
+    def ml_model(self) -> Pipeline:
+        """The pipeline the ML stage uses: ``model``, or its vectorizer feeding the ensemble."""
+        if not self.ensemble:
+            return self.model
+        vectorizer = self.model.named_steps['tfidf']
+        if self._ensemble_model is None or self._ensemble_model.named_steps['tfidf'] is not vectorizer:
+            self._ensemble_model = Pipeline([
+                ('tfidf', vectorizer),
+                ('classifier', self._load_or_create_ensemble())
+            ])
+        return self._ensemble_model
+    
+    def _rule_based_check(self, text: Union[str, Document]) -> Dict:
         """
         Rule-based keyword matching with severity scoring.
         Returns category, severity, and matched keywords.
         """
-        text_lower = text.lower()
+        document = as_document(text)
+        text_lower = document.lower
         
         category_scores = {}
         matched_keywords = []
         max_severity = 'Low'
         
+        fuzzy_matches = self.fuzzy_matcher.find(document) if self.fuzzy_matching else []
+        
         for category, severity_dict in self.keywords.items():
             score = 0
             for severity, keywords in severity_dict.items():
@@ -198,6 +271,14 @@ class HarassmentDetector:
                         else:
                             score += 2
             
+            for match in fuzzy_matches:
+                if match.category == category:
+                    score += match.weight
+                    if match.severity == 'high' and max_severity not in ['Critical', 'High']:
+                        max_severity = 'High'
+                    elif match.severity == 'medium' and max_severity == 'Low':
+                        max_severity = 'Medium'
+            
             if score > 0:
                 category_scores[category] = score
         
@@ -213,6 +294,8 @@ class HarassmentDetector:
                     elif max_severity == 'Low':
                         max_severity = 'Medium'
         
+        matched_keywords.extend(match.label for match in fuzzy_matches)
+        
         # Determine primary category
         primary_category = max(category_scores, key=category_scores.get) if category_scores else None
         
@@ -226,31 +309,231 @@ class HarassmentDetector:
             'score': sum(category_scores.values()),
             'matched_keywords': matched_keywords,
             'intent_matches': intent_matches,
-            'category_scores': category_scores
+            'category_scores': category_scores,
+            'fuzzy_matches': [match.as_dict() for match in fuzzy_matches]
         }
     
-    def _ml_classify(self, text: str) -> Tuple[str, float]:
+    def _ml_classify(self, text: Union[str, Document]) -> Tuple[str, float, List[Tuple[str, float]]]:
         """
         ML-based classification.
-        Returns predicted category and confidence score.
+        Returns predicted category, confidence score and the n-grams that contributed
+        most to the prediction.
         """
         try:
-            prediction = self.model.predict([text])[0]
-            probabilities = self.model.predict_proba([text])[0]
-            confidence = max(probabilities)
-            return prediction, confidence
+            # Vectorize once; the prediction is the most probable class, as in predict
+            model = self.ml_model
+            features = as_document(text).vector(model.named_steps['tfidf'])
+            classifier = model.named_steps['classifier']
+            probabilities = classifier.predict_proba(features)[0]
+            class_index = probabilities.argmax()
+            prediction = classifier.classes_[class_index]
+            confidence = probabilities.max()
+            contributions = self._ml_contributions(features.indices, features.data, class_index)
+            return prediction, confidence, contributions
+        except:
+            return "non-harassment", 0.5, []
+    
+    def _ml_classify_batch(self, documents: List[Document], explain: bool = True, features=None
+                           ) -> Tuple[np.ndarray, np.ndarray, Optional[List[List[Tuple[str, float]]]]]:
+        """
+        ML-based classification of many documents with one predict_proba call.
+        Returns arrays of predicted categories (the most probable class, as in predict)
+        and confidence scores, plus each document's top contributing n-grams if ``explain``.
+        ``features`` is the documents' TF-IDF matrix, if the caller already has it.
+        """
+        try:
+            model = self.ml_model
+            if features is None:
+                features = vectorize_documents(model.named_steps['tfidf'], documents)
+            classifier = model.named_steps['classifier']
+            probabilities = classifier.predict_proba(features)
+            class_indices = probabilities.argmax(axis=1)
+            predictions = classifier.classes_[class_indices].astype(object)
+            contributions = None
+            if explain:
+                indptr, indices, data = features.indptr, features.indices, features.data
+                contributions = [
+                    self._ml_contributions(indices[indptr[i]:indptr[i + 1]],
+                                           data[indptr[i]:indptr[i + 1]], class_indices[i])
+                    for i in range(len(documents))
+                ]
+            return predictions, probabilities.max(axis=1), contributions
         except:
-            return "non-harassment", 0.5
+            return (np.full(len(documents), "non-harassment", dtype=object),
+                    np.full(len(documents), 0.5),
+                    [[] for _ in documents] if explain else None)
     
-    def analyze_incident(self, text: str) -> Dict:
+    def _ml_contributions(self, indices: np.ndarray, values: np.ndarray,
+                          class_index: int) -> List[Tuple[str, float]]:
+        """
+        Top n-grams pushing the classifier toward ``class_index``, from one sparse TF-IDF row.
+        A feature's contribution is its TF-IDF value times how much more likely it is under
+        the class than under the average class; only the row's non-zero features are touched.
+        """
+        if not len(indices) or self.ml_top_k <= 0:
+            return []
+        model = self.ml_model
+        classifier = model.named_steps['classifier']
+        # Naive Bayes log probabilities, or a linear model's class weights (e.g. the ensemble's)
+        if not hasattr(classifier, 'feature_log_prob_') and not hasattr(classifier, 'coef_'):
+            return []
+        if self._ml_explain_tables is None or self._ml_explain_tables[0] is not classifier:
+            if hasattr(classifier, 'feature_log_prob_'):
+                table = classifier.feature_log_prob_
+            else:
+                table = classifier.coef_
+            feature_names = model.named_steps['tfidf'].get_feature_names_out()
+            self._ml_explain_tables = (classifier, table - table.mean(axis=0), feature_names)
+        _, relative_log_prob, feature_names = self._ml_explain_tables
+        
+        weights = values * relative_log_prob[class_index, indices]
+        k = min(self.ml_top_k, len(weights))
+        top = np.argpartition(-weights, k - 1)[:k]
+        top = top[np.argsort(-weights[top])]
+        return [(str(feature_names[indices[j]]), float(weights[j])) for j in top if weights[j] > 0]
+    
+    def analyze_incident(self, text: Union[str, Document], profile: bool = False) -> Dict:
         """
         Main analysis function combining rule-based and ML approaches.
         Returns comprehensive analysis with category, severity, and guidance.
+        ``profile=True`` traces this request with the installed profiler (a default
+        RequestProfiler otherwise); see profiling.py.
+        """
+        if profile or self.profiler is not None:
+            return self._profiled_analysis(text, profile)
+        return self._analyze(text)
+    
+    def _analyze(self, text: Union[str, Document],
+                 on_stage: Optional[Callable[[str], None]] = None) -> Dict:
+        """
+        The analyze_incident pipeline. ``on_stage`` is called with each stage's name
+        (ANALYSIS_STAGES) as it finishes, which is how the profiler times them.
+        """
+        # Normalize once, then get both analyses
+        document = as_document(text)
+        if on_stage is not None:
+            on_stage('normalize')
+        rule_result = self._rule_based_check(document)
+        if on_stage is not None:
+            on_stage('rules')
+        ml_category, ml_confidence, ml_features = self._ml_classify(document)
+        if on_stage is not None:
+            on_stage('ml')
+        
+        result = self._combine_results(rule_result, ml_category, ml_confidence, ml_features)
+        if on_stage is not None:
+            on_stage('combine')
+        return result
+    
+    def _profiled_analysis(self, text: Union[str, Document], profile: bool) -> Dict:
+        # Imported here: profiling imports this module, and is only needed when tracing
+        from profiling import RequestProfiler
+        
+        profiler = self.profiler or RequestProfiler()
+        # profile=False leaves an installed profiler to its sampling rate
+        return profiler.analyze(self, text, profile or None)
+    
+    def analyze_batch(self, texts: List[Union[str, Document]]) -> List[Dict]:
         """
-        # Get both analyses
-        rule_result = self._rule_based_check(text)
-        ml_category, ml_confidence = self._ml_classify(text)
+        Analyze many incidents at once.
+        Keyword rules run through the sparse batch engine and the ML model scores all
+        texts in a single call; each result matches analyze_incident for that text.
+        """
+        if not texts:
+            return []
+        
+        documents = [as_document(text) for text in texts]
+        rule_results = self.batch_rule_engine.score(documents).rule_results()
+        ml_predictions, ml_confidences, ml_features = self._ml_classify_batch(documents)
+        
+        return [
+            self._combine_results(*results)
+            for results in zip(rule_results, ml_predictions, ml_confidences, ml_features)
+        ]
+    
+    def score_batch(self, texts: List[Union[str, Document]], features=None) -> Dict[str, np.ndarray]:
+        """
+        Vectorized core of analyze_batch: the headline fields of each analysis as arrays
+        (is_harassment, category, severity, confidence_score, rule_score, ml_prediction),
+        without building explanations or per-document dictionaries. ``severity_level``
+        indexes SEVERITY_LEVELS and ``boundary_intents`` counts the boundary-violating
+        intents matched (coercion, no_consent, ignoring_boundaries). ``features`` is the
+        texts' TF-IDF matrix (vectorize_documents with the model's vectorizer), if already computed.
+        """
+        documents = [as_document(text) for text in texts]
+        rules = self.batch_rule_engine.score(documents)
+        rule_score = rules.score
+        primary = rules.primary_category
+        
+        if documents:
+            ml_prediction, ml_confidence, _ = self._ml_classify_batch(documents, explain=False, features=features)
+        else:
+            # predict_proba rejects an empty matrix
+            ml_prediction, ml_confidence = np.empty(0, dtype=object), np.empty(0)
         
+        is_harassment = (rule_score > 0) | ((ml_prediction != 'non-harassment') & (ml_confidence > 0.6))
+        
+        # Rule-based category wins where keywords matched, as in _combine_results
+        has_rule = primary >= 0
+        rule_category = np.array(rules.engine.categories, dtype=object)[np.maximum(primary, 0)]
+        final_category = np.where(has_rule, rule_category, ml_prediction)
+        category = np.array([CATEGORY_DISPLAY.get(c, 'Unclear') for c in final_category], dtype=object)
+        confidence = np.where(has_rule, np.minimum(0.95, 0.7 + rule_score / 50), ml_confidence)
+        severity = np.array(SEVERITY_LEVELS, dtype=object)[rules.final_severity]
+        
+        return {
+            'is_harassment': is_harassment,
+            'category': category,
+            'severity': severity,
+            'confidence_score': confidence,
+            'rule_score': rule_score,
+            'ml_prediction': ml_prediction,
+            'severity_level': rules.final_severity,
+            'boundary_intents': rules.boundary_intents
+        }
+
+    def index_incidents(self, texts: List[Union[str, Document]], index,
+                        refs: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+        """
+        Score incidents and add them, with the TF-IDF vectors the model classified, to a
+        SimilarityIndex (see similarity_index.py). Returns the score_batch arrays.
+        """
+        if not texts:
+            return self.score_batch([])
+        
+        documents = [as_document(text) for text in texts]
+        # The ML stage (ensemble included) shares this vectorizer, so vectorize once for both
+        vectors = vectorize_documents(self.model.named_steps['tfidf'], documents)
+        scores = self.score_batch(documents, features=vectors)
+        index.add(vectors, scores['category'], scores['severity'], refs)
+        return scores
+
+    def find_similar_incidents(self, text: Union[str, Document], index, k: int = 5) -> List[Dict]:
+        """
+        Past incidents in a SimilarityIndex most similar to ``text``, best first,
+        with their ref, cosine similarity, category and severity.
+        """
+        features = as_document(text).vector(self.model.named_steps['tfidf'])
+        return index.search(features, k)
+
+    @property
+    def batch_rule_engine(self) -> BatchRuleEngine:
+        """Sparse rule engine over the current keywords, built on first use."""
+        fuzzy = self.fuzzy_matcher if self.fuzzy_matching else None
+        if self._batch_rule_engine is None or self._batch_rule_engine.fuzzy is not fuzzy:
+            self._batch_rule_engine = BatchRuleEngine(self.keywords, self.intent_patterns, fuzzy)
+        return self._batch_rule_engine
+    
+    @property
+    def fuzzy_matcher(self) -> FuzzyMatcher:
+        """Obfuscation-tolerant index over the current keywords, built on first use."""
+        if self._fuzzy_matcher is None:
+            self._fuzzy_matcher = FuzzyMatcher(self.keywords)
+        return self._fuzzy_matcher
+    
+    def _combine_results(self, rule_result: Dict, ml_category: str, ml_confidence: float,
+                         ml_features: Optional[List[Tuple[str, float]]] = None) -> Dict:
+        """Merge rule-based and ML results into the final analysis."""
         # Determine if harassment
         is_harassment = (
             rule_result['score'] > 0 or 
@@ -267,16 +550,7 @@ class HarassmentDetector:
             confidence = ml_confidence
         
         # Map category to display format
-        category_display = {
-            'sexual': 'Sexual Harassment',
-            'threat': 'Threats/Intimidation',
-            'verbal': 'Verbal Harassment',
-            'physical': 'Physical Harassment',
-            'cyber': 'Cyber Harassment',
-            'stalking': 'Stalking',
-            'workplace': 'Workplace Harassment',
-            'non-harassment': 'Non-Harassment'
-        }.get(final_category, 'Unclear')
+        category_display = CATEGORY_DISPLAY.get(final_category, 'Unclear')
         
         # Determine severity
         severity = rule_result['severity']
@@ -285,7 +559,7 @@ class HarassmentDetector:
         
         # Generate explanation
         explanation = self._generate_explanation(
-            rule_result, ml_category, ml_confidence, is_harassment
+            rule_result, ml_category, ml_confidence, is_harassment, ml_features
         )
         
         # Get indicators
@@ -308,11 +582,15 @@ class HarassmentDetector:
             'indicators': indicators,
             'rule_score': rule_result['score'],
             'ml_prediction': ml_category,
-            'matched_keywords': rule_result['matched_keywords']
+            'ml_top_features': ml_features or [],
+            'matched_keywords': rule_result['matched_keywords'],
+            'intent_matches': rule_result['intent_matches'],
+            'fuzzy_matches': rule_result.get('fuzzy_matches', [])
         }
     
     def _generate_explanation(self, rule_result: Dict, ml_category: str, 
-                            ml_confidence: float, is_harassment: bool) -> str:
+                            ml_confidence: float, is_harassment: bool,
+                            ml_features: Optional[List[Tuple[str, float]]] = None) -> str:
         """Generate human-readable explanation of the analysis."""
         
         if not is_harassment:
@@ -342,6 +620,13 @@ class HarassmentDetector:
                 "that warrants immediate attention."
             )
         
+        if ml_features and ml_category != 'non-harassment':
+            phrases = ", ".join(f"'{ngram}'" for ngram, _ in ml_features[:3])
+            explanation_parts.append(
+                f"The phrases that most pointed our model toward "
+                f"{CATEGORY_DISPLAY.get(ml_category, ml_category)} were {phrases}."
+            )
+        
         if ml_confidence > 0.8:
             explanation_parts.append(
                 "Our machine learning model has high confidence in this classification."
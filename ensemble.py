@@ -0,0 +1,119 @@
+"""
+Shared-vectorization model ensemble.
+
+Naive Bayes, logistic regression and a linear SVM are all linear in the TF-IDF
+features, so after one vectorization their class weights can be stacked side
+by side into one (features x models*classes) matrix and scored with a single
+sparse x dense product. Each model's scores are turned into probabilities with a
+softmax (exactly predict_proba for NB and logistic regression; uncalibrated for
+the SVM's margins) and averaged with configurable weights.
+
+StackedLinearEnsemble stands in for the classifier step of the detector's
+pipeline and reuses its fitted vectorizer and Naive Bayes model; it is turned on
+with ``detector.ensemble = True`` and kept in its own pickle.
+"""
+
+import zlib
+from typing import Dict, Optional, Sequence
+import numpy as np
+from scipy.special import softmax
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+from sklearn.svm import LinearSVC
+
+from preprocess import Document, vectorize_documents
+
+ENSEMBLE_MODEL_PATH = 'harassment_ensemble.pkl'
+DEFAULT_WEIGHTS = {'nb': 1.0, 'logreg': 1.0, 'svm': 1.0}
+
+
+def vocabulary_fingerprint(vectorizer) -> int:
+    """Checksum of a fitted vectorizer's term -> column mapping."""
+    vocabulary = vectorizer.vocabulary_
+    terms = sorted(vocabulary, key=vocabulary.__getitem__)
+    return zlib.crc32('\n'.join(terms).encode('utf-8'))
+
+
+def _class_weights(model):
+    """(classes x features) weights and per-class intercepts of a fitted linear classifier."""
+    if hasattr(model, 'feature_log_prob_'):
+        return np.asarray(model.feature_log_prob_), np.asarray(model.class_log_prior_)
+    coef, intercept = model.coef_, np.atleast_1d(model.intercept_)
+    if coef.shape[0] == 1:
+        # Binary models keep one row for the positive class
+        coef, intercept = np.vstack([-coef, coef]) / 2, np.array([-intercept[0], intercept[0]]) / 2
+    return coef, intercept
+
+
+class StackedLinearEnsemble:
+    """
+    Several fitted linear classifiers over the same features, scored in one product.
+    ``weights`` maps model names to their share of the averaged probabilities and
+    can be changed at any time; a model with weight 0 is still scored but ignored.
+    """
+
+    def __init__(self, models: Dict[str, object], weights: Optional[Dict[str, float]] = None,
+                 fingerprint: Optional[int] = None):
+        self.names = list(models)
+        self.classes_ = next(iter(models.values())).classes_
+        for name, model in models.items():
+            if not np.array_equal(model.classes_, self.classes_):
+                raise ValueError(f"Model {name!r} was trained on different classes")
+        blocks = [_class_weights(model) for model in models.values()]
+        # features x (models * classes), so a CSR batch times it is one sparse x dense product
+        self._coef = np.ascontiguousarray(np.vstack([coef for coef, _ in blocks]).T)
+        self._intercept = np.concatenate([intercept for _, intercept in blocks])
+        self.weights = dict(weights or {name: DEFAULT_WEIGHTS.get(name, 1.0) for name in self.names})
+        self.fingerprint = fingerprint
+
+    @property
+    def n_features_in_(self) -> int:
+        return self._coef.shape[0]
+
+    def _model_weights(self) -> np.ndarray:
+        weights = np.array([self.weights.get(name, 0.0) for name in self.names], dtype=np.float64)
+        if weights.sum() <= 0:
+            raise ValueError("At least one ensemble weight must be positive")
+        return weights / weights.sum()
+
+    def model_probabilities(self, X) -> np.ndarray:
+        """(documents x models x classes) probabilities of every model."""
+        scores = np.asarray(X @ self._coef) + self._intercept
+        return softmax(scores.reshape(X.shape[0], len(self.names), len(self.classes_)), axis=2)
+
+    def predict_proba(self, X) -> np.ndarray:
+        return np.einsum('m,nmc->nc', self._model_weights(), self.model_probabilities(X))
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+    @property
+    def coef_(self) -> np.ndarray:
+        """
+        (classes x features) weighted sum of the models' class weights: a linear
+        approximation of the averaged scores, used to explain predictions.
+        """
+        coef = self._coef.T.reshape(len(self.names), len(self.classes_), -1)
+        return np.einsum('m,mcf->cf', self._model_weights(), coef)
+
+    def matches(self, model: Pipeline) -> bool:
+        """Whether this ensemble was trained on ``model``'s vectorizer and classes."""
+        vectorizer = model.named_steps['tfidf']
+        return (self.fingerprint == vocabulary_fingerprint(vectorizer)
+                and np.array_equal(self.classes_, model.named_steps['classifier'].classes_))
+
+
+def train_ensemble(model: Pipeline, texts: Sequence[str], labels: Sequence[str],
+                   weights: Optional[Dict[str, float]] = None) -> StackedLinearEnsemble:
+    """
+    Train logistic regression and a linear SVM on ``model``'s fitted vectorizer and
+    stack them with its Naive Bayes classifier.
+    """
+    vectorizer = model.named_steps['tfidf']
+    X = vectorize_documents(vectorizer, [Document(text) for text in texts])
+    models = {
+        'nb': model.named_steps['classifier'],
+        'logreg': LogisticRegression(C=10.0, max_iter=2000).fit(X, labels),
+        'svm': LinearSVC(C=1.0, dual=True).fit(X, labels)
+    }
+    return StackedLinearEnsemble(models, weights, vocabulary_fingerprint(vectorizer))
@@ -0,0 +1,336 @@
+"""
+Accuracy-versus-latency evaluation across detector configurations.
+
+Runs a labelled dataset through several configurations (rules-only, ML-only,
+hybrid, cascade, ...) and reports per-category precision/recall, severity
+confusion and throughput/latency side by side. Recall on Critical cases is
+checked against the hybrid baseline so a faster configuration can never
+silently lose Critical incidents: against the Critical severity labels when
+the data has them, otherwise against the cases the hybrid itself rates
+Critical. The baseline is always evaluated, and a run where neither gives any
+Critical case fails instead of passing unchecked.
+
+Usage:
+    python evaluate.py [labelled.csv|labelled.jsonl ...] [--configs hybrid cascade]
+"""
+
+import argparse
+import csv
+import json
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from sklearn.metrics import confusion_matrix, precision_recall_fscore_support
+
+from batch_rules import SEVERITY_LEVELS
+from dedup import NearDuplicateIndex, analyze_deduplicated
+from detector import CATEGORY_DISPLAY, TRAINING_DATA, HarassmentDetector
+from preprocess import as_document
+
+# Display names (as returned by analyze_incident) mapped back to category keys
+_CATEGORY_KEYS = {display: key for key, display in CATEGORY_DISPLAY.items()}
+# What analyze_incident calls a rule category without a display name (e.g. repetition)
+UNCLEAR = 'Unclear'
+
+BASELINE = 'hybrid'
+
+
+def load_labelled(path: str) -> List[Dict]:
+    """
+    Load a labelled file (CSV with a header, or JSON lines).
+    Each record needs ``text`` and ``category`` (key or display name); ``severity`` is optional.
+    """
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.jsonl') or path.endswith('.json'):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+
+    examples = []
+    for row in rows:
+        category = row['category'].strip()
+        severity = (row.get('severity') or '').strip().title() or None
+        examples.append({
+            'text': row['text'],
+            'category': _CATEGORY_KEYS.get(category, category),
+            'severity': severity
+        })
+    return examples
+
+
+# Severity-labelled Critical incidents, so the default run always checks Critical recall
+CRITICAL_EXAMPLES = [
+    ("He threatened to kill you and rape you if I tell anyone, and he keeps following me home", 'threat'),
+    ("My ex hacked my account, leaked photos of me and now keeps showing up outside my house", 'cyber'),
+    ("He grabbed me, pushed me down and punched me while calling me a worthless bitch", 'physical'),
+    ("My manager said my job depends on whether I sleep with him and touched me inappropriately", 'workplace'),
+    ("Someone has been following me for weeks, watching me and tracking my phone", 'stalking'),
+    ("He slapped me and choked me and said he will murder me", 'physical'),
+]
+
+
+def default_examples() -> List[Dict]:
+    """The labelled sentences the model is trained on (_train_model), plus CRITICAL_EXAMPLES."""
+    return ([{'text': text, 'category': category, 'severity': None} for text, category in TRAINING_DATA]
+            + [{'text': text, 'category': category, 'severity': 'Critical'}
+               for text, category in CRITICAL_EXAMPLES])
+
+
+# Each configuration maps a list of texts to (category key, severity or None) per text
+
+def _rule_categories(result) -> List[str]:
+    """Rule engine categories as the hybrid reports them: keys, or UNCLEAR for ones it does not display."""
+    return [category if category in CATEGORY_DISPLAY else UNCLEAR for category in result.engine.categories]
+
+
+def _rules_only(detector: HarassmentDetector, texts: Sequence[str]) -> List[Tuple[str, Optional[str]]]:
+    result = detector.batch_rule_engine.score([as_document(text) for text in texts])
+    categories = _rule_categories(result)
+    return [
+        (categories[primary] if primary >= 0 else 'non-harassment', SEVERITY_LEVELS[severity])
+        for primary, severity in zip(result.primary_category, result.final_severity)
+    ]
+
+
+def _ml_only(detector: HarassmentDetector, texts: Sequence[str]) -> List[Tuple[str, Optional[str]]]:
+    documents = [as_document(text) for text in texts]
+    predictions, _, _ = detector._ml_classify_batch(documents, explain=False)
+    return [(category, None) for category in predictions]
+
+
+def _ml_ensemble(detector: HarassmentDetector, texts: Sequence[str]) -> List[Tuple[str, Optional[str]]]:
+    """ML-only with the stacked NB + logistic regression + SVM ensemble (ensemble.py)."""
+    ensemble, detector.ensemble = detector.ensemble, True
+    try:
+        return _ml_only(detector, texts)
+    finally:
+        detector.ensemble = ensemble
+
+
+def _from_results(results: List[Dict]) -> List[Tuple[str, Optional[str]]]:
+    return [(_CATEGORY_KEYS.get(result['category'], result['category']), result['severity'])
+            for result in results]
+
+
+def _hybrid(detector: HarassmentDetector, texts: Sequence[str]) -> List[Tuple[str, Optional[str]]]:
+    return _from_results([detector.analyze_incident(text) for text in texts])
+
+
+def _hybrid_batch(detector: HarassmentDetector, texts: Sequence[str]) -> List[Tuple[str, Optional[str]]]:
+    return _from_results(detector.analyze_batch(list(texts)))
+
+
+def _cascade(detector: HarassmentDetector, texts: Sequence[str]) -> List[Tuple[str, Optional[str]]]:
+    """Rules first; the ML model only runs on texts the rules did not categorize."""
+    documents = [as_document(text) for text in texts]
+    result = detector.batch_rule_engine.score(documents)
+    categories = _rule_categories(result)
+    predictions = [
+        (categories[primary] if primary >= 0 else None, SEVERITY_LEVELS[severity])
+        for primary, severity in zip(result.primary_category, result.final_severity)
+    ]
+    undecided = [i for i, (category, _) in enumerate(predictions) if category is None]
+    if undecided:
+        ml_predictions, _, _ = detector._ml_classify_batch([documents[i] for i in undecided], explain=False)
+        for i, ml_category in zip(undecided, ml_predictions):
+            predictions[i] = (ml_category, predictions[i][1])
+    return predictions
+
+
+def _hybrid_dedup(detector: HarassmentDetector, texts: Sequence[str]) -> List[Tuple[str, Optional[str]]]:
+    return _from_results(list(analyze_deduplicated(detector, texts, NearDuplicateIndex())))
+
+
+CONFIGURATIONS: Dict[str, Callable] = {
+    'rules-only': _rules_only,
+    'ml-only': _ml_only,
+    'ml-ensemble': _ml_ensemble,
+    'hybrid': _hybrid,
+    'hybrid-batch': _hybrid_batch,
+    'cascade': _cascade,
+    'hybrid-dedup': _hybrid_dedup,
+}
+
+
+def evaluate_configuration(detector: HarassmentDetector, name: str, examples: List[Dict],
+                           latency_samples: int = 200) -> Dict:
+    """Accuracy and speed of one configuration on ``examples``."""
+    predict = CONFIGURATIONS[name]
+    texts = [example['text'] for example in examples]
+
+    start = time.perf_counter()
+    predictions = predict(detector, texts)
+    elapsed = time.perf_counter() - start
+
+    # Per-request latency: one text at a time
+    latencies = []
+    for text in texts[:latency_samples]:
+        t0 = time.perf_counter()
+        predict(detector, [text])
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    y_true = [example['category'] for example in examples]
+    y_pred = [category for category, _ in predictions]
+    labels = sorted(set(y_true) | set(y_pred))
+    precision, recall, _, support = precision_recall_fscore_support(
+        y_true, y_pred, labels=labels, zero_division=0
+    )
+
+    report = {
+        'name': name,
+        'per_category': {
+            label: {'precision': float(p), 'recall': float(r), 'support': int(s)}
+            for label, p, r, s in zip(labels, precision, recall, support)
+        },
+        'accuracy': float(np.mean([t == p for t, p in zip(y_true, y_pred)])),
+        'throughput': len(texts) / elapsed if elapsed > 0 else float('inf'),
+        'latency_p50_ms': float(np.percentile(latencies, 50)) if latencies else None,
+        'latency_p95_ms': float(np.percentile(latencies, 95)) if latencies else None,
+        'severity_confusion': None,
+        'critical_recall': None,
+        'critical_agreement': None,
+        'severities': [severity for _, severity in predictions]
+    }
+
+    # Severity is only scored where both the labels and the configuration provide it
+    pairs = [(example['severity'], severity) for example, (_, severity) in zip(examples, predictions)
+             if example['severity'] and severity]
+    if pairs:
+        true_severity, pred_severity = zip(*pairs)
+        report['severity_confusion'] = confusion_matrix(
+            true_severity, pred_severity, labels=SEVERITY_LEVELS
+        ).tolist()
+        critical = [pred == 'Critical' for true, pred in pairs if true == 'Critical']
+        if critical:
+            report['critical_recall'] = float(np.mean(critical))
+    return report
+
+
+def critical_agreement(reports: List[Dict]) -> int:
+    """
+    Set each report's ``critical_agreement``: the share of the texts the baseline rates
+    Critical that the configuration also rates Critical. Returns the number of such texts.
+    """
+    baseline = next(r for r in reports if r['name'] == BASELINE)
+    critical = [i for i, severity in enumerate(baseline['severities']) if severity == 'Critical']
+    for report in reports:
+        if critical and report['severities'][0] is not None:
+            report['critical_agreement'] = float(np.mean(
+                [report['severities'][i] == 'Critical' for i in critical]))
+    return len(critical)
+
+
+def critical_regressions(reports: List[Dict]) -> List[str]:
+    """
+    Configurations that lose Critical cases: Critical recall below the baseline's when
+    the data has Critical labels, otherwise any of the baseline's Critical predictions
+    missed (see critical_agreement). Configurations that do not predict severity
+    (ml-only) report n/a and are not compared.
+    """
+    baseline = next((r for r in reports if r['name'] == BASELINE), None)
+    if baseline is None:
+        raise ValueError(f"The {BASELINE} baseline must be evaluated to check Critical recall")
+    regressions = []
+    for report in reports:
+        if baseline['critical_recall'] is not None:
+            if report['critical_recall'] is not None and report['critical_recall'] < baseline['critical_recall']:
+                regressions.append(
+                    f"{report['name']}: Critical recall {report['critical_recall']:.3f} is below "
+                    f"{BASELINE} ({baseline['critical_recall']:.3f})"
+                )
+        elif report['critical_agreement'] is not None and report['critical_agreement'] < 1.0:
+            regressions.append(
+                f"{report['name']}: rates only {report['critical_agreement']:.3f} of the cases "
+                f"{BASELINE} rates Critical as Critical"
+            )
+    return regressions
+
+
+def format_reports(reports: List[Dict]) -> str:
+    """Side-by-side text table of the reports."""
+    names = [report['name'] for report in reports]
+    width = max(14, max(len(name) for name in names) + 2)
+    lines = [''.ljust(28) + ''.join(name.rjust(width) for name in names)]
+
+    def row(label, values):
+        lines.append(label.ljust(28) + ''.join(value.rjust(width) for value in values))
+
+    def fmt(value, spec='.3f'):
+        return 'n/a' if value is None else format(value, spec)
+
+    row('accuracy', [fmt(r['accuracy']) for r in reports])
+    row('throughput (docs/s)', [fmt(r['throughput'], ',.0f') for r in reports])
+    row('latency p50 (ms)', [fmt(r['latency_p50_ms'], '.2f') for r in reports])
+    row('latency p95 (ms)', [fmt(r['latency_p95_ms'], '.2f') for r in reports])
+    row('critical recall', [fmt(r['critical_recall']) for r in reports])
+    row(f'critical vs {BASELINE}', [fmt(r['critical_agreement']) for r in reports])
+
+    categories = sorted({label for r in reports for label in r['per_category']})
+    for category in categories:
+        for metric in ('precision', 'recall'):
+            row(f"{category} {metric}", [
+                fmt(r['per_category'].get(category, {}).get(metric)) for r in reports
+            ])
+
+    for report in reports:
+        if report['severity_confusion']:
+            lines.append('')
+            lines.append(f"Severity confusion ({report['name']}; rows = true, columns = predicted)")
+            lines.append(''.ljust(10) + ''.join(level.rjust(10) for level in SEVERITY_LEVELS))
+            for level, counts in zip(SEVERITY_LEVELS, report['severity_confusion']):
+                lines.append(level.ljust(10) + ''.join(str(c).rjust(10) for c in counts))
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('files', nargs='*', help='labelled CSV or JSON lines files')
+    parser.add_argument('--configs', nargs='+', default=list(CONFIGURATIONS),
+                        choices=list(CONFIGURATIONS))
+    parser.add_argument('--no-training-data', action='store_true',
+                        help='evaluate only on the given files')
+    parser.add_argument('--latency-samples', type=int, default=200)
+    parser.add_argument('--json', action='store_true', help='print the reports as JSON')
+    args = parser.parse_args(argv)
+
+    examples = [] if args.no_training_data else default_examples()
+    for path in args.files:
+        examples.extend(load_labelled(path))
+    if not examples:
+        parser.error('no labelled examples to evaluate')
+
+    configs = list(dict.fromkeys(args.configs))
+    if BASELINE not in configs:
+        print(f"Adding the {BASELINE} baseline for the Critical recall check", file=sys.stderr)
+        configs.append(BASELINE)
+
+    detector = HarassmentDetector()
+    reports = [evaluate_configuration(detector, name, examples, args.latency_samples)
+               for name in configs]
+    baseline_critical = critical_agreement(reports)
+    regressions = critical_regressions(reports)
+    labelled_critical = sum(example['severity'] == 'Critical' for example in examples)
+    unchecked = not labelled_critical and not baseline_critical
+
+    if args.json:
+        reports = [{key: value for key, value in report.items() if key != 'severities'} for report in reports]
+        print(json.dumps({'reports': reports, 'critical_regressions': regressions,
+                          'critical_checked': not unchecked}, indent=2))
+    else:
+        print(format_reports(reports))
+        if not labelled_critical and baseline_critical:
+            print(f"No Critical severity labels; checked against the {baseline_critical} "
+                  f"cases {BASELINE} rates Critical")
+        for regression in regressions:
+            print(f"WARNING: {regression}")
+    if unchecked:
+        print(f"ERROR: no Critical severity labels and {BASELINE} rates nothing Critical; "
+              "Critical recall could not be checked", file=sys.stderr)
+
+    # Any loss of Critical recall relative to the baseline, or no way to check it, fails the run
+    return 1 if regressions or unchecked else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
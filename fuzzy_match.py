@@ -0,0 +1,288 @@
+"""
+Obfuscation-tolerant keyword matching.
+
+Abusers dodge the substring checks with spellings like "b1tch", "f*ck you",
+"k i l l you" or "sluuut". Text is normalized through lookup tables (leetspeak
+digits and symbols, masking characters, letters spaced out with separators,
+repeated letters) and every word n-gram is looked up in an index precomputed
+from the lexicon:
+
+* an exact table of normalized keywords;
+* a SymSpell-style deletion index for bounded edit distance, used only where
+  the text shows signs of obfuscation, since clean English words one edit
+  away from a keyword ("eaten", "showed") are common;
+* an anagram table for a single swapped pair of letters in one word ("bastrad").
+
+Each match carries its canonical keyword and a confidence that is discounted
+for normalization and for every edit.
+"""
+
+import itertools
+import re
+import string
+from typing import Dict, List, NamedTuple, Set, Tuple, Union
+
+from batch_rules import SEVERITY_WEIGHTS
+from preprocess import Document, as_document
+
+# Leetspeak to letters; masking characters become the wildcard '*'.
+# Every mapping is one character to one character, so spans line up with the text.
+_LEET_TABLE = str.maketrans({
+    '0': 'o', '1': 'i', '3': 'e', '4': 'a', '5': 's', '7': 't', '8': 'b',
+    '@': 'a', '$': 's', '+': 't',
+    '#': '*', '%': '*',
+})
+# '!' and '|' read as 'i' only between letters ("b!tch"), not as punctuation
+_INNER_I = re.compile(r"(?<=[a-z])[!|](?=[a-z])")
+_WORD = re.compile(r"[a-z*]+")
+_REPEATS = re.compile(r"([a-z])\1+")
+_LONG_RUN = re.compile(r"([a-z])\1\1")
+_SEPARATORS = frozenset(" .-_,/\\|~")
+_SPACED_OUT = re.compile(r"(?<![a-z])[a-z](?:[ .\-_,/\\|~]+[a-z]){2}(?![a-z])")
+_PUNCTUATION_TO_SPACE = str.maketrans({c: ' ' for c in string.punctuation})
+
+# Confidence of a match found only after normalization, and the factor per edit
+NORMALIZATION_CONFIDENCE = 0.9
+EDIT_DISCOUNT = 0.7
+
+# Severity levels of the lexicon that take part; low-severity terms ("report",
+# "block", "awkward") are not worth disguising and too close to everyday words
+FUZZY_SEVERITIES = ('high', 'medium')
+
+
+class FuzzyMatch(NamedTuple):
+    """A lexicon keyword found under an obfuscated spelling."""
+    column: int         # position of (category, severity, keyword) in lexicon order
+    keyword: str
+    category: str
+    severity: str
+    matched: str        # the text as written
+    distance: int       # edits after normalization
+    confidence: float
+    weight: int         # severity weight discounted by confidence
+
+    @property
+    def label(self) -> str:
+        return (f"{self.keyword} ({self.category}, {self.severity}; "
+                f"written '{self.matched}', {self.confidence:.0%} confidence)")
+
+    def as_dict(self) -> Dict:
+        return {
+            'keyword': self.keyword,
+            'category': self.category,
+            'severity': self.severity,
+            'matched': self.matched,
+            'distance': self.distance,
+            'confidence': self.confidence
+        }
+
+
+def _skeleton(text: str) -> str:
+    """Collapse runs of a repeated letter ("slutttt" -> "slut", "kill" -> "kil")."""
+    if len(set(text)) == len(text):
+        return text
+    return _REPEATS.sub(r'\1', text)
+
+
+def _doubling_variants(term: str) -> Set[str]:
+    """``term`` with each run of a repeated letter either kept or written once ("kill" -> "kil")."""
+    parts = [match.group() for match in re.finditer(r"([a-z])\1*|[^a-z]+", term)]
+    options = [(part, part[0]) if len(part) > 1 and part[0].isalpha() else (part,) for part in parts]
+    return {''.join(choice) for choice in itertools.product(*options)}
+
+
+def _normalize(lower: str) -> str:
+    """Apply the leetspeak tables to lowercased text without changing its length."""
+    normalized = lower.translate(_LEET_TABLE)
+    if '!' in normalized or '|' in normalized:
+        normalized = _INNER_I.sub('i', normalized)
+    return normalized
+
+
+def _edit_budget(length: int) -> int:
+    """Edits tolerated for a normalized keyword of ``length`` characters."""
+    return 0 if length < 5 else 1 if length < 9 else 2
+
+
+def _deletes(word: str, depth: int) -> Set[str]:
+    """``word`` and every string reachable from it by up to ``depth`` deletions."""
+    result = {word}
+    frontier = {word}
+    for _ in range(depth):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        result |= frontier
+    return result
+
+
+def _is_transposition(a: str, b: str) -> bool:
+    """Whether equal-length ``a`` and ``b`` differ by one swap of adjacent characters."""
+    diff = [i for i, (x, y) in enumerate(zip(a, b)) if x != y]
+    return (len(diff) == 2 and diff[1] == diff[0] + 1
+            and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]])
+
+
+def _distance(query: str, keyword: str) -> int:
+    """Optimal string alignment distance; a '*' in the query matches any character for free."""
+    previous2 = None
+    previous = list(range(len(keyword) + 1))
+    for i, q in enumerate(query, 1):
+        current = [i] + [0] * len(keyword)
+        for j, k in enumerate(keyword, 1):
+            cost = 0 if q == k or q == '*' else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous2 is not None and i > 1 and j > 1 and q == keyword[j - 2]
+                    and query[i - 2] == k):
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class FuzzyMatcher:
+    """Precomputed fuzzy index over the high and medium severity keywords of a lexicon."""
+
+    def __init__(self, keywords: Dict[str, Dict[str, List[str]]]):
+        # column -> (category, severity, keyword), in the same order as BatchRuleEngine
+        self.columns = [
+            (category, severity, term)
+            for category, severity_dict in keywords.items()
+            for severity, terms in severity_dict.items()
+            for term in terms
+        ]
+        # normalized keyword -> [(column, keyword)]
+        self._exact = {}
+        for column, (_, severity, term) in enumerate(self.columns):
+            if severity in FUZZY_SEVERITIES:
+                self._exact.setdefault(_skeleton(term), []).append((column, term))
+
+        # Clean text is matched word by word against the keywords as written, with
+        # doubled letters optionally single, and their letter-sorted anagram keys
+        self._written = {}
+        self._anagrams = {}
+        for column, (_, severity, term) in enumerate(self.columns):
+            if severity in FUZZY_SEVERITIES:
+                for variant in _doubling_variants(term):
+                    self._written[variant] = _skeleton(term)
+                if ' ' not in term and len(term) >= 5:
+                    self._anagrams.setdefault(''.join(sorted(term)), set()).add(term)
+        self._first_words = {variant.split()[0] for variant in self._written if ' ' in variant}
+
+        # Obfuscated text is matched word by word: each keyword word has its deletions
+        # indexed, and keywords are chained from their first word
+        self._keyword_words = {key: tuple(key.split()) for key in self._exact}
+        self._by_first_word = {}
+        self._word_deleted = {}
+        for key, words in self._keyword_words.items():
+            self._by_first_word.setdefault(words[0], []).append(key)
+            for word in words:
+                for deleted in _deletes(word, 2):
+                    self._word_deleted.setdefault(deleted, set()).add(word)
+        self._ngram_sizes = sorted({len(words) for words in self._keyword_words.values()})
+
+    def _tokens(self, lower: str) -> List[Tuple[str, int, int, bool]]:
+        """(normalized word, start, end, shows obfuscation) for each word of lowercased text."""
+        normalized = _normalize(lower)
+        tokens = []
+        for match in _WORD.finditer(normalized):
+            word = match.group()
+            start, end = match.span()
+            obfuscated = (word != lower[start:end] or '*' in word
+                          or _LONG_RUN.search(word) is not None)
+            tokens.append((_skeleton(word), start, end, obfuscated))
+
+        # Letters spaced out with separators ("k i l l", "b.i.t.c.h") are joined into one word
+        merged = []
+        i = 0
+        while i < len(tokens):
+            j = i
+            while (j + 1 < len(tokens) and tokens[j][2] - tokens[j][1] == 1
+                   and tokens[j + 1][2] - tokens[j + 1][1] == 1
+                   and _SEPARATORS.issuperset(lower[tokens[j][2]:tokens[j + 1][1]])):
+                j += 1
+            if j - i >= 2:
+                word = _skeleton(''.join(token[0] for token in tokens[i:j + 1]))
+                merged.append((word, tokens[i][1], tokens[j][2], True))
+                i = j + 1
+            else:
+                merged.append(tokens[i])
+                i += 1
+        return merged
+
+    def _word_candidates(self, word: str, obfuscated: bool) -> Dict[str, int]:
+        """Keyword words within the edit budget of a normalized word, with their distance."""
+        candidates = {word: 0} if word in self._word_deleted else {}
+        wildcards = word.count('*')
+        if not obfuscated or len(word) - wildcards < max(2, wildcards):
+            return candidates
+        depth = min(2, wildcards + _edit_budget(len(word) + 1))
+        for deleted in _deletes(word, depth):
+            for candidate in self._word_deleted.get(deleted, ()):
+                if candidate not in candidates:
+                    distance = _distance(word, candidate)
+                    if distance <= _edit_budget(len(candidate)):
+                        candidates[candidate] = distance
+        return candidates
+
+    def _clean_hits(self, lower: str):
+        """(normalized keyword, distance, text) hits in text without any sign of obfuscation."""
+        words = lower.translate(_PUNCTUATION_TO_SPACE).split()
+        for i, word in enumerate(words):
+            if word in self._written:
+                yield self._written[word], 0, word
+            if len(word) >= 5:
+                # A single swapped pair of adjacent letters ("bastrad")
+                for term in self._anagrams.get(''.join(sorted(word)), ()):
+                    if _is_transposition(word, term):
+                        yield _skeleton(term), 1, word
+            if word in self._first_words:
+                for n in self._ngram_sizes[1:]:
+                    phrase = ' '.join(words[i:i + n])
+                    if phrase in self._written:
+                        yield self._written[phrase], 0, phrase
+
+    def _obfuscated_hits(self, lower: str):
+        """(normalized keyword, distance, text) hits, chaining per-word candidates into keywords."""
+        tokens = self._tokens(lower)
+        candidates = [self._word_candidates(word, obfuscated) for word, _, _, obfuscated in tokens]
+        for i, first in enumerate(candidates):
+            for word, distance in first.items():
+                for key in self._by_first_word.get(word, ()):
+                    words = self._keyword_words[key]
+                    end = i + len(words)
+                    if end > len(tokens):
+                        continue
+                    following = [candidates[j].get(w) for j, w in zip(range(i + 1, end), words[1:])]
+                    if None not in following:
+                        yield key, distance + sum(following), lower[tokens[i][1]:tokens[end - 1][2]]
+
+    def find(self, text: Union[str, Document]) -> List[FuzzyMatch]:
+        """
+        Keywords found only under an obfuscated spelling, one match per lexicon
+        column in column order. Keywords that occur verbatim are left to the
+        substring rules.
+        """
+        lower = as_document(text).lower
+        # Most text shows no sign of obfuscation and only needs dictionary lookups per word
+        if (_normalize(lower) == lower and '*' not in lower
+                and _LONG_RUN.search(lower) is None and _SPACED_OUT.search(lower) is None):
+            hits = self._clean_hits(lower)
+        else:
+            hits = self._obfuscated_hits(lower)
+
+        best = {}
+        for key, distance, matched in hits:
+            for column, term in self._exact[key]:
+                if column in best and best[column][1] <= distance:
+                    continue
+                if term in lower:
+                    continue
+                best[column] = (term, distance, matched)
+
+        matches = []
+        for column in sorted(best):
+            term, distance, matched = best[column]
+            category, severity, _ = self.columns[column]
+            confidence = round(NORMALIZATION_CONFIDENCE * EDIT_DISCOUNT ** distance, 2)
+            weight = max(1, round(SEVERITY_WEIGHTS[severity] * confidence))
+            matches.append(FuzzyMatch(column, term, category, severity, matched,
+                                      distance, confidence, weight))
+        return matches
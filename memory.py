@@ -0,0 +1,209 @@
+"""
+Memory footprint reporting and copy-on-write friendly preloading.
+
+Each Streamlit or worker process holds its own model, TF-IDF vocabulary and
+keyword structures. ``memory_report`` breaks that footprint down with
+tracemalloc; ``preload`` prepares a detector in a parent process so forked
+workers keep sharing its pages (flat arrays instead of dicts of strings, and
+long-lived objects frozen out of garbage collector tracking).
+
+Usage:
+    python memory.py                      # tracemalloc breakdown
+    python memory.py --workers 4          # RSS/USS/PSS per forked worker, plain detector
+    python memory.py --workers 4 --preload
+Both worker runs load the detector in the parent before forking, so the
+difference between them is what compaction and gc.freeze() save.
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import tracemalloc
+import types
+from typing import Dict, List, Optional
+
+from detector import TRAINING_DATA, HarassmentDetector
+from vocabulary import flatten_vectorizer
+
+
+def process_memory(pid: Optional[int] = None) -> Dict[str, int]:
+    """
+    RSS, PSS and USS (private pages) of a process in bytes, from /proc (Linux).
+    Elsewhere only the peak RSS of the current process is available.
+    """
+    path = f"/proc/{pid or 'self'}/smaps_rollup"
+    if not os.path.exists(path):
+        import resource
+        return {'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+
+    fields = {}
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                fields[parts[0][:-1]] = int(parts[1]) * 1024
+    return {
+        'rss': fields.get('Rss', 0),
+        'pss': fields.get('Pss', 0),
+        'uss': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+    }
+
+
+def deep_sizeof(obj, seen: Optional[set] = None) -> int:
+    """Approximate size of an object and everything reachable through containers."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen or isinstance(obj, (type, types.ModuleType, types.FunctionType)):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif isinstance(getattr(obj, 'nbytes', None), int):
+        size += obj.nbytes
+    elif hasattr(obj, '__dict__'):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+
+def _traced(func):
+    """Run ``func`` and return (result, bytes still allocated afterwards)."""
+    before = tracemalloc.get_traced_memory()[0]
+    result = func()
+    return result, tracemalloc.get_traced_memory()[0] - before
+
+
+def memory_report(texts: Optional[List[str]] = None, requests: int = 200) -> Dict[str, int]:
+    """
+    Breakdown of a detector's memory in bytes.
+
+    ``detector_total`` and ``batch_rule_engine`` are what tracemalloc saw allocated
+    while constructing the detector and building its rule engine. ``model``,
+    ``vocabulary``, ``stop_words`` and ``lexicon`` are deep_sizeof estimates of the
+    pipeline and of structures inside the detector. ``per_request_garbage`` is the
+    average transient peak of one analyze_incident call and ``retained_after_requests``
+    what the ``requests`` calls left allocated.
+    """
+    texts = texts or [text for text, _ in TRAINING_DATA]
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        detector, detector_total = _traced(HarassmentDetector)
+        _, engine_size = _traced(lambda: detector.batch_rule_engine)
+        vectorizer = detector.model.named_steps['tfidf']
+
+        retained_before = tracemalloc.get_traced_memory()[0]
+        peak = 0
+        for i in range(requests):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            detector.analyze_incident(texts[i % len(texts)])
+            peak += tracemalloc.get_traced_memory()[1] - before
+        retained = tracemalloc.get_traced_memory()[0] - retained_before
+
+        return {
+            'detector_total': detector_total,
+            'model': deep_sizeof(detector.model),
+            'vocabulary': deep_sizeof(vectorizer.vocabulary_),
+            'stop_words': deep_sizeof(getattr(vectorizer, 'stop_words_', None)),
+            'lexicon': deep_sizeof(detector.keywords) + deep_sizeof(detector.intent_patterns),
+            'batch_rule_engine': engine_size,
+            'per_request_garbage': peak // max(requests, 1),
+            'retained_after_requests': retained
+        }
+    finally:
+        if started:
+            tracemalloc.stop()
+
+
+def compact_detector(detector: HarassmentDetector) -> HarassmentDetector:
+    """Move a detector's large tables into flat arrays and build lazy structures up front."""
+    flatten_vectorizer(detector.model.named_steps['tfidf'])
+    detector.batch_rule_engine
+    return detector
+
+
+def warm_up(detector: HarassmentDetector) -> HarassmentDetector:
+    """Run one analysis so lazily cached attributes exist before the pages are shared."""
+    detector.analyze_incident(TRAINING_DATA[0][0])
+    return detector
+
+
+def preload(detector: Optional[HarassmentDetector] = None) -> HarassmentDetector:
+    """
+    Prepare a detector in the parent process before workers are forked.
+
+    The detector is compacted, a full collection is run, and every surviving object
+    is moved to the permanent generation with gc.freeze(), so collections in the
+    workers never write to the shared pages.
+    """
+    gc.disable()
+    try:
+        detector = warm_up(compact_detector(detector or HarassmentDetector()))
+        gc.collect()
+        gc.freeze()
+    finally:
+        gc.enable()
+    return detector
+
+
+def _worker(detector: HarassmentDetector, requests: int, write_fd: int):
+    texts = [text for text, _ in TRAINING_DATA]
+    for i in range(requests):
+        detector.analyze_incident(texts[i % len(texts)])
+    gc.collect()
+    os.write(write_fd, (json.dumps(process_memory()) + '\n').encode())
+    os.close(write_fd)
+
+
+def fork_workers(workers: int, requests: int = 1000, preload_detector: bool = False) -> List[Dict[str, int]]:
+    """
+    Fork workers that each serve ``requests`` analyses and report their memory.
+    The detector is loaded (and warmed up) in the parent either way; ``preload_detector``
+    also compacts and freezes it.
+    """
+    detector = preload() if preload_detector else warm_up(HarassmentDetector())
+    results = []
+    for _ in range(workers):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            try:
+                _worker(detector, requests, write_fd)
+            finally:
+                os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd) as reader:
+            results.append(json.loads(reader.readline()))
+        os.waitpid(pid, 0)
+    return results
+
+
+def _mb(value: int) -> str:
+    return f"{value / 1024 / 1024:.1f} MB"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=0, help='fork this many workers')
+    parser.add_argument('--requests', type=int, default=1000, help='requests per worker')
+    parser.add_argument('--preload', action='store_true', help='also compact and freeze the detector before forking')
+    args = parser.parse_args(argv)
+
+    if not args.workers:
+        for name, size in memory_report().items():
+            print(f"{name:<26}{_mb(size):>12}  ({size} bytes)")
+        return 0
+
+    for i, stats in enumerate(fork_workers(args.workers, args.requests, args.preload)):
+        print(f"worker {i}: " + ', '.join(f"{k.upper()} {_mb(v)}" for k, v in stats.items()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
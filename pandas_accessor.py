@@ -0,0 +1,101 @@
+"""
+pandas integration: ``df.harassment.analyze(column)``.
+
+Scores a text column in vectorized batches through HarassmentDetector.score_batch
+and returns typed columns instead of a column of dictionaries. Chunked CSV or
+Parquet readers can be scored out-of-core with ``analyze_chunks``.
+
+    import pandas as pd
+    import pandas_accessor  # registers the accessor
+
+    scores = df.harassment.analyze('description')
+    for chunk in analyze_chunks(pd.read_csv('reports.csv', chunksize=100000), 'description'):
+        ...
+"""
+
+from typing import Iterable, Iterator, List, Optional
+import numpy as np
+import pandas as pd
+
+from batch_rules import SEVERITY_LEVELS
+from detector import CATEGORY_DISPLAY, HarassmentDetector
+
+CATEGORY_DTYPE = pd.CategoricalDtype(list(CATEGORY_DISPLAY.values()) + ['Unclear'])
+SEVERITY_DTYPE = pd.CategoricalDtype(SEVERITY_LEVELS, ordered=True)
+
+_detector = None
+
+
+def _default_detector() -> HarassmentDetector:
+    """Detector shared by every accessor call that does not pass its own."""
+    global _detector
+    if _detector is None:
+        _detector = HarassmentDetector()
+    return _detector
+
+
+def score_series(texts: pd.Series, detector: Optional[HarassmentDetector] = None,
+                 batch_size: int = 50000) -> pd.DataFrame:
+    """Typed analysis columns for a Series of texts, indexed like the Series."""
+    detector = detector or _default_detector()
+    values = texts.fillna('').astype(str).tolist()
+
+    parts = [detector.score_batch(values[i:i + batch_size])
+             for i in range(0, len(values), batch_size)]
+
+    def column(name):
+        return np.concatenate([part[name] for part in parts]) if parts else np.array([])
+
+    return pd.DataFrame({
+        'is_harassment': column('is_harassment').astype(bool),
+        'category': pd.Categorical(column('category'), dtype=CATEGORY_DTYPE),
+        'severity': pd.Categorical(column('severity'), dtype=SEVERITY_DTYPE),
+        'confidence': column('confidence_score').astype(np.float32),
+        'rule_score': column('rule_score').astype(np.int32),
+        'ml_prediction': pd.Categorical(column('ml_prediction'),
+                                        categories=list(CATEGORY_DISPLAY)),
+    }, index=texts.index)
+
+
+@pd.api.extensions.register_dataframe_accessor('harassment')
+class HarassmentAccessor:
+    """``df.harassment`` namespace."""
+
+    def __init__(self, pandas_obj: pd.DataFrame):
+        self._obj = pandas_obj
+
+    def analyze(self, column: str, detector: Optional[HarassmentDetector] = None,
+                batch_size: int = 50000, join: bool = False) -> pd.DataFrame:
+        """
+        Score ``column`` and return is_harassment (bool), category and severity
+        (categoricals), confidence (float32), rule_score (int32) and ml_prediction.
+        With ``join=True`` the columns are appended to a copy of the frame.
+        """
+        if column not in self._obj.columns:
+            raise KeyError(f"Column '{column}' not found")
+        scores = score_series(self._obj[column], detector, batch_size)
+        return self._obj.join(scores) if join else scores
+
+
+def analyze_chunks(chunks: Iterable[pd.DataFrame], column: str,
+                   detector: Optional[HarassmentDetector] = None,
+                   batch_size: int = 50000) -> Iterator[pd.DataFrame]:
+    """
+    Score an iterable of DataFrames, such as ``pd.read_csv(path, chunksize=...)`` or
+    ``read_parquet_chunks``, yielding each chunk joined with its score columns.
+    Only one chunk is held in memory at a time.
+    """
+    detector = detector or _default_detector()
+    for chunk in chunks:
+        yield chunk.harassment.analyze(column, detector, batch_size, join=True)
+
+
+def read_parquet_chunks(path: str, columns: Optional[List[str]] = None,
+                        batch_size: int = 100000) -> Iterator[pd.DataFrame]:
+    """Read a Parquet file in record batches (requires pyarrow)."""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Reading Parquet in chunks requires pyarrow (pip install pyarrow)") from e
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=columns):
+        yield batch.to_pandas()
@@ -0,0 +1,92 @@
+"""
+Shared text normalization stage.
+
+An incident text is normalized and tokenized once into a Document, which the
+rule engine, the intent scanner and the TF-IDF vectorizer all read from.
+Hindi and Hinglish terms are glossed into the English lexicon first (see
+transliteration.py).
+"""
+
+import re
+from functools import cached_property
+from typing import List, Optional, Union
+
+from transliteration import transliterate
+from vocabulary import FlatVocabulary, tfidf_matrix
+
+# Same tokenization as TfidfVectorizer's default token_pattern
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+NGRAM_RANGE = (1, 2)
+
+
+class Document:
+    """
+    Incident text normalized once and shared by every analysis stage.
+
+    ``text`` has whitespace collapsed (and is truncated to ``max_length`` if given),
+    then English glosses of Hindi/Hinglish terms appended unless ``transliterated``
+    is False; the lowercased text, tokens and n-grams are computed on first use and cached.
+    """
+
+    def __init__(self, text: str, max_length: Optional[int] = None, transliterated: bool = True):
+        self.raw = text
+        text = ' '.join(text.split())
+        if max_length is not None:
+            text = text[:max_length]
+        if transliterated:
+            text = transliterate(text)
+        self.text = text
+        self._vector = None
+
+    def __repr__(self) -> str:
+        return f"Document({self.text!r})"
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    @cached_property
+    def lower(self) -> str:
+        return self.text.lower()
+
+    @cached_property
+    def tokens(self) -> List[str]:
+        return TOKEN_PATTERN.findall(self.lower)
+
+    @cached_property
+    def ngrams(self) -> List[str]:
+        """Word n-grams in the order TfidfVectorizer's word analyzer produces them."""
+        tokens = self.tokens
+        min_n, max_n = NGRAM_RANGE
+        ngrams = list(tokens) if min_n == 1 else []
+        for n in range(max(min_n, 2), max_n + 1):
+            ngrams.extend(' '.join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return ngrams
+
+    def vector(self, vectorizer):
+        """TF-IDF row for this document, computed once per vectorizer."""
+        if self._vector is None or self._vector[0] is not vectorizer:
+            self._vector = (vectorizer, vectorize_documents(vectorizer, [self]))
+        return self._vector[1]
+
+
+def as_document(text: Union[str, Document]) -> Document:
+    """Return ``text`` as a Document, reusing it if it already is one."""
+    return text if isinstance(text, Document) else Document(text)
+
+
+def analyze_document(text: Union[str, Document]) -> List[str]:
+    """Analyzer for TfidfVectorizer that reads the n-grams cached on the document."""
+    return as_document(text).ngrams
+
+
+def vectorize_documents(vectorizer, documents: List[Document]):
+    """
+    TF-IDF matrix for ``documents``.
+    A flattened vocabulary is looked up in one vectorized pass over the cached n-grams;
+    vectorizers fitted before the shared analyzer existed are given the plain text.
+    """
+    if not callable(vectorizer.analyzer):
+        return vectorizer.transform([document.text for document in documents])
+    if isinstance(vectorizer.vocabulary_, FlatVocabulary):
+        return tfidf_matrix(vectorizer, [document.ngrams for document in documents])
+    return vectorizer.transform(documents)
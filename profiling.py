@@ -0,0 +1,216 @@
+"""
+On-demand request profiling.
+
+``install`` attaches a profiler to a detector when profiling is switched on
+through the environment:
+
+    HARASSMENT_PROFILE_RATE   fraction of requests to profile (e.g. 0.01)
+    HARASSMENT_PROFILE_DIR    where profiles and the slow-request log go (default: profiles)
+    HARASSMENT_SLOW_MS        log requests slower than this many milliseconds
+
+With none of them set ``install`` leaves the detector untouched, and
+analyze_incident pays a single check for profiling. Once installed, every
+request is timed per stage (normalize, rules, ml, combine) and a sampled
+request is traced with sys.setprofile into a collapsed-stack file
+(``frame;frame;frame microseconds`` per line) that flamegraph.pl or speedscope
+can render. ``analyze_incident(text, profile=True)`` traces one request on
+demand, installed or not. Slow requests are appended to
+``slow_requests.jsonl`` with their input length and stage timings; the text
+itself is never written.
+
+Usage:
+    python profiling.py "text to profile" [--file inputs.txt] [--output profiles]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple, Union
+
+from detector import HarassmentDetector
+from preprocess import Document
+
+SLOW_LOG = 'slow_requests.jsonl'
+
+
+class StackCollector:
+    """
+    sys.setprofile callback accumulating the self time of every call stack,
+    Python and C functions alike (so a slow re.search shows up under its caller).
+    """
+
+    def __init__(self):
+        self.stacks = Counter()     # tuple of frame names -> seconds of self time
+        self._stack = []            # [name, start, time spent in children]
+
+    def __call__(self, frame, event, arg):
+        now = time.perf_counter()
+        if event == 'call':
+            code = frame.f_code
+            name = (f"{getattr(code, 'co_qualname', code.co_name)} "
+                    f"({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            self._stack.append([name, now, 0.0])
+        elif event == 'c_call':
+            module = getattr(arg, '__module__', None)
+            name = getattr(arg, '__qualname__', getattr(arg, '__name__', repr(arg)))
+            self._stack.append([f"{module}.{name}" if module else name, now, 0.0])
+        elif self._stack:
+            # return, c_return or c_exception; events from before the collector was set are ignored
+            name, start, children = self._stack.pop()
+            elapsed = now - start
+            self.stacks[tuple(entry[0] for entry in self._stack) + (name,)] += elapsed - children
+            if self._stack:
+                self._stack[-1][2] += elapsed
+
+    def collapsed(self) -> List[str]:
+        """Collapsed-stack lines with integer microseconds, heaviest first."""
+        return [f"{';'.join(stack)} {max(1, round(seconds * 1e6))}"
+                for stack, seconds in self.stacks.most_common()]
+
+
+def timed_analysis(detector: HarassmentDetector, text: Union[str, Document]) -> Tuple[Dict, Dict[str, float]]:
+    """analyze_incident, stage by stage, returning the result and each stage's seconds."""
+    stages = {}
+    last = [time.perf_counter()]
+    
+    def finished(stage: str):
+        now = time.perf_counter()
+        stages[stage] = now - last[0]
+        last[0] = now
+    
+    return detector._analyze(text, finished), stages
+
+
+class RequestProfiler:
+    """Samples, traces and logs analyze_incident requests (see the module docstring)."""
+
+    def __init__(self, rate: float = 0.0, directory: str = 'profiles',
+                 slow_ms: Optional[float] = None, seed: Optional[int] = None):
+        self.rate = rate
+        self.directory = directory
+        self.slow_ms = slow_ms
+        self._random = random.Random(seed)
+        self._count = 0
+
+    @classmethod
+    def from_env(cls, environ=os.environ) -> Optional['RequestProfiler']:
+        """A profiler configured from HARASSMENT_PROFILE_*, or None when profiling is off."""
+        rate = float(environ.get('HARASSMENT_PROFILE_RATE') or 0)
+        slow_ms = environ.get('HARASSMENT_SLOW_MS')
+        directory = environ.get('HARASSMENT_PROFILE_DIR')
+        if not rate and not slow_ms and not directory:
+            return None
+        return cls(rate, directory or 'profiles', float(slow_ms) if slow_ms else None)
+
+    def _path(self, name: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, name)
+
+    def write_profile(self, collector: StackCollector) -> str:
+        self._count += 1
+        path = self._path(f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._count}.collapsed")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(collector.collapsed()) + '\n')
+        return path
+
+    def log_slow(self, input_length: int, total: float, stages: Dict[str, float],
+                 profile_path: Optional[str]):
+        record = {
+            'time': time.time(),
+            'pid': os.getpid(),
+            'input_length': input_length,
+            'total_ms': round(total * 1000, 3),
+            'stages_ms': {stage: round(seconds * 1000, 3) for stage, seconds in stages.items()},
+            'profile': profile_path
+        }
+        # One write per line so concurrent workers do not interleave records
+        with open(self._path(SLOW_LOG), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+
+    def analyze(self, detector: HarassmentDetector, text: Union[str, Document],
+                profile: Optional[bool] = None) -> Dict:
+        """
+        analyze_incident with stage timings. ``profile`` forces (True) or skips (False)
+        tracing; by default a ``rate`` fraction of requests is traced.
+        """
+        if profile is None:
+            profile = self.rate > 0 and self._random.random() < self.rate
+        collector = StackCollector() if profile else None
+        start = time.perf_counter()
+        if collector is not None:
+            # Put back any profiler or tracer that was already running (cProfile, a debugger)
+            previous = sys.getprofile()
+            sys.setprofile(collector)
+        try:
+            result, stages = timed_analysis(detector, text)
+        finally:
+            if collector is not None:
+                sys.setprofile(previous)
+        total = time.perf_counter() - start
+
+        profile_path = self.write_profile(collector) if collector is not None else None
+        if self.slow_ms is not None and total * 1000 >= self.slow_ms:
+            raw = text.raw if isinstance(text, Document) else text
+            self.log_slow(len(raw), total, stages, profile_path)
+        return result
+
+
+def install(detector: HarassmentDetector, profiler: Optional[RequestProfiler] = None) -> HarassmentDetector:
+    """
+    Route ``detector.analyze_incident`` through ``profiler`` (by default one from the
+    environment). Without a profiler the detector is returned unchanged.
+    """
+    profiler = profiler or RequestProfiler.from_env()
+    if profiler is not None:
+        detector.profiler = profiler
+    return detector
+
+
+def uninstall(detector: HarassmentDetector) -> HarassmentDetector:
+    """Stop profiling the detector's analyze_incident."""
+    detector.__dict__.pop('profiler', None)
+    return detector
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('texts', nargs='*', help='inputs to profile')
+    parser.add_argument('--file', help='also profile every line of this file')
+    parser.add_argument('--output', default='profiles', help='directory for the collapsed stacks')
+    parser.add_argument('--top', type=int, default=10, help='heaviest stacks to print per input')
+    args = parser.parse_args(argv)
+
+    texts = list(args.texts)
+    if args.file:
+        with open(args.file, encoding='utf-8') as f:
+            texts.extend(line.rstrip('\n') for line in f if line.strip())
+    if not texts:
+        parser.error('nothing to profile')
+
+    detector = HarassmentDetector()
+    # Warm up lazily built structures (rule engine, fuzzy index, explanation tables)
+    detector.analyze_incident(texts[0])
+    profiler = RequestProfiler(directory=args.output)
+    for text in texts:
+        collector = StackCollector()
+        previous = sys.getprofile()
+        sys.setprofile(collector)
+        try:
+            _, stages = timed_analysis(detector, text)
+        finally:
+            sys.setprofile(previous)
+        path = profiler.write_profile(collector)
+        timings = ', '.join(f"{stage} {seconds * 1000:.2f} ms" for stage, seconds in stages.items())
+        print(f"{len(text)} chars: {timings} -> {path}")
+        for line in collector.collapsed()[:args.top]:
+            stack, micros = line.rsplit(' ', 1)
+            print(f"  {int(micros):>9} us  {stack.split(';')[-1]}  <- {' < '.join(stack.split(';')[-2:-4:-1])}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,255 @@
+"""
+Similar-incident retrieval over the model's TF-IDF vectors.
+
+Scored reports are added to an inverted index: for every TF-IDF feature, the
+documents that contain it and their weights. Rows are L2-normalized by the
+vectorizer, so a query's cosine similarity to every indexed report is a sum over
+the query's few non-zero features, accumulated with one np.bincount.
+
+The index lives in a directory of immutable segments of .npy arrays that are
+memory-mapped on open, so a process only pages in the posting lists its queries
+touch. New reports are buffered and written as a new segment on flush().
+
+    index = SimilarityIndex('incident_index')
+    detector.index_incidents(texts, index, refs=report_ids)
+    index.flush()
+    detector.find_similar_incidents(text, index, k=5)
+"""
+
+import json
+import os
+import shutil
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import scipy.sparse as sp
+
+from batch_rules import SEVERITY_LEVELS
+from detector import CATEGORY_DISPLAY
+
+MANIFEST = 'manifest.json'
+CATEGORIES = list(CATEGORY_DISPLAY.values()) + ['Unclear']
+
+_SEGMENT_ARRAYS = ('indptr', 'docs', 'weights', 'categories', 'severities', 'ref_offsets', 'refs')
+
+
+class _Segment:
+    """One immutable, memory-mapped segment: feature-major postings plus per-report metadata."""
+
+    def __init__(self, path: str):
+        self.path = path
+        for name in _SEGMENT_ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r'))
+        self.size = len(self.categories)
+
+    @staticmethod
+    def write(path: str, matrix: sp.csr_matrix, categories: np.ndarray,
+              severities: np.ndarray, refs: List[str]):
+        """Write a documents x features matrix and its metadata as a segment at ``path``."""
+        csc = matrix.tocsc()
+        # Impact order: each posting list is sorted by weight, highest first
+        features = np.repeat(np.arange(csc.shape[1]), np.diff(csc.indptr))
+        order = np.lexsort((-csc.data, features))
+        encoded = [ref.encode('utf-8') for ref in refs]
+
+        arrays = {
+            'indptr': csc.indptr.astype(np.int64),
+            'docs': csc.indices[order].astype(np.int32),
+            'weights': csc.data[order].astype(np.float32),
+            'categories': categories.astype(np.uint8),
+            'severities': severities.astype(np.uint8),
+            'ref_offsets': np.concatenate(([0], np.cumsum([len(ref) for ref in encoded]))).astype(np.int64),
+            'refs': np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        }
+        tmp = f"{path}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp, f"{name}.npy"), array)
+        os.replace(tmp, path)
+
+    def ref(self, i: int) -> str:
+        return bytes(self.refs[self.ref_offsets[i]:self.ref_offsets[i + 1]]).decode('utf-8')
+
+    def to_csr(self) -> sp.csr_matrix:
+        csc = sp.csc_matrix((np.asarray(self.weights), np.asarray(self.docs), np.asarray(self.indptr)),
+                            shape=(self.size, len(self.indptr) - 1))
+        return csc.tocsr()
+
+    def top_k(self, indices: np.ndarray, values: np.ndarray, k: int,
+              max_postings: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Local ids and cosine similarities of the ``k`` reports most similar to a query row."""
+        starts = self.indptr[indices]
+        lengths = np.minimum(self.indptr[indices + 1] - starts, max_postings)
+        total = int(lengths.sum())
+        if not total:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        # Positions of every (truncated) posting list, gathered in one fancy index
+        before = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        positions = np.repeat(starts - before, lengths) + np.arange(total)
+        docs = self.docs[positions]
+        weights = self.weights[positions] * np.repeat(values, lengths)
+        scores = np.bincount(docs, weights, minlength=self.size)
+
+        # Only reports in the gathered postings can rank; each appears at most once per
+        # query feature, so the best k * len(indices) postings cover the best k reports
+        limit = k * len(indices)
+        if len(docs) > limit:
+            docs = docs[np.argpartition(scores[docs], len(docs) - limit)[-limit:]]
+        docs = np.unique(docs)
+        if len(docs) > k:
+            docs = docs[np.argpartition(scores[docs], len(docs) - k)[-k:]]
+        return docs, scores[docs]
+
+
+class SimilarityIndex:
+    """
+    Persistent top-k cosine search over TF-IDF rows of scored incidents.
+
+    ``max_postings`` bounds the work per query feature: posting lists are stored
+    highest weight first and only that many entries of each are read, which only
+    drops the smallest contributions of very common n-grams.
+    """
+
+    def __init__(self, directory: str, num_features: Optional[int] = None,
+                 segment_size: int = 100000, max_postings: int = 5000):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_postings = max_postings
+
+        manifest_path = os.path.join(directory, MANIFEST)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding='utf-8') as f:
+                self.manifest = json.load(f)
+            if num_features is not None and num_features != self.manifest['num_features']:
+                raise ValueError(f"Index has {self.manifest['num_features']} features, "
+                                 f"the vectorizer has {num_features}")
+        else:
+            if num_features is None:
+                raise ValueError("num_features is required to create a new index")
+            os.makedirs(directory, exist_ok=True)
+            self.manifest = {'num_features': num_features, 'segments': []}
+            self._write_manifest()
+
+        self.segments = [_Segment(os.path.join(directory, name)) for name in self.manifest['segments']]
+        self._clear_pending()
+
+    @property
+    def num_features(self) -> int:
+        return self.manifest['num_features']
+
+    def __len__(self) -> int:
+        return sum(segment.size for segment in self.segments) + self._pending_size
+
+    def _write_manifest(self):
+        path = os.path.join(self.directory, MANIFEST)
+        with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(f"{path}.tmp", path)
+
+    def _clear_pending(self):
+        self._pending = []
+        self._pending_size = 0
+        self._pending_matrix = None
+
+    def add(self, vectors: sp.csr_matrix, categories: Sequence[str], severities: Sequence[str],
+            refs: Optional[Sequence[str]] = None):
+        """
+        Buffer TF-IDF rows with their display category and severity. ``refs`` identify
+        the reports in search results (default: their insertion number). A segment is
+        written automatically once ``segment_size`` reports are buffered.
+        """
+        vectors = sp.csr_matrix(vectors)
+        if vectors.shape[1] != self.num_features:
+            raise ValueError(f"Expected {self.num_features} features, got {vectors.shape[1]}")
+        if refs is None:
+            start = len(self)
+            refs = [str(start + i) for i in range(vectors.shape[0])]
+
+        category_codes = {name: code for code, name in enumerate(CATEGORIES)}
+        severity_codes = {name: code for code, name in enumerate(SEVERITY_LEVELS)}
+        self._pending.append((
+            vectors,
+            np.array([category_codes.get(c, len(CATEGORIES) - 1) for c in categories], dtype=np.uint8),
+            np.array([severity_codes[s] for s in severities], dtype=np.uint8),
+            [str(ref) for ref in refs]
+        ))
+        self._pending_size += vectors.shape[0]
+        self._pending_matrix = None
+        if self._pending_size >= self.segment_size:
+            self.flush()
+
+    def _pending_arrays(self):
+        matrix = sp.vstack([part[0] for part in self._pending], format='csr')
+        categories = np.concatenate([part[1] for part in self._pending])
+        severities = np.concatenate([part[2] for part in self._pending])
+        refs = [ref for part in self._pending for ref in part[3]]
+        return matrix, categories, severities, refs
+
+    def flush(self):
+        """Write buffered reports as a new segment."""
+        if not self._pending_size:
+            return
+        name = f"segment-{len(self.manifest['segments']):05d}"
+        while os.path.exists(os.path.join(self.directory, name)):
+            name += '-1'
+        _Segment.write(os.path.join(self.directory, name), *self._pending_arrays())
+        self.manifest['segments'].append(name)
+        self._write_manifest()
+        self.segments.append(_Segment(os.path.join(self.directory, name)))
+        self._clear_pending()
+
+    def merge(self):
+        """Rewrite all segments (and buffered reports) as one, so queries scan a single segment."""
+        self.flush()
+        if len(self.segments) <= 1:
+            return
+        matrix = sp.vstack([segment.to_csr() for segment in self.segments], format='csr')
+        categories = np.concatenate([np.asarray(segment.categories) for segment in self.segments])
+        severities = np.concatenate([np.asarray(segment.severities) for segment in self.segments])
+        refs = [segment.ref(i) for segment in self.segments for i in range(segment.size)]
+
+        old = self.manifest['segments']
+        name = f"merged-{len(old):05d}"
+        _Segment.write(os.path.join(self.directory, name), matrix, categories, severities, refs)
+        self.manifest['segments'] = [name]
+        self._write_manifest()
+        self.segments = [_Segment(os.path.join(self.directory, name))]
+        for stale in old:
+            shutil.rmtree(os.path.join(self.directory, stale), ignore_errors=True)
+
+    def search(self, vector: sp.csr_matrix, k: int = 5) -> List[Dict]:
+        """
+        The ``k`` indexed reports most similar to one TF-IDF row, best first, as
+        dictionaries with ref, similarity, category and severity.
+        """
+        vector = sp.csr_matrix(vector)
+        if k <= 0 or not vector.nnz:
+            return []
+        indices, values = vector.indices, vector.data
+
+        candidates = []
+        for segment in self.segments:
+            docs, scores = segment.top_k(indices, values, k, self.max_postings)
+            candidates.extend(zip(scores.tolist(), [segment] * len(docs), docs.tolist()))
+        if self._pending_size:
+            if self._pending_matrix is None:
+                self._pending_matrix = self._pending_arrays()
+            scores = np.asarray(self._pending_matrix[0] @ vector.T.toarray()).ravel()
+            docs = np.flatnonzero(scores)
+            candidates.extend(zip(scores[docs].tolist(), [None] * len(docs), docs.tolist()))
+
+        candidates.sort(key=lambda candidate: -candidate[0])
+        results = []
+        for similarity, source, i in candidates[:k]:
+            if source is None:
+                _, categories, severities, refs = self._pending_matrix
+                ref = refs[i]
+            else:
+                categories, severities, ref = source.categories, source.severities, source.ref(i)
+            results.append({
+                'ref': ref,
+                'similarity': min(similarity, 1.0),
+                'category': CATEGORIES[categories[i]],
+                'severity': SEVERITY_LEVELS[severities[i]]
+            })
+        return results
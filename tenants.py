@@ -0,0 +1,188 @@
+"""
+Per-tenant lexicon overlays.
+
+Organizations deploying the detector add their own terms (internal slang, names
+of people to protect) or switch off noisy low-severity ones ("hot", "block").
+Instead of a detector per tenant, every tenant shares one detector and its
+compiled base lexicon (the batch rule engine and fuzzy index); a tenant only
+holds a LexiconOverlay, a small rule engine over its added terms plus the base
+columns it suppresses. Both are matched over the same joined corpus and merged
+at query time, so adding a tenant costs only the size of its overlay.
+
+    registry = TenantRegistry(HarassmentDetector())
+    registry.add_tenant('acme', add={'verbal': {'high': ['slangterm']}}, suppress=['hot'])
+    result = registry.analyze_incident(text, tenant='acme')
+
+Overlays can also be loaded from a JSON file mapping tenant names to
+``{"add": {category: {severity: [terms]}}, "suppress": [terms]}``.
+"""
+
+import json
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+import numpy as np
+from scipy import sparse
+
+from batch_rules import SEVERITY_WEIGHTS, BatchRuleEngine, BatchRuleResult
+from detector import HarassmentDetector
+from preprocess import Document, as_document
+
+
+class _MergedLabels(Sequence):
+    """Base column labels followed by the overlay's, without copying the base list."""
+
+    def __init__(self, base: List[str], overlay: List[str]):
+        self.base = base
+        self.overlay = overlay
+
+    def __len__(self) -> int:
+        return len(self.base) + len(self.overlay)
+
+    def __getitem__(self, column):
+        if column < len(self.base):
+            return self.base[column]
+        return self.overlay[column - len(self.base)]
+
+
+class _MergedEngine:
+    """What BatchRuleResult reads from its engine, for base plus overlay columns."""
+
+    def __init__(self, base: BatchRuleEngine, overlay: BatchRuleEngine):
+        self.categories = base.categories
+        self.intent_names = base.intent_names
+        self.labels = _MergedLabels(base.labels, overlay.labels)
+        self._boundary_mask = base._boundary_mask
+
+
+class LexiconOverlay:
+    """
+    A tenant's changes to the base lexicon: terms to add, by category and severity,
+    and base terms to suppress (in every category, fuzzy matches included).
+    Added terms are matched verbatim, like the base keywords.
+    """
+
+    def __init__(self, base: BatchRuleEngine,
+                 add: Optional[Dict[str, Dict[str, List[str]]]] = None,
+                 suppress: Iterable[str] = ()):
+        add = add or {}
+        unknown = [category for category in add if category not in base.categories]
+        if unknown:
+            raise ValueError(f"Unknown categories {unknown}; overlays can only use {base.categories}")
+        for severity_dict in add.values():
+            unknown = [severity for severity in severity_dict if severity not in SEVERITY_WEIGHTS]
+            if unknown:
+                raise ValueError(f"Unknown severities {unknown}; use {list(SEVERITY_WEIGHTS)}")
+
+        # Terms the base lexicon already has under the same category and severity add nothing
+        existing = set(base.columns)
+        keywords = {}
+        for category in base.categories:
+            keywords[category] = {}
+            for severity, terms in add.get(category, {}).items():
+                terms = [term.lower() for term in terms]
+                keywords[category][severity] = [term for term in dict.fromkeys(terms)
+                                                if (category, severity, term) not in existing]
+        # Same category order as the base, so both engines' scores line up column for column
+        self.engine = BatchRuleEngine(keywords, [])
+
+        suppress = {term.lower() for term in suppress}
+        unknown = suppress.difference(term for _, _, term in base.columns)
+        if unknown:
+            raise ValueError(f"Cannot suppress terms that are not in the base lexicon: {sorted(unknown)}")
+        self.suppressed = np.array([column for column, (_, _, term) in enumerate(base.columns)
+                                    if term in suppress], dtype=np.int64)
+        self._suppressed_set = frozenset(self.suppressed.tolist())
+        self._merged = _MergedEngine(base, self.engine)
+
+    def __len__(self) -> int:
+        """Number of added keyword columns."""
+        return len(self.engine.labels)
+
+    def score(self, base: BatchRuleEngine, texts: Sequence,
+              chunk_size: Optional[int] = 50000) -> BatchRuleResult:
+        """BatchRuleEngine.score over the base lexicon with this overlay applied."""
+        if chunk_size and len(texts) > chunk_size:
+            return BatchRuleResult.concatenate([self.score(base, texts[i:i + chunk_size], chunk_size=None)
+                                                for i in range(0, len(texts), chunk_size)])
+
+        documents = [as_document(text) for text in texts]
+        corpus, starts = base.corpus(documents)
+        hits = base.keyword_hits(corpus, starts)
+        if len(self.suppressed):
+            keep = np.ones(hits.shape[1], dtype=bool)
+            keep[self.suppressed] = False
+            hits = hits.multiply(keep).tocsr()
+            hits.eliminate_zeros()
+        added = self.engine.keyword_hits(corpus, starts)
+        intents = base.intent_hits(corpus, starts)
+
+        category_scores, severity = base.keyword_scores(hits)
+        added_scores, added_severity = self.engine.keyword_scores(added)
+        category_scores = category_scores + added_scores
+        severity = np.maximum(severity, added_severity)
+
+        fuzzy = None
+        if base.fuzzy is not None:
+            fuzzy = [[match for match in base.fuzzy.find(document)
+                      if match.column not in self._suppressed_set]
+                     for document in documents]
+            category_scores, severity = base.add_fuzzy(fuzzy, category_scores, severity)
+
+        severity, final_severity = base.escalate(intents, category_scores, severity)
+        # Overlay columns follow the base columns, so their labels come after the base matches
+        merged_hits = sparse.hstack([hits, added], format='csr')
+        return BatchRuleResult(self._merged, merged_hits, intents, category_scores,
+                               severity, final_severity, fuzzy)
+
+
+class TenantRegistry:
+    """One shared detector and a LexiconOverlay per tenant, selected per request."""
+
+    def __init__(self, detector: Optional[HarassmentDetector] = None):
+        self.detector = detector or HarassmentDetector()
+        self.overlays: Dict[str, LexiconOverlay] = {}
+
+    def add_tenant(self, name: str, add: Optional[Dict[str, Dict[str, List[str]]]] = None,
+                   suppress: Iterable[str] = ()) -> LexiconOverlay:
+        """Create (or replace) a tenant's overlay."""
+        overlay = LexiconOverlay(self.detector.batch_rule_engine, add, suppress)
+        self.overlays[name] = overlay
+        return overlay
+
+    def remove_tenant(self, name: str):
+        del self.overlays[name]
+
+    def load(self, path: str) -> 'TenantRegistry':
+        """Add every tenant of a JSON overlay file."""
+        with open(path, encoding='utf-8') as f:
+            for name, spec in json.load(f).items():
+                self.add_tenant(name, spec.get('add'), spec.get('suppress', ()))
+        return self
+
+    def rule_results(self, texts: Sequence, tenant: Optional[str] = None) -> BatchRuleResult:
+        """Batch rule scores under ``tenant``'s overlay (the base lexicon for None)."""
+        engine = self.detector.batch_rule_engine
+        if tenant is None:
+            return engine.score(texts)
+        if tenant not in self.overlays:
+            raise KeyError(f"Unknown tenant {tenant!r}")
+        return self.overlays[tenant].score(engine, texts)
+
+    def analyze_batch(self, texts: List[Union[str, Document]], tenant: Optional[str] = None) -> List[Dict]:
+        """HarassmentDetector.analyze_batch with ``tenant``'s overlay applied to the keyword rules."""
+        if tenant is None:
+            return self.detector.analyze_batch(texts)
+        if not texts:
+            return []
+        documents = [as_document(text) for text in texts]
+        rule_results = self.rule_results(documents, tenant).rule_results()
+        ml_predictions, ml_confidences, ml_features = self.detector._ml_classify_batch(documents)
+        return [
+            self.detector._combine_results(*results)
+            for results in zip(rule_results, ml_predictions, ml_confidences, ml_features)
+        ]
+
+    def analyze_incident(self, text: Union[str, Document], tenant: Optional[str] = None) -> Dict:
+        """HarassmentDetector.analyze_incident with ``tenant``'s overlay applied."""
+        if tenant is None:
+            return self.detector.analyze_incident(text)
+        return self.analyze_batch([text], tenant)[0]
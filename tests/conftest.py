@@ -0,0 +1,39 @@
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from detector import TRAINING_DATA, HarassmentDetector
+
+
+@pytest.fixture(scope='session', autouse=True)
+def model_dir(tmp_path_factory):
+    """Train and pickle models in a scratch directory, never next to the sources."""
+    cwd = os.getcwd()
+    path = tmp_path_factory.mktemp('models')
+    os.chdir(path)
+    yield path
+    os.chdir(cwd)
+
+
+@pytest.fixture(scope='session')
+def detector(model_dir):
+    return HarassmentDetector()
+
+
+@pytest.fixture(scope='session')
+def mixed_texts(detector):
+    """Random keyword and intent soup plus hand-picked edge cases."""
+    words = [term for severity_dict in detector.keywords.values() for terms in severity_dict.values()
+             for term in terms]
+    words += "i you me the he keeps won't stop forced made me without consent asked to stop scared".split()
+    words += ['DIED', 'studies', 'threatens', 'b1tch', 'k i l l you', 'kutta', 'पागल']
+    rng = random.Random(1)
+    texts = [' '.join(rng.choice(words) for _ in range(rng.randint(0, 15))) for _ in range(600)]
+    texts += ["", "Pushed me down and PUSHED", "sexual advances sexual", "I\x00kill you"]
+    texts += [text for text, _ in TRAINING_DATA]
+    return texts
+
@@ -0,0 +1,148 @@
+import pytest
+
+import aggregation
+from aggregation import AggregationIndex, _format_rollup, index_reports
+
+DAY = 86400.0
+T0 = 1_700_000_000.0
+
+
+def report(severity, is_harassment=True, category='Verbal Harassment'):
+    return {'is_harassment': is_harassment, 'category': category, 'severity': severity}
+
+
+@pytest.fixture
+def index():
+    with AggregationIndex(':memory:', half_life_days=30) as index:
+        yield index
+
+
+def test_reporter_history_does_not_escalate_a_new_offender(index):
+    index.add(report('High'), offender='a', reporter='r', timestamp=T0)
+    index.add(report('High'), offender='b', reporter='r', timestamp=T0 + 60)
+    low = report('Low')
+    index.add(low, offender='c', reporter='r', timestamp=T0 + 120)
+    result = index.escalate(low, offender='c', reporter='r', now=T0 + 180)
+    assert result['severity'] == 'Low'
+    assert result['pattern']['reasons'] == [] and result['pattern']['escalated_from'] is None
+    # The reporter's pattern is still there for the moderator
+    assert result['pattern']['reporter']['pattern_severity'] == 'Critical'
+
+
+def test_offender_pattern_escalates(index):
+    index.add(report('High'), offender='o', reporter='r1', timestamp=T0)
+    index.add(report('High'), offender='o', reporter='r2', timestamp=T0 + 60)
+    low = report('Low')
+    index.add(low, offender='o', reporter='r3', timestamp=T0 + 120)
+    result = index.escalate(low, offender='o', reporter='r3', now=T0 + 180)
+    assert result['severity'] == 'Critical'
+    assert result['pattern']['escalated_from'] == 'Low'
+    assert all(reason.startswith('offender o: ') for reason in result['pattern']['reasons'])
+
+
+def test_offender_pattern_decays(index):
+    index.add(report('High'), offender='o', reporter='r1', timestamp=T0)
+    index.add(report('High'), offender='o', reporter='r2', timestamp=T0)
+    assert index.rollup('offender', 'o', now=T0 + 30 * DAY)['high'] == pytest.approx(1.0)
+    low = report('Low')
+    index.add(low, offender='o', reporter='r3', timestamp=T0 + 300 * DAY)
+    assert index.escalate(low, offender='o', reporter='r3', now=T0 + 300 * DAY)['severity'] == 'Low'
+
+
+def test_repeated_reports_from_one_reporter_escalate_without_decay(index):
+    for day in (0, 200, 400):
+        index.add(report('Low'), offender='o', reporter='r', timestamp=T0 + day * DAY)
+    assert index.pair('o', 'r')[:2] == (3, 3)
+    result = index.escalate(report('Low'), offender='o', reporter='r', now=T0 + 400 * DAY)
+    assert result['severity'] == 'High'
+    assert result['pattern']['reasons'] == ['offender o and reporter r: 3 harassment reports from this reporter']
+
+
+def test_non_harassment_is_never_escalated(index):
+    for reporter in ('r1', 'r2', 'r3'):
+        index.add(report('Critical'), offender='o', reporter=reporter, timestamp=T0)
+    result = index.escalate(report('Low', is_harassment=False), offender='o', now=T0)
+    assert result['severity'] == 'Low' and result['pattern']['escalated_from'] is None
+    assert result['pattern']['reasons']
+
+
+def test_unknown_identifiers(index):
+    result = index.escalate(report('Medium'), offender='nobody', reporter='nobody', now=T0)
+    assert result['severity'] == 'Medium'
+    assert result['pattern'] == {'reasons': [], 'escalated_from': None, 'reporter': None}
+
+
+def test_top_orders_by_decayed_harassment(index):
+    index.add(report('Low'), offender='old', reporter='r', timestamp=T0)
+    index.add(report('Low'), offender='old', reporter='s', timestamp=T0)
+    index.add(report('Low'), offender='new', reporter='r', timestamp=T0 + 90 * DAY)
+    assert [rollup['entity'] for rollup in index.top('offender', now=T0 + 90 * DAY)] == ['new', 'old']
+
+
+def test_index_reports_matches_add(detector, index):
+    reports = [("I will kill you", 'o', 'r', T0), ("we had lunch", 'o', 'r', T0 + 1),
+               ("stupid idiot", 'o', None, T0 + 2), ("ignored", None, None, T0 + 3)]
+    assert index_reports(index, reports, detector, batch_size=2) == 3
+    with AggregationIndex(':memory:', half_life_days=30) as expected:
+        for text, offender, reporter, timestamp in reports:
+            expected.add(detector.analyze_incident(text), offender, reporter, timestamp)
+        for kind, entity in (('offender', 'o'), ('reporter', 'r')):
+            assert index.rollup(kind, entity, now=T0 + 10) == pytest.approx(expected.rollup(kind, entity, now=T0 + 10))
+
+
+def test_category_rollups(index):
+    index.add(report('Low'), offender='o', reporter='r', timestamp=T0)
+    index.add(report('High', category='Threats/Intimidation'), offender='o', reporter='r', timestamp=T0)
+    index.add(report('Medium', category='Threats/Intimidation'), offender='o', reporter='s', timestamp=T0)
+    # Non-harassment reports count as reports but not towards categories
+    index.add(report('Low', is_harassment=False, category='Non-Harassment'), offender='o', timestamp=T0)
+    rollup = index.rollup('offender', 'o', now=T0)
+    assert rollup['threat'] == pytest.approx(2.0) and rollup['verbal'] == pytest.approx(1.0)
+    assert rollup['reports'] == pytest.approx(4.0) and rollup['flagged'] == pytest.approx(3.0)
+    assert rollup['category'] == 'Threats/Intimidation'
+    assert 'top category: Threats/Intimidation' in _format_rollup(rollup)
+    assert index.rollup('reporter', 's', now=T0)['category'] == 'Threats/Intimidation'
+    assert index.rollup('reporter', 'r', now=T0)['category'] in ('Verbal Harassment', 'Threats/Intimidation')
+
+
+def test_no_category_without_harassment(index):
+    index.add(report('Low', is_harassment=False, category='Non-Harassment'), offender='o', timestamp=T0)
+    rollup = index.rollup('offender', 'o', now=T0)
+    assert rollup['category'] is None
+    assert 'top category: -' in _format_rollup(rollup)
+
+
+@pytest.fixture
+def rebasing(monkeypatch):
+    """An index with its epoch at T0 that rebases every few half-lives."""
+    monkeypatch.setattr(aggregation, '_MAX_EXPONENT', 3.0)
+    with AggregationIndex(':memory:', half_life_days=1) as index:
+        with index.connection:
+            index.connection.execute("UPDATE meta SET value = ? WHERE key = 'epoch'", (T0,))
+        index.epoch = T0
+        yield index
+
+
+def test_rebase_keeps_counts(rebasing):
+    days = range(0, 20, 2)
+    for day in days:
+        rebasing.add(report('High'), offender='o', reporter='r', timestamp=T0 + day * DAY)
+    assert rebasing.epoch > T0
+    rollup = rebasing.rollup('offender', 'o', now=T0 + 20 * DAY)
+    assert rollup['total_reports'] == len(days)
+    assert rollup['high'] == pytest.approx(sum(2.0 ** -(20 - day) for day in days))
+    assert rollup['verbal'] == pytest.approx(rollup['high'])
+
+
+def test_rebase_joins_the_callers_transaction(rebasing):
+    rebasing.add(report('High'), offender='o', reporter='r', timestamp=T0)
+    scores = {'is_harassment': [True, True, True], 'category': ['Verbal Harassment'] * 3,
+              'severity': ['High', 'High']}
+    # The second report forces a rebase, the third fails: the whole batch must roll back
+    with pytest.raises(IndexError):
+        rebasing.add_batch(scores, ['o', 'o', 'o'], ['r', 'r', 'r'], [T0 + DAY, T0 + 10 * DAY, T0 + 11 * DAY])
+    assert rebasing.epoch == T0
+    assert rebasing.connection.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone() == (T0,)
+    rollup = rebasing.rollup('offender', 'o', now=T0)
+    assert rollup['total_reports'] == 1 and rollup['high'] == pytest.approx(1.0)
+    assert rebasing.pair('o', 'r')[:2] == (1, 1)
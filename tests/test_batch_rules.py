@@ -0,0 +1,49 @@
+from batch_rules import SEVERITY_LEVELS
+
+
+def test_rule_results_match_rule_based_check(detector, mixed_texts):
+    results = detector.batch_rule_engine.score(mixed_texts)
+    for i, text in enumerate(mixed_texts):
+        assert results.rule_result(i) == detector._rule_based_check(text), text
+
+
+def test_chunked_scoring_matches_single_pass(detector, mixed_texts):
+    engine = detector.batch_rule_engine
+    whole = engine.score(mixed_texts, chunk_size=None)
+    chunked = engine.score(mixed_texts, chunk_size=97)
+    assert whole.rule_results() == chunked.rule_results()
+    assert (whole.final_severity == chunked.final_severity).all()
+
+
+def test_final_severity_applies_critical_rules(detector, mixed_texts):
+    results = detector.batch_rule_engine.score(mixed_texts)
+    for i, text in enumerate(mixed_texts):
+        rule_result = detector._rule_based_check(text)
+        expected = rule_result['severity']
+        if rule_result['score'] > 20 or len(rule_result['category_scores']) >= 3:
+            expected = 'Critical'
+        assert SEVERITY_LEVELS[results.final_severity[i]] == expected, text
+
+
+def test_analyze_batch_matches_analyze_incident(detector, mixed_texts):
+    texts = mixed_texts[:200] + mixed_texts[-40:]
+    assert detector.analyze_batch(texts) == [detector.analyze_incident(text) for text in texts]
+
+
+def test_score_batch_matches_analyze_incident(detector, mixed_texts):
+    scores = detector.score_batch(mixed_texts)
+    for i, text in enumerate(mixed_texts):
+        result = detector.analyze_incident(text)
+        for field in ('is_harassment', 'category', 'severity', 'rule_score', 'ml_prediction'):
+            assert scores[field][i] == result[field], (field, text)
+        assert abs(scores['confidence_score'][i] - result['confidence_score']) < 1e-12
+
+
+def test_empty_batch(detector):
+    results = detector.batch_rule_engine.score([])
+    assert len(results) == 0 and results.rule_results() == []
+    assert results.hits.shape[0] == results.intents.shape[0] == results.final_severity.shape[0] == 0
+    assert detector.analyze_batch([]) == []
+    expected = detector.score_batch(["one report"])
+    for field, values in detector.score_batch([]).items():
+        assert values.shape == (0,) and values.dtype == expected[field].dtype, field
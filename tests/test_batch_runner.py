@@ -0,0 +1,64 @@
+import gc
+import json
+import os
+
+import pytest
+
+from batch_runner import STATE, BatchJob, WorkerLease, _shard_path, run
+
+
+@pytest.fixture
+def job(tmp_path):
+    reports = tmp_path / 'reports.jsonl'
+    reports.write_text(''.join(json.dumps({'id': i, 'text': f"report {i}: he keeps following me"}) + '\n'
+                               for i in range(5)))
+    return BatchJob.create(str(tmp_path / 'job'), str(reports), shard_size=2)
+
+
+def _set_state(job, state):
+    with open(os.path.join(job.job_dir, STATE), 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+
+
+def test_claim_by_reused_pid_is_stale(job):
+    # A claim from before worker tokens, or by a dead worker whose PID now belongs to a live process
+    _set_state(job, {'0': {'status': 'claimed', 'worker': 1}})
+    assert job.claim() == 0
+
+
+def test_claim_by_live_worker_is_kept_until_it_exits(job):
+    other = WorkerLease(job.job_dir)
+    _set_state(job, {'0': {'status': 'claimed', 'worker': other.token}})
+    assert job.claim() == 1
+    other.release()
+    assert BatchJob(job.job_dir).claim() == 0
+
+
+def test_result_without_complete_is_recorded_as_done(job, detector):
+    job.process_shard(detector, 0)
+    assert job.claim() == 1
+    progress = job.progress()
+    assert progress['shards_done'] == 1 and progress['records_done'] == 2
+
+
+def test_run_finishes_stale_and_recovered_shards(job, detector):
+    job.process_shard(detector, 2)
+    _set_state(job, {'0': {'status': 'claimed', 'worker': 1}})
+    progress = run(job.job_dir, workers=1, report_interval=0.1)
+    assert progress['shards_done'] == progress['shards_total'] == 3
+    assert progress['records_done'] == 5
+    assert all(os.path.exists(_shard_path(job.job_dir, shard, 'result')) for shard in range(3))
+    assert sorted(record['id'] for record in job.results()) == [str(i) for i in range(5)]
+    # preload's gc.freeze() does not outlive the run
+    assert gc.get_freeze_count() == 0
+
+
+def test_run_raises_when_shards_stay_claimed(job):
+    other = WorkerLease(job.job_dir)
+    _set_state(job, {'0': {'status': 'claimed', 'worker': other.token}})
+    try:
+        with pytest.raises(RuntimeError, match='2/3 shards'):
+            run(job.job_dir, workers=1, report_interval=0.1)
+    finally:
+        other.release()
+    assert gc.get_freeze_count() == 0
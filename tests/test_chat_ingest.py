@@ -0,0 +1,179 @@
+import io
+import json
+import zipfile
+from datetime import date, datetime
+
+import pytest
+
+from chat_ingest import (_WHATSAPP_LINE, ChatMessage, SeverityTimeline, _json_array_items,
+                         _whatsapp_timestamp, build_timeline, read_export, read_mbox,
+                         read_telegram, read_whatsapp)
+
+ANDROID = """\
+31/12/20, 9:15 pm - Messages and calls are end-to-end encrypted. No one outside of this chat can read them.
+31/12/20, 9:15 pm - Alice: you are an idiot
+and I will hurt you
+31/12/20, 9:16 pm - Bob: <Media omitted>
+31/12/20, 9:17 pm - Alice added Carol
+1/1/21, 10:05 am - Bob: leave me alone
+"""
+
+IOS = """\
+﻿[31.12.20, 21:15:03] Alice: you are an idiot
+‎[31.12.20, 21:16:00] Bob: ‎image omitted
+[01.01.21, 10:05:00] Bob: leave me alone
+second line
+"""
+
+TELEGRAM = {
+    'name': 'Alice',
+    'messages': [
+        {'id': 1, 'type': 'service', 'date': '2021-01-01T10:00:00', 'action': 'create_group'},
+        {'id': 2, 'type': 'message', 'date': '2021-01-01T10:01:00', 'from': 'Alice',
+         'text': ['you are ', {'type': 'bold', 'text': 'stupid'}, ' and ', {'type': 'link', 'text': 'x.com'}]},
+        {'id': 3, 'type': 'message', 'date': '2021-01-01T10:02:00', 'from': 'Bob', 'text': '',
+         'photo': 'photos/1.jpg'},
+        {'id': 4, 'type': 'message', 'date': 'not a date', 'from': None, 'from_id': 'user42',
+         'text': 'leave me alone ]["messages": ['},
+    ]
+}
+
+MBOX = b"""\
+From alice@example.com Fri Jan  1 10:00:00 2021
+From: Alice <Alice@Example.com>
+Subject: hello
+Date: Fri, 01 Jan 2021 10:00:00 +0000
+
+I will kill you
+>From now on you do as I say
+> an earlier quoted reply
+
+From bob@example.com Sat Jan  2 11:00:00 2021
+From: =?utf-8?b?Qm9i?= <bob@example.com>
+Subject: =?utf-8?q?re=3A_hello?=
+Date: Sat, 02 Jan 2021 11:00:00 +0000
+Content-Type: text/html; charset=utf-8
+
+<p>Please stop &amp; leave me alone</p>
+
+From carol@example.com Sun Jan  3 12:00:00 2021
+From: carol@example.com
+
+"""
+
+
+def _stamp(line, dayfirst):
+    return _whatsapp_timestamp(_WHATSAPP_LINE.match(line), dayfirst)
+
+
+@pytest.mark.parametrize('line, dayfirst, expected', [
+    ("02/03/21, 10:00 - A: x", True, datetime(2021, 3, 2, 10, 0)),
+    ("02/03/21, 10:00 - A: x", False, datetime(2021, 2, 3, 10, 0)),
+    # An impossible month falls back to the other order, in both directions
+    ("13/01/21, 10:00 - A: x", False, datetime(2021, 1, 13, 10, 0)),
+    ("01/13/21, 10:00 - A: x", True, datetime(2021, 1, 13, 10, 0)),
+    ("2021-01-13, 10:00 - A: x", False, datetime(2021, 1, 13, 10, 0)),
+    ("[13.01.21, 9:05:07 PM] A: x", True, datetime(2021, 1, 13, 21, 5, 7)),
+    ("12/31/20, 12:30 am - A: x", False, datetime(2020, 12, 31, 0, 30)),
+    ("31/31/21, 10:00 - A: x", True, None),
+])
+def test_whatsapp_timestamps(line, dayfirst, expected):
+    assert _stamp(line, dayfirst) == expected
+
+
+@pytest.mark.parametrize('export', [ANDROID, IOS])
+def test_whatsapp_messages(export):
+    messages = list(read_whatsapp(io.StringIO(export)))
+    assert [(m.sender, m.text) for m in messages] == [
+        ('Alice', 'you are an idiot\nand I will hurt you' if export is ANDROID else 'you are an idiot'),
+        ('Bob', 'leave me alone' if export is ANDROID else 'leave me alone\nsecond line'),
+    ]
+    assert messages[0].timestamp.date() == date(2020, 12, 31)
+    assert messages[1].timestamp == (datetime(2021, 1, 1, 10, 5) if export is ANDROID
+                                     else datetime(2021, 1, 1, 10, 5, 0))
+
+
+def test_whatsapp_zip_export(tmp_path):
+    path = tmp_path / 'WhatsApp Chat.zip'
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('notes.txt', "not the chat")
+        archive.writestr('_chat.txt', IOS)
+    assert [m.sender for m in read_export(str(path))] == ['Alice', 'Bob']
+
+
+def test_telegram_entities_and_skipped_messages():
+    messages = list(read_telegram(io.StringIO(json.dumps(TELEGRAM))))
+    assert messages == [
+        ChatMessage(datetime(2021, 1, 1, 10, 1), 'Alice', 'you are stupid and x.com'),
+        ChatMessage(None, 'user42', 'leave me alone ]["messages": ['),
+    ]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 7, 64, 1 << 16])
+def test_telegram_array_split_across_chunks(chunk_size):
+    text = json.dumps(TELEGRAM, indent=1)
+    assert list(_json_array_items(io.StringIO(text), 'messages', chunk_size)) == TELEGRAM['messages']
+
+
+def test_telegram_full_export_reads_every_chat():
+    export = {'chats': {'list': [{'name': 'a', 'messages': TELEGRAM['messages']},
+                                 {'name': 'b', 'messages': [TELEGRAM['messages'][1]]}]}}
+    assert len(list(read_telegram(io.BytesIO(json.dumps(export).encode())))) == 3
+
+
+def test_unterminated_telegram_array():
+    with pytest.raises(ValueError, match='Unterminated'):
+        list(_json_array_items(io.StringIO('{"messages": [1, 2'), 'messages', 4))
+
+
+def test_mbox_split_on_from_lines(tmp_path):
+    path = tmp_path / 'mail.mbox'
+    path.write_bytes(MBOX)
+    messages = list(read_export(str(path)))
+    assert messages == [
+        ChatMessage(datetime.fromisoformat('2021-01-01T10:00:00+00:00'), 'alice@example.com',
+                    'hello\nI will kill you\nFrom now on you do as I say\n'),
+        ChatMessage(datetime.fromisoformat('2021-01-02T11:00:00+00:00'), 'bob@example.com',
+                    're: hello\n Please stop & leave me alone \n'),
+    ]
+    assert list(read_mbox(io.BytesIO(MBOX))) == messages
+
+
+def _scores(rows):
+    flagged, severity, category = zip(*rows)
+    return {'is_harassment': list(flagged), 'severity': list(severity), 'category': list(category)}
+
+
+def test_severity_timeline_rollups():
+    day1, day2 = datetime(2021, 1, 1, 9), datetime(2021, 1, 2, 9)
+    messages = [ChatMessage(day1, 'a', ''), ChatMessage(day1, 'a', ''), ChatMessage(day1, 'b', ''),
+                ChatMessage(day2, 'a', ''), ChatMessage(None, 'b', '')]
+    timeline = SeverityTimeline()
+    timeline.add(messages[:3], _scores([(True, 'High', 'Threats/Intimidation'), (False, 'Low', 'Unclear'),
+                                        (True, 'Low', 'Verbal Harassment')]))
+    timeline.add(messages[3:], _scores([(True, 'Critical', 'Threats/Intimidation'),
+                                        (True, 'Medium', 'Verbal Harassment')]))
+
+    rows = timeline.rows()
+    assert [(row['date'], row['sender'], row['messages'], row['flagged']) for row in rows] == [
+        (date(2021, 1, 1), 'a', 2, 1), (date(2021, 1, 1), 'b', 1, 1),
+        (date(2021, 1, 2), 'a', 1, 1), (None, 'b', 1, 1)]
+    assert rows[0]['High'] == 1 and rows[0]['Low'] == 0 and rows[0]['max_severity'] == 'High'
+
+    senders = {row['sender']: row for row in timeline.by_sender()}
+    assert senders['a']['flagged'] == 2 and senders['a']['max_severity'] == 'Critical'
+    assert senders['a']['top_category'] == 'Threats/Intimidation'
+    assert (senders['a']['first_flagged'], senders['a']['last_flagged']) == (date(2021, 1, 1), date(2021, 1, 2))
+    # Undated messages count but have no day
+    assert (senders['b']['first_flagged'], senders['b']['last_flagged']) == (date(2021, 1, 1), date(2021, 1, 1))
+
+    days = timeline.by_day()
+    assert [(row['date'], row['messages'], row['flagged']) for row in days] == [
+        (date(2021, 1, 1), 3, 2), (date(2021, 1, 2), 1, 1), (None, 1, 1)]
+
+
+def test_build_timeline_matches_score_batch(detector):
+    messages = list(read_whatsapp(io.StringIO(ANDROID)))
+    timeline = build_timeline(detector, messages, batch_size=1)
+    scores = detector.score_batch([m.text for m in messages])
+    assert sum(row['flagged'] for row in timeline.rows()) == int(scores['is_harassment'].sum())
@@ -0,0 +1,68 @@
+import copy
+
+import numpy as np
+import pytest
+
+from compact_model import CompactNB, compact_model, use_model
+from detector import TRAINING_DATA
+from preprocess import Document, vectorize_documents
+
+TEXTS = [text for text, _ in TRAINING_DATA]
+LABELS = [label for _, label in TRAINING_DATA]
+
+
+@pytest.fixture(scope='module')
+def features(detector):
+    return vectorize_documents(detector.model.named_steps['tfidf'], [Document(text) for text in TEXTS])
+
+
+def test_float32_matches_multinomial_nb(detector, features, mixed_texts):
+    classifier = detector.model.named_steps['classifier']
+    compact = CompactNB(classifier, dtype='float32')
+    np.testing.assert_allclose(compact.predict_proba(features), classifier.predict_proba(features),
+                               rtol=1e-4, atol=1e-6)
+    others = vectorize_documents(detector.model.named_steps['tfidf'], [Document(text) for text in mixed_texts])
+    np.testing.assert_allclose(compact.predict_proba(others), classifier.predict_proba(others),
+                               rtol=1e-4, atol=1e-6)
+
+
+def test_int8_predictions_agree_on_training_set(detector, features):
+    classifier = detector.model.named_steps['classifier']
+    compact = CompactNB(classifier, dtype='int8')
+    assert compact._values.dtype == np.int8
+    assert (compact.predict(features) == classifier.predict(features)).all()
+    np.testing.assert_allclose(compact.feature_log_prob_, classifier.feature_log_prob_,
+                               atol=float(compact._scale.max()))
+
+
+def test_unsupported_dtype(detector):
+    with pytest.raises(ValueError, match='float16'):
+        CompactNB(detector.model.named_steps['classifier'], dtype='float16')
+
+
+@pytest.mark.parametrize('keep', [1.0, 0.5, 40])
+def test_flat_vocabulary_idf_matches_tfidf_transform(detector, mixed_texts, keep):
+    compact = compact_model(detector.model, TEXTS, LABELS, keep=keep, dtype='float32')
+    vectorizer = compact.named_steps['tfidf']
+    documents = [Document(text) for text in mixed_texts]
+    # The same vectorizer with a plain dict vocabulary goes through TfidfVectorizer.transform
+    plain = copy.copy(vectorizer)
+    plain.vocabulary_ = dict(vectorizer.vocabulary_)
+    flat = vectorize_documents(vectorizer, documents)
+    expected = plain.transform(documents)
+    assert flat.shape == expected.shape
+    np.testing.assert_allclose(flat.toarray(), expected.toarray(), rtol=1e-5, atol=1e-7)
+    assert len(compact.predict(mixed_texts[:20])) == 20
+    if keep == 1.0:
+        original = detector.model.named_steps['tfidf'].transform(documents)
+        np.testing.assert_allclose(flat.toarray(), original.toarray(), rtol=1e-5, atol=1e-7)
+
+
+def test_compact_pipeline_in_detector(model_dir, mixed_texts):
+    from detector import HarassmentDetector
+    detector = HarassmentDetector()
+    full = detector.score_batch(TEXTS)
+    use_model(detector, compact_model(detector.model, TEXTS, LABELS, keep=1.0, dtype='int8'))
+    compact = detector.score_batch(TEXTS)
+    assert (compact['ml_prediction'] == full['ml_prediction']).all()
+    assert detector.analyze_incident(TEXTS[0])['ml_top_features']
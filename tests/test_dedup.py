@@ -0,0 +1,53 @@
+import random
+import tracemalloc
+import zlib
+
+import numpy as np
+
+from dedup import _PRIME, MinHasher, NearDuplicateIndex, analyze_deduplicated
+from preprocess import Document
+
+
+def _reference_signature(hasher, document):
+    hashes = np.array([zlib.crc32(shingle.encode('utf-8')) for shingle in set(hasher.shingles(document))],
+                      dtype=np.uint64) % _PRIME
+    return ((hasher._a[:, None] * hashes[None, :] + hasher._b[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+def _random_texts(n, words, seed=0):
+    rng = random.Random(seed)
+    vocabulary = [f"word{i}" for i in range(500)]
+    return [' '.join(rng.choice(vocabulary) for _ in range(rng.randint(0, words))) for _ in range(n)]
+
+
+def test_signatures_match_per_document_minhash():
+    hasher = MinHasher(num_perm=64)
+    # Long documents straddle the hashing chunks; empty and one-word ones have a single shingle
+    documents = [Document(text) for text in _random_texts(60, 3000) + ["", "hello", "a b c"]]
+    signatures = hasher.signatures(documents)
+    for document, signature in zip(documents, signatures):
+        assert (signature == _reference_signature(hasher, document)).all()
+
+
+def test_signature_memory_is_bounded():
+    hasher = MinHasher()
+    documents = [Document(text, max_length=5000) for text in _random_texts(300, 1000, seed=1)]
+    hasher.signatures(documents[:1])
+    tracemalloc.start()
+    hasher.signatures(documents)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # Unchunked, this batch needed several hundred megabytes of permuted hashes
+    assert peak < 64 * 2 ** 20
+
+
+def test_near_duplicates_share_a_cluster(detector):
+    base = "my manager keeps sending me messages late at night and will not stop even after i asked"
+    texts = [base, base + " again", "completely different report about a stolen bicycle", base]
+    index = NearDuplicateIndex(threshold=0.7)
+    results = list(analyze_deduplicated(detector, texts, index, batch_size=2))
+    assert results[0]['cluster_id'] == results[1]['cluster_id'] == results[3]['cluster_id']
+    assert results[2]['cluster_id'] != results[0]['cluster_id']
+    assert [result['is_duplicate'] for result in results] == [False, True, False, True]
+    expected = detector.analyze_incident(base)
+    assert all(results[i]['severity'] == expected['severity'] for i in (0, 1, 3))
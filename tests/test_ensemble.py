@@ -0,0 +1,137 @@
+import copy
+import os
+import pickle
+import shutil
+
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.pipeline import Pipeline
+
+import detector as detector_module
+from detector import TRAINING_DATA, HarassmentDetector
+from ensemble import ENSEMBLE_MODEL_PATH, StackedLinearEnsemble, train_ensemble, vocabulary_fingerprint
+from preprocess import Document, vectorize_documents
+
+TEXTS = [text for text, _ in TRAINING_DATA]
+LABELS = [label for _, label in TRAINING_DATA]
+
+
+@pytest.fixture(scope='module')
+def ensemble(detector):
+    return train_ensemble(detector.model, TEXTS, LABELS)
+
+
+@pytest.fixture(scope='module')
+def features(detector, mixed_texts):
+    return vectorize_documents(detector.model.named_steps['tfidf'], [Document(text) for text in mixed_texts])
+
+
+def test_nb_block_reproduces_predict_proba(detector, ensemble, features):
+    nb = detector.model.named_steps['classifier']
+    np.testing.assert_allclose(ensemble.model_probabilities(features)[:, 0], nb.predict_proba(features),
+                               rtol=1e-9, atol=1e-12)
+    alone = StackedLinearEnsemble({'nb': nb})
+    np.testing.assert_allclose(alone.predict_proba(features), nb.predict_proba(features), rtol=1e-9, atol=1e-12)
+    assert (alone.predict(features) == nb.predict(features)).all()
+
+
+def test_binary_linear_block_reproduces_predict_proba(detector, features):
+    X = vectorize_documents(detector.model.named_steps['tfidf'], [Document(text) for text in TEXTS])
+    binary = [label if label == 'non-harassment' else 'harassment' for label in LABELS]
+    model = LogisticRegression(max_iter=2000).fit(X, binary)
+    np.testing.assert_allclose(StackedLinearEnsemble({'logreg': model}).predict_proba(features),
+                               model.predict_proba(features), rtol=1e-9, atol=1e-12)
+
+
+def test_blend_weights(ensemble, features):
+    per_model = ensemble.model_probabilities(features)
+    assert per_model.shape == (features.shape[0], 3, len(ensemble.classes_))
+    np.testing.assert_allclose(per_model.sum(axis=2), 1.0)
+    np.testing.assert_allclose(ensemble.predict_proba(features), per_model.mean(axis=1))
+
+    # Weights can be changed after training; missing names count as 0
+    weighted = copy.copy(ensemble)
+    weighted.weights = {'nb': 3.0, 'logreg': 1.0}
+    np.testing.assert_allclose(weighted.predict_proba(features),
+                               0.75 * per_model[:, 0] + 0.25 * per_model[:, 1])
+    coef = weighted._coef.T.reshape(3, len(ensemble.classes_), -1)
+    np.testing.assert_allclose(weighted.coef_, 0.75 * coef[0] + 0.25 * coef[1])
+
+    weighted.weights = {'nb': 0.0, 'logreg': 0.0, 'svm': 0.0}
+    with pytest.raises(ValueError, match='positive'):
+        weighted.predict_proba(features)
+
+
+def test_models_must_share_classes(detector):
+    X = vectorize_documents(detector.model.named_steps['tfidf'], [Document(text) for text in TEXTS[:6]])
+    other = MultinomialNB().fit(X, ['a', 'b'] * 3)
+    with pytest.raises(ValueError, match='different classes'):
+        StackedLinearEnsemble({'nb': detector.model.named_steps['classifier'], 'other': other})
+
+
+def test_matches(detector, ensemble):
+    assert ensemble.matches(detector.model)
+    assert ensemble.fingerprint == vocabulary_fingerprint(detector.model.named_steps['tfidf'])
+    retrained = Pipeline([('tfidf', TfidfVectorizer()), ('classifier', MultinomialNB())]).fit(TEXTS[:-5], LABELS[:-5])
+    assert not ensemble.matches(retrained)
+    relabelled = Pipeline([('tfidf', detector.model.named_steps['tfidf']),
+                           ('classifier', MultinomialNB())])
+    relabelled.named_steps['classifier'].fit(vectorize_documents(relabelled.named_steps['tfidf'],
+                                                                 [Document(text) for text in TEXTS]),
+                                             ['x' if label == 'threat' else label for label in LABELS])
+    assert not ensemble.matches(relabelled)
+
+
+@pytest.fixture
+def scratch(model_dir, tmp_path, monkeypatch):
+    """A working directory with the trained base model but no ensemble pickle."""
+    shutil.copy(os.path.join(model_dir, 'harassment_model.pkl'), tmp_path)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def _counting_trainer(monkeypatch):
+    calls = []
+    monkeypatch.setattr(detector_module, 'train_ensemble',
+                        lambda *args: calls.append(1) or train_ensemble(*args))
+    return calls
+
+
+def test_ensemble_is_trained_once_and_reloaded(scratch, monkeypatch):
+    calls = _counting_trainer(monkeypatch)
+    first = HarassmentDetector()
+    first.ensemble = True
+    result = first.analyze_incident("I will kill you")
+    assert calls == [1] and os.path.exists(ENSEMBLE_MODEL_PATH)
+    assert isinstance(first.ml_model.named_steps['classifier'], StackedLinearEnsemble)
+
+    second = HarassmentDetector()
+    second.ensemble = True
+    assert second.analyze_incident("I will kill you") == result
+    assert calls == [1]
+
+
+def test_stale_ensemble_is_retrained(scratch, detector, monkeypatch):
+    stale = train_ensemble(detector.model, TEXTS, LABELS)
+    stale.fingerprint += 1
+    with open(ENSEMBLE_MODEL_PATH, 'wb') as f:
+        pickle.dump(stale, f)
+    calls = _counting_trainer(monkeypatch)
+    fresh = HarassmentDetector()
+    fresh.ensemble = True
+    assert fresh.ml_model.named_steps['classifier'].matches(fresh.model)
+    assert calls == [1]
+    with open(ENSEMBLE_MODEL_PATH, 'rb') as f:
+        assert pickle.load(f).matches(fresh.model)
+
+
+def test_switching_the_ensemble_off_restores_naive_bayes(scratch, detector):
+    fresh = HarassmentDetector()
+    fresh.ensemble = True
+    fresh.analyze_incident("you are stupid")
+    fresh.ensemble = False
+    assert fresh.ml_model is fresh.model
+    assert fresh.analyze_incident("you are stupid") == detector.analyze_incident("you are stupid")
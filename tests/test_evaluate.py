@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+import evaluate
+
+
+def _report(name, critical_recall=None, critical_agreement=None):
+    return {'name': name, 'critical_recall': critical_recall, 'critical_agreement': critical_agreement}
+
+
+def test_regressions_against_critical_labels():
+    reports = [_report('hybrid', 1.0, 1.0), _report('cascade', 0.5, 1.0), _report('ml-only')]
+    assert [r.split(':')[0] for r in evaluate.critical_regressions(reports)] == ['cascade']
+
+
+def test_regressions_against_baseline_predictions_without_labels():
+    reports = [_report('hybrid', None, 1.0), _report('rules-only', None, 0.75), _report('ml-only')]
+    assert [r.split(':')[0] for r in evaluate.critical_regressions(reports)] == ['rules-only']
+
+
+def test_missing_baseline_is_an_error():
+    with pytest.raises(ValueError):
+        evaluate.critical_regressions([_report('cascade', 1.0)])
+
+
+def test_rule_configurations_report_unclear_like_hybrid(detector):
+    texts = ["this happens every day and again and again", "he keeps doing it constantly"]
+    hybrid = evaluate._hybrid(detector, texts)
+    assert evaluate._rules_only(detector, texts) == hybrid
+    assert [category for category, _ in evaluate._cascade(detector, texts)] == ['Unclear', 'Unclear']
+
+
+def test_default_run_checks_critical_recall(capsys):
+    assert evaluate.main(['--latency-samples', '1', '--configs', 'cascade', '--json']) == 0
+    output = json.loads(capsys.readouterr().out)
+    assert [r['name'] for r in output['reports']] == ['cascade', 'hybrid']
+    assert output['critical_checked']
+    assert all(r['critical_recall'] == 1.0 for r in output['reports'])
+
+
+def test_run_without_any_critical_case_fails(tmp_path, capsys):
+    path = tmp_path / 'labelled.jsonl'
+    path.write_text(json.dumps({'text': 'We disagreed about the project plan', 'category': 'non-harassment'}) + '\n')
+    assert evaluate.main([str(path), '--no-training-data', '--latency-samples', '1',
+                          '--configs', 'rules-only']) == 1
+    assert 'could not be checked' in capsys.readouterr().err
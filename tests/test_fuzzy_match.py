@@ -0,0 +1,62 @@
+import pytest
+
+from batch_rules import SEVERITY_WEIGHTS
+from fuzzy_match import EDIT_DISCOUNT, NORMALIZATION_CONFIDENCE
+
+
+@pytest.fixture(scope='module')
+def matcher(detector):
+    return detector.fuzzy_matcher
+
+
+@pytest.mark.parametrize('text, keyword, matched, distance', [
+    ("you b1tch", 'bitch', 'b1tch', 0),
+    ("f*ck you", 'fuck you', 'f*ck you', 0),
+    ("k i l l you", 'kill you', 'k i l l you', 0),
+    ("you bastrad", 'bastard', 'bastrad', 1),
+    ("such a sluuut", 'slut', 'sluuut', 0),
+    ("I will k1ll you, idiot", 'kill you', 'k1ll you', 0),
+])
+def test_documented_spellings(matcher, text, keyword, matched, distance):
+    matches = matcher.find(text)
+    assert [(m.keyword, m.matched, m.distance) for m in matches] == [(keyword, matched, distance)]
+
+
+@pytest.mark.parametrize('text', [
+    "I have eaten and showed the report to my manager",
+    "We met at 10:30 in room 4B with 3 people and 5 items",
+    "Call me on 555-0142 after 7 or at 9.30",
+    "The 2nd floor printer is out of toner again",
+    "",
+])
+def test_clean_text_and_numbers_do_not_match(matcher, text):
+    assert matcher.find(text) == []
+
+
+def test_confidence_and_weight_are_discounted(matcher):
+    exact, = matcher.find("you b1tch")
+    assert exact.confidence == NORMALIZATION_CONFIDENCE
+    assert exact.weight == round(SEVERITY_WEIGHTS['high'] * NORMALIZATION_CONFIDENCE)
+    edited, = matcher.find("you bastrad")
+    assert edited.confidence == round(NORMALIZATION_CONFIDENCE * EDIT_DISCOUNT, 2)
+    assert edited.weight == round(SEVERITY_WEIGHTS['high'] * edited.confidence)
+    assert 1 <= edited.weight < exact.weight < SEVERITY_WEIGHTS['high']
+
+
+@pytest.mark.parametrize('text', ["you bitch b1tch", "I will kill you, k i l l you", "bitch"])
+def test_keywords_matched_verbatim_are_skipped(matcher, text):
+    assert matcher.find(text) == []
+
+
+def test_rule_check_uses_discounted_weight(detector):
+    result = detector._rule_based_check("you b1tch")
+    assert result['score'] == round(SEVERITY_WEIGHTS['high'] * NORMALIZATION_CONFIDENCE)
+    assert result['severity'] == 'High'
+    assert result['fuzzy_matches'][0]['matched'] == 'b1tch'
+    assert detector._rule_based_check("you bitch")['score'] == SEVERITY_WEIGHTS['high']
+
+
+def test_fuzzy_matching_can_be_switched_off(detector, monkeypatch):
+    monkeypatch.setattr(detector, 'fuzzy_matching', False)
+    assert detector._rule_based_check("you b1tch")['score'] == 0
+    assert detector.batch_rule_engine.score(["you b1tch"]).rule_result(0)['score'] == 0
@@ -0,0 +1,30 @@
+import os
+
+import pytest
+
+from detector import HarassmentDetector
+from memory import compact_detector, fork_workers
+from vocabulary import FlatVocabulary
+
+
+def test_compacted_detector_gives_the_same_results(detector, mixed_texts):
+    compacted = compact_detector(HarassmentDetector())
+    assert isinstance(compacted.model.named_steps['tfidf'].vocabulary_, FlatVocabulary)
+    texts = mixed_texts[:100] + mixed_texts[-30:]
+    for actual, expected in zip(compacted.analyze_batch(texts), detector.analyze_batch(texts)):
+        # The flat vocabulary's TF-IDF rows may differ from sklearn's in the last bit,
+        # which can reorder n-grams with tied contributions (and the phrases the explanation quotes)
+        features, expected_features = actual.pop('ml_top_features'), expected.pop('ml_top_features')
+        assert sorted(weight for _, weight in features) == pytest.approx(
+            sorted(weight for _, weight in expected_features))
+        del actual['explanation'], expected['explanation']
+        assert actual.pop('confidence_score') == pytest.approx(expected.pop('confidence_score'))
+        assert actual == expected
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork') or not os.path.exists('/proc/self/smaps_rollup'),
+                    reason='needs fork and /proc')
+def test_forked_workers_report_memory():
+    stats = fork_workers(2, requests=5)
+    assert len(stats) == 2
+    assert all(worker['uss'] > 0 and worker['rss'] >= worker['uss'] for worker in stats)
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from preprocess import as_document, vectorize_documents
+
+
+def _dense_weights(detector, text):
+    """Reference: every present feature's weight, from the dense row and the full table."""
+    model = detector.ml_model
+    classifier = model.named_steps['classifier']
+    row = vectorize_documents(model.named_steps['tfidf'], [as_document(text)]).toarray()[0]
+    class_index = classifier.predict_proba(row[None, :]).argmax()
+    table = classifier.feature_log_prob_
+    weights = row * (table - table.mean(axis=0))[class_index]
+    names = model.named_steps['tfidf'].get_feature_names_out()
+    return {str(names[j]): float(weights[j]) for j in np.flatnonzero(row)}
+
+
+@pytest.mark.parametrize('k', [1, 3, 5, 50])
+def test_top_features_match_dense_reference(detector, mixed_texts, monkeypatch, k):
+    monkeypatch.setattr(detector, 'ml_top_k', k)
+    for text in mixed_texts[::7]:
+        _, _, features = detector._ml_classify(as_document(text))
+        weights = _dense_weights(detector, text)
+        expected = sorted((w for w in weights.values() if w > 0), reverse=True)[:k]
+        np.testing.assert_allclose([w for _, w in features], expected, rtol=1e-9)
+        # Tied weights may be broken either way, but each name must carry its own weight
+        for name, weight in features:
+            assert weight == pytest.approx(weights[name], rel=1e-9), (text, name)
+
+
+def test_top_features_are_sorted_and_positive(detector, mixed_texts):
+    for text in mixed_texts:
+        features = detector.analyze_incident(text)['ml_top_features']
+        weights = [weight for _, weight in features]
+        assert weights == sorted(weights, reverse=True), text
+        assert all(weight > 0 for weight in weights)
+        assert len(features) <= detector.ml_top_k
+
+
+def test_batch_contributions_match_single(detector, mixed_texts):
+    texts = mixed_texts[:100]
+    _, _, batch = detector._ml_classify_batch([as_document(text) for text in texts])
+    assert batch == [detector._ml_classify(as_document(text))[2] for text in texts]
+
+
+def test_no_features_without_vocabulary_hits(detector, monkeypatch):
+    assert detector._ml_classify(as_document(""))[2] == []
+    monkeypatch.setattr(detector, 'ml_top_k', 0)
+    assert detector._ml_classify(as_document("he keeps following me"))[2] == []
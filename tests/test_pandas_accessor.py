@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pandas_accessor import CATEGORY_DTYPE, SEVERITY_DTYPE, analyze_chunks, score_series
+
+EXPECTED_DTYPES = {
+    'is_harassment': np.dtype(bool),
+    'category': CATEGORY_DTYPE,
+    'severity': SEVERITY_DTYPE,
+    'confidence': np.dtype(np.float32),
+    'rule_score': np.dtype(np.int32),
+}
+
+
+@pytest.fixture
+def frame(mixed_texts):
+    texts = mixed_texts[:120] + mixed_texts[-30:]
+    return pd.DataFrame({'text': texts, 'n': range(len(texts))}, index=[f"row{i}" for i in range(len(texts))])
+
+
+def _assert_dtypes(scores):
+    assert list(scores.columns) == list(EXPECTED_DTYPES) + ['ml_prediction']
+    for column, dtype in EXPECTED_DTYPES.items():
+        assert scores[column].dtype == dtype, column
+    assert isinstance(scores['ml_prediction'].dtype, pd.CategoricalDtype)
+
+
+def test_analyze_matches_score_batch(detector, frame):
+    scores = frame.harassment.analyze('text', detector, batch_size=40)
+    _assert_dtypes(scores)
+    expected = detector.score_batch(frame['text'].tolist())
+    assert scores['is_harassment'].tolist() == expected['is_harassment'].tolist()
+    assert scores['category'].tolist() == expected['category'].tolist()
+    assert scores['severity'].tolist() == expected['severity'].tolist()
+    assert scores['rule_score'].tolist() == expected['rule_score'].tolist()
+    assert scores['ml_prediction'].tolist() == expected['ml_prediction'].tolist()
+    np.testing.assert_allclose(scores['confidence'], expected['confidence_score'], rtol=1e-6)
+
+
+def test_empty_frame(detector):
+    scores = pd.DataFrame({'text': pd.Series([], dtype=object)}).harassment.analyze('text', detector)
+    assert len(scores) == 0
+    _assert_dtypes(scores)
+
+
+def test_missing_text_scores_as_empty(detector):
+    texts = pd.Series(["I will kill you", None, np.nan, ""], index=[3, 1, 2, 0])
+    scores = score_series(texts, detector)
+    expected = score_series(pd.Series(["I will kill you", "", "", ""], index=[3, 1, 2, 0]), detector)
+    pd.testing.assert_frame_equal(scores, expected)
+    assert not scores.loc[[1, 2, 0], 'is_harassment'].any()
+
+
+def test_join_preserves_index_and_columns(detector, frame):
+    shuffled = frame.sample(frac=1, random_state=0)
+    joined = shuffled.harassment.analyze('text', detector, join=True)
+    assert list(joined.index) == list(shuffled.index)
+    pd.testing.assert_frame_equal(joined[['text', 'n']], shuffled)
+    pd.testing.assert_frame_equal(joined.drop(columns=['text', 'n']),
+                                  score_series(shuffled['text'], detector))
+
+
+def test_analyze_chunks_matches_single_shot(detector, frame):
+    chunks = [frame.iloc[i:i + 33] for i in range(0, len(frame), 33)]
+    combined = pd.concat(list(analyze_chunks(chunks, 'text', detector)))
+    single = frame.harassment.analyze('text', detector, join=True)
+    pd.testing.assert_frame_equal(combined, single)
+
+
+def test_unknown_column(frame):
+    with pytest.raises(KeyError, match='nope'):
+        frame.harassment.analyze('nope')
@@ -0,0 +1,40 @@
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from detector import TRAINING_DATA
+from preprocess import NGRAM_RANGE, Document, analyze_document, vectorize_documents
+
+TEXTS = [text for text, _ in TRAINING_DATA] + [
+    "",
+    "a",
+    "Don't   STOP!!  He said: 'I won’t stop' -- ever...",
+    "x_y 12 34 über café naïve ümlaut",
+    "tabs\tand\nnewlines\r\nmixed",
+]
+
+
+def test_analyzer_matches_default_word_analyzer():
+    default = TfidfVectorizer(ngram_range=NGRAM_RANGE).build_analyzer()
+    for text in TEXTS:
+        document = Document(text, transliterated=False)
+        assert analyze_document(document) == default(document.text), text
+
+
+def test_vectorized_documents_match_default_vectorizer():
+    custom = TfidfVectorizer(max_features=1000, analyzer=analyze_document).fit(TEXTS)
+    default = TfidfVectorizer(max_features=1000, ngram_range=NGRAM_RANGE).fit(
+        [Document(text).text for text in TEXTS])
+    assert custom.vocabulary_ == default.vocabulary_
+
+    documents = [Document(text) for text in TEXTS]
+    expected = default.transform([document.text for document in documents])
+    actual = vectorize_documents(custom, documents)
+    assert np.allclose(actual.toarray(), expected.toarray())
+
+
+def test_document_vector_is_cached_per_vectorizer():
+    vectorizer = TfidfVectorizer(analyzer=analyze_document).fit(TEXTS)
+    document = Document(TEXTS[0])
+    assert document.vector(vectorizer) is document.vector(vectorizer)
+    other = TfidfVectorizer(analyzer=analyze_document).fit(TEXTS[:5])
+    assert document.vector(other).shape[1] == len(other.vocabulary_)
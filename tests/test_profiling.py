@@ -0,0 +1,82 @@
+import json
+import os
+import sys
+
+import pytest
+
+from detector import HarassmentDetector
+from profiling import RequestProfiler, install, main, timed_analysis, uninstall
+
+TEXTS = ["He keeps sending me messages after I asked him to stop", "I will kill you",
+         "we had lunch together", "", "stupid idiot loser"]
+
+
+@pytest.fixture
+def profiled(detector, tmp_path):
+    """The session detector with a profiler installed for one test."""
+    profiler = RequestProfiler(directory=str(tmp_path), slow_ms=0.0)
+    yield install(detector, profiler)
+    uninstall(detector)
+
+
+@pytest.mark.parametrize('text', TEXTS)
+def test_timed_analysis_matches_analyze_incident(detector, text):
+    result, stages = timed_analysis(detector, text)
+    assert result == detector.analyze_incident(text)
+    assert tuple(stages) == HarassmentDetector.ANALYSIS_STAGES
+    assert all(seconds >= 0 for seconds in stages.values())
+
+
+def test_profile_off_skips_the_profiler(detector, monkeypatch):
+    def fail(*args):
+        raise AssertionError('profiler used')
+    monkeypatch.setattr(HarassmentDetector, '_profiled_analysis', fail)
+    assert detector.profiler is None
+    detector.analyze_incident(TEXTS[0])
+
+
+def test_profile_on_demand_traces_one_request(detector, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    result = detector.analyze_incident(TEXTS[0], profile=True)
+    assert result == detector.analyze_incident(TEXTS[0])
+    written = os.listdir(tmp_path / 'profiles')
+    assert len(written) == 1 and written[0].endswith('.collapsed')
+    assert '_rule_based_check' in (tmp_path / 'profiles' / written[0]).read_text()
+
+
+def test_installed_profiler_logs_slow_requests_without_text(profiled, tmp_path):
+    for text in TEXTS:
+        assert profiled.analyze_incident(text) == profiled._analyze(text)
+    with open(tmp_path / 'slow_requests.jsonl', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    assert [record['input_length'] for record in records] == [len(text) for text in TEXTS]
+    assert all(record['profile'] is None for record in records)
+    assert not any(text and text in json.dumps(records) for text in TEXTS)
+
+
+def test_installed_profiler_traces_on_demand(profiled, tmp_path):
+    profiled.analyze_incident(TEXTS[1], profile=True)
+    assert [name for name in os.listdir(tmp_path) if name.endswith('.collapsed')]
+
+
+def test_install_without_environment_leaves_detector_alone(detector, monkeypatch):
+    for name in ('HARASSMENT_PROFILE_RATE', 'HARASSMENT_PROFILE_DIR', 'HARASSMENT_SLOW_MS'):
+        monkeypatch.delenv(name, raising=False)
+    assert install(detector).profiler is None
+    assert 'profiler' not in vars(detector)
+
+
+def test_tracing_restores_the_previous_profiler(detector, tmp_path, capsys):
+    def outer(frame, event, arg):
+        pass
+
+    profiler = RequestProfiler(directory=str(tmp_path))
+    sys.setprofile(outer)
+    try:
+        profiler.analyze(detector, TEXTS[0], profile=True)
+        assert sys.getprofile() is outer
+        assert main([TEXTS[1], '--output', str(tmp_path / 'cli'), '--top', '1']) == 0
+        assert sys.getprofile() is outer
+    finally:
+        sys.setprofile(None)
+    assert 'chars:' in capsys.readouterr().out
@@ -0,0 +1,42 @@
+import detector as detector_module
+from similarity_index import SimilarityIndex
+
+REPORTS = [
+    "He keeps following me home from the station every night",
+    "My colleague sent me explicit photos without my consent",
+    "They threatened to leak my private photos online",
+    "We disagreed about the project deadline in a meeting",
+]
+
+
+def _index(detector, tmp_path):
+    return SimilarityIndex(str(tmp_path / 'index'), len(detector.model.named_steps['tfidf'].vocabulary_))
+
+
+def test_index_incidents_vectorizes_once(detector, tmp_path, monkeypatch):
+    calls = []
+    vectorize = detector_module.vectorize_documents
+    monkeypatch.setattr(detector_module, 'vectorize_documents',
+                        lambda vectorizer, documents: calls.append(len(documents)) or vectorize(vectorizer, documents))
+    scores = detector.index_incidents(REPORTS, _index(detector, tmp_path), refs=['a', 'b', 'c', 'd'])
+    assert calls == [len(REPORTS)]
+    expected = detector.score_batch(REPORTS)
+    assert list(scores['severity']) == list(expected['severity'])
+    assert list(scores['ml_prediction']) == list(expected['ml_prediction'])
+
+
+def test_indexed_incidents_are_found(detector, tmp_path):
+    index = _index(detector, tmp_path)
+    detector.index_incidents(REPORTS, index, refs=['a', 'b', 'c', 'd'])
+    index.flush()
+    reopened = SimilarityIndex(str(tmp_path / 'index'))
+    results = detector.find_similar_incidents(REPORTS[2], reopened, k=2)
+    assert results[0]['ref'] == 'c'
+    assert results[0]['similarity'] > 0.99
+
+
+def test_index_incidents_with_no_texts(detector, tmp_path):
+    index = _index(detector, tmp_path)
+    scores = detector.index_incidents([], index)
+    assert all(len(values) == 0 for values in scores.values())
+    assert len(index) == 0
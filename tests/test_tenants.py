@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from tenants import TenantRegistry
+
+
+@pytest.fixture
+def registry(detector):
+    registry = TenantRegistry(detector)
+    registry.add_tenant('empty')
+    registry.add_tenant('acme', add={'verbal': {'high': ['slangterm', 'Bitch']}}, suppress=['hot', 'BITCH'])
+    return registry
+
+
+def test_empty_overlay_matches_base_rules(registry, detector, mixed_texts):
+    base = detector.batch_rule_engine.score(mixed_texts)
+    overlaid = registry.rule_results(mixed_texts, 'empty')
+    assert overlaid.rule_results() == base.rule_results()
+    assert (overlaid.final_severity == base.final_severity).all()
+    assert (overlaid.boundary_intents == base.boundary_intents).all()
+
+
+def test_empty_overlay_matches_base_detector(registry, detector, mixed_texts):
+    texts = mixed_texts[:200] + mixed_texts[-40:]
+    assert registry.analyze_batch(texts, 'empty') == detector.analyze_batch(texts)
+    for text in texts[:30] + texts[-10:]:
+        assert registry.analyze_incident(text, 'empty') == detector.analyze_incident(text)
+
+
+def test_chunked_overlay_matches_single_pass(registry, detector, mixed_texts):
+    overlay, engine = registry.overlays['acme'], detector.batch_rule_engine
+    whole = overlay.score(engine, mixed_texts, chunk_size=None)
+    chunked = overlay.score(engine, mixed_texts, chunk_size=97)
+    assert whole.rule_results() == chunked.rule_results()
+    assert (whole.final_severity == chunked.final_severity).all()
+
+
+def test_added_terms_only_apply_to_their_tenant(registry):
+    result = registry.analyze_incident("you are a slangterm", 'acme')
+    assert result['is_harassment'] and result['severity'] == 'High'
+    assert registry.rule_results(["you are a slangterm"], 'acme').rule_result(0)['matched_keywords'] == \
+        ['slangterm (verbal, high)']
+    assert registry.rule_results(["you are a slangterm"]).rule_result(0)['score'] == 0
+    assert registry.rule_results(["you are a slangterm"], 'empty').rule_result(0)['score'] == 0
+
+
+@pytest.mark.parametrize('text', ["you look hot", "you bitch", "you b1tch"])
+def test_suppressed_terms_and_their_fuzzy_matches_are_dropped(registry, text):
+    assert registry.rule_results([text]).rule_result(0)['score'] > 0
+    # 'Bitch' is added back under its own base category and severity, which adds nothing
+    assert registry.rule_results([text], 'acme').rule_result(0)['score'] == 0
+
+
+def test_suppression_keeps_other_matches(registry):
+    result = registry.rule_results(["you look hot, I will kill you"], 'acme').rule_result(0)
+    assert result['matched_keywords'] == ['kill you (threat, high)']
+
+
+@pytest.mark.parametrize('add, suppress, message', [
+    ({'gossip': {'high': ['x']}}, (), 'Unknown categories'),
+    ({'verbal': {'extreme': ['x']}}, (), 'Unknown severities'),
+    (None, ['notakeyword'], 'Cannot suppress'),
+])
+def test_invalid_overlays_are_rejected(registry, add, suppress, message):
+    with pytest.raises(ValueError, match=message):
+        registry.add_tenant('bad', add, suppress)
+    assert 'bad' not in registry.overlays
+
+
+def test_unknown_tenant(registry):
+    with pytest.raises(KeyError):
+        registry.analyze_incident("hello", 'nobody')
+
+
+def test_load_from_json(detector, tmp_path):
+    path = tmp_path / 'tenants.json'
+    path.write_text(json.dumps({'acme': {'add': {'threat': {'medium': ['slangterm']}}, 'suppress': ['hot']}}))
+    registry = TenantRegistry(detector).load(str(path))
+    assert registry.rule_results(["slangterm"], 'acme').rule_result(0)['category'] == 'threat'
+    assert registry.rule_results(["hot"], 'acme').rule_result(0)['score'] == 0
@@ -0,0 +1,55 @@
+import pytest
+
+from preprocess import Document
+from transliteration import find_glosses, transliterate
+
+ENGLISH_WITH_NAMES = [
+    "My manager Randi reviewed my work",
+    "Please call Kamini about the invoice",
+    "Roz from accounts reviewed my report",
+    "Mr. Moti approved the travel budget",
+    "Marja and Kutti joined the design team",
+    "Dr. Pagal moved the appointment to Friday",
+    "We trekked to the Nanga Parbat base camp",
+    "Rozana, Roj and Kamina are presenting tomorrow",
+    "Randi Kamini Moti Roz",
+]
+
+
+@pytest.mark.parametrize('text', ENGLISH_WITH_NAMES)
+def test_names_in_english_text_are_not_glossed(text):
+    assert transliterate(text) == text
+
+
+@pytest.mark.parametrize('text', ENGLISH_WITH_NAMES)
+def test_names_in_english_text_do_not_change_results(detector, text):
+    assert detector.analyze_incident(text) == detector.analyze_incident(Document(text, transliterated=False))
+
+
+def test_reported_name_collisions(detector):
+    assert not detector.analyze_incident("My manager Randi reviewed my work")['is_harassment']
+    assert not detector.analyze_incident("Please call Kamini about the invoice")['is_harassment']
+    # "report" is a low-severity keyword of its own; the name must not add "every day"
+    assert detector.analyze_incident("Roz from accounts reviewed my report")['severity'] == 'Low'
+    assert 'fat' not in detector.analyze_incident("Mr. Moti approved the travel budget")['matched_keywords']
+
+
+@pytest.mark.parametrize('text, gloss', [
+    ("tu randi hai", 'whore'),
+    ("saali kamini", 'bastard'),
+    ("tu pagal hai", 'idiot'),
+    ("kitni moti hai tu", 'fat'),
+    ("woh roz mera peecha karta hai", 'every day'),
+    ("har roz aata hai", 'every day'),
+    ("usne mujhe raandi kaha", 'whore'),
+    ("main tujhe jaan se maar dunga", 'kill you'),
+    ("वह रोज़ मेरा पीछा करता है", 'following me'),
+])
+def test_hinglish_phrases_are_glossed(text, gloss):
+    assert gloss in find_glosses(text)
+
+
+def test_hinglish_threat_is_detected(detector):
+    result = detector.analyze_incident("Woh roz mera peecha karta hai aur bolta hai jaan se maar dunga")
+    assert result['is_harassment']
+    assert result['severity'] in ('High', 'Critical')
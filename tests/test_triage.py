@@ -0,0 +1,50 @@
+import json
+
+import numpy as np
+import pytest
+
+from triage import TriageQueue, main, priority_key
+from utils import read_records
+
+
+def _full_sort(detector, texts, k):
+    scores = detector.score_batch(texts)
+    priorities = priority_key(scores['severity_level'], scores['boundary_intents'], scores['rule_score'],
+                              scores['is_harassment'], scores['confidence_score'])
+    # Highest priority first; ties go to the earlier report
+    order = sorted(range(len(texts)), key=lambda i: (-int(priorities[i]), i))
+    return [f"r{i}" for i in order[:k]]
+
+
+@pytest.mark.parametrize('k, batch_size', [(1, 50), (10, 37), (25, 1000), (1000, 64)])
+def test_top_k_matches_full_sort(detector, mixed_texts, k, batch_size):
+    reports = [(f"r{i}", text) for i, text in enumerate(mixed_texts)]
+    queue = TriageQueue(k, detector).extend(reports, batch_size)
+    assert [item.ref for item in queue.top()] == _full_sort(detector, mixed_texts, k)
+    assert queue.seen == len(mixed_texts)
+
+
+def test_push_matches_add_batch(detector, mixed_texts):
+    texts = mixed_texts[:150]
+    batched = TriageQueue(20, detector)
+    batched.add_batch([f"r{i}" for i in range(len(texts))], texts)
+    pushed = TriageQueue(20, detector)
+    for i, text in enumerate(texts):
+        pushed.push(f"r{i}", text, detector.analyze_incident(text))
+    assert pushed.top() == batched.top()
+
+
+def test_priority_key_orders_like_tuple():
+    rng = np.random.RandomState(0)
+    rows = list(zip(rng.randint(0, 4, 300), rng.randint(0, 4, 300), rng.randint(0, 80, 300),
+                    rng.randint(0, 2, 300), rng.randint(0, 1000, 300) / 999))
+    keys = [int(priority_key(*row)) for row in rows]
+    assert [rows[i] for i in sorted(range(300), key=keys.__getitem__)] == sorted(rows)
+
+
+def test_cli_reads_shared_record_formats(tmp_path, capsys):
+    path = tmp_path / 'reports.csv'
+    path.write_text("id,text\nx,he will kill you\ny,we had lunch\n", encoding='utf-8')
+    assert list(read_records(str(path), 'text')) == [('x', 'he will kill you'), ('y', 'we had lunch')]
+    assert main([str(path), '--top', '1']) == 0
+    assert json.loads(capsys.readouterr().out)['ref'] == 'x'
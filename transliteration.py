@@ -0,0 +1,245 @@
+"""
+Hinglish / Devanagari normalization front end.
+
+The keyword lexicon and the model only understand English, but many reports
+from India use Hindi in Devanagari script or romanized Hinglish. This stage
+maps common Hindi/Hinglish terms onto the canonical English lexicon before
+matching: the text is normalized with precompiled str.translate tables, split
+into tokens once, and every recognized phrase appends its English gloss, e.g.
+
+    "main tujhe jaan se maar dunga"  ->  "main tujhe jaan se maar dunga (kill you)"
+
+Text without any trigger word returns unchanged after a single
+set-disjointness check. Words that are also given names or English words
+(Randi, Kamini, Moti, Roz, Pagal, Nanga Parbat ...) are only glossed inside a
+Hindi phrase such as "tu randi hai" or "roz mera peecha", so English reports
+that mention such a name are left alone.
+
+Usage:
+    python transliteration.py          # throughput benchmark
+"""
+
+import string
+import sys
+import time
+from typing import Dict, List, Tuple
+
+# Devanagari normalization: nukta letters to their base letter, nukta and joiners
+# dropped, chandrabindu to anusvara, Devanagari digits and danda to ASCII
+_DEVANAGARI_TABLE = str.maketrans({
+    'क़': 'क', 'ख़': 'ख', 'ग़': 'ग', 'ज़': 'ज',
+    'ड़': 'ड', 'ढ़': 'ढ', 'फ़': 'फ', 'य़': 'य',
+    '़': None, '‌': None, '‍': None,
+    'ँ': 'ं',
+    '।': '.', '॥': '.',
+    **{chr(0x0966 + d): str(d) for d in range(10)},
+    # Typographic quotes, so "don’t" matches the intent patterns
+    '‘': "'", '’': "'", '“': '"', '”': '"',
+})
+
+# Punctuation becomes whitespace when splitting into tokens for lookup
+_SEPARATOR_TABLE = str.maketrans({c: ' ' for c in string.punctuation + '…'})
+
+# Each entry is a phrase whose words list their spelling variants separated by '/',
+# mapped to a term that exists in HarassmentDetector.keywords (or an intent pattern).
+# Devanagari entries are written after _DEVANAGARI_TABLE normalization (no nukta).
+# Ambiguous words (names, English words) are never entries of their own: they only
+# match framed by Hindi words, e.g. "{_BEFORE_INSULT} moti" and "moti {_AFTER_INSULT}".
+_BEFORE_INSULT = "tu/tum/tera/teri/tere/saala/saali/sala/sali/ek/bada/badi/sabse/kitna/kitni/kitne"
+_AFTER_INSULT = "hai/hain/ho/tha/thi/saala/saali/sala/sali/kahin/kahi/aurat/ladki/ladka/insaan"
+_BEFORE_DAILY = "woh/wo/vo/ye/yeh"
+_AFTER_DAILY = ("mera/meri/mere/mujhe/mujhko/hume/humko/aata/aati/aate/aake/karta/karti/karte/"
+                "bolta/bolti/bolte/peecha/picha/pichha/peechha/ghar/raat/subah/shaam")
+
+
+def _framed(words: str, gloss: str, before: str = _BEFORE_INSULT, after: str = _AFTER_INSULT
+            ) -> List[Tuple[str, str]]:
+    """Entries matching ambiguous ``words`` only right after a ``before`` or before an ``after`` word."""
+    return [(f"{before} {words}", gloss), (f"{words} {after}", gloss)]
+
+
+HINGLISH_LEXICON = [
+    # Threats
+    ("jaan/jan se maar/mar/maarunga/marunga/maarenge/marenge", 'kill you'),
+    ("maar/mar daalunga/dalunga/daalenge/dalenge/daalungi/dalungi", 'kill you'),
+    ("khatam/khatm kar dunga/doonga/denge/dungi", 'finish you'),
+    ("maar/mar dunga/doonga/denge/dungi/doongi", 'beat you'),
+    ("maarunga/marunga/maarenge/marenge/peetunga/pitunga/peetenge", 'beat you'),
+    ("utha/uthwa lunga/loonga/lenge/lungi", 'kidnap'),
+    ("agwa/agwaa/agvaa", 'kidnap'),
+    ("dekh lunga/loonga/lenge/lungi", 'get you'),
+    ("pachtayegi/pachtayega/pachtaoge/pachtaogi/pachtayenge", 'regret'),
+    ("anjaam/anjam bura/bhugatna/bhugtoge", 'consequences'),
+    ("sabak/sabaq sikhaunga/sikhayenge/sikhaoonga", 'make you pay'),
+    ("dhamki/dhamkee/dhamkiyan", 'threaten'),
+    ("जान से मार/मारूंगा/मारुंगा/मारेंगे", 'kill you'),
+    ("मार डालूंगा/डालुंगा/डालेंगे", 'kill you'),
+    ("मार दूंगा/दुंगा/देंगे", 'beat you'),
+    ("उठा लूंगा/लुंगा/लेंगे", 'kidnap'),
+    ("अगवा", 'kidnap'),
+    ("देख लूंगा/लुंगा/लेंगे", 'get you'),
+    ("पछताएगी/पछताएगा/पछताओगे", 'regret'),
+    ("धमकी", 'threaten'),
+
+    # Sexual
+    ("balatkar/balaatkar/balatkaar", 'rape'),
+    ("zabardasti/jabardasti/zabardastee", 'forced me to'),
+    ("chhedkhani/chedkhani/chhedchhad/chhed/chheda/chhedta/chhedte/chedta", 'sexual advances'),
+    ("galat/ghalat tarike/tareeke/tarah se chhua/chua/chhuaa/chhoya", 'touched me inappropriately'),
+    ("galat/ghalat jagah chhua/chua/chhuaa/chhoya", 'touched me inappropriately'),
+    ("nangi/nangee", 'naked'),
+    *_framed("nanga", 'naked'),
+    ("mere/mujhse saath/sath so/soja/sona/sone", 'sleep with'),
+    ("बलात्कार", 'rape'),
+    ("जबरदस्ती", 'forced me to'),
+    ("छेडखानी/छेडछाड/छेडता/छेडते", 'sexual advances'),
+    ("गलत जगह/तरीके छुआ/छूआ/छूता/छूते", 'touched me inappropriately'),
+    ("नंगी/नंगा", 'naked'),
+
+    # Verbal abuse
+    ("raandi", 'whore'),
+    *_framed("randi/rundi", 'whore'),
+    ("kutiya/kuttiya", 'bitch'),
+    *_framed("kutti", 'bitch'),
+    ("chinal/chhinal", 'slut'),
+    ("harami/haraami/haramzada/haramzadi/haraamzaada/haramkhor/kameena/kameeni", 'bastard'),
+    *_framed("kamina/kamini", 'bastard'),
+    ("chutiya/chutiye/chootiya", 'bastard'),
+    ("madarchod/maderchod/behenchod/bhenchod/bahenchod/behnchod", 'fuck you'),
+    ("mar/marr ja/jaa/jao", 'die'),
+    ("marjaa", 'die'),
+    *_framed("marja", 'die'),
+    ("tujhse/tumse/tujhe nafrat", 'hate you'),
+    ("bewakoof/bevakoof/bewakuf/bevkoof/bewkoof", 'stupid'),
+    ("paagal", 'idiot'),
+    *_framed("pagal", 'idiot'),
+    ("ullu/gadha/gadhi/gadhe", 'dumb'),
+    ("nikamma/nikammi/nikamme/bekaar/bekar", 'useless'),
+    ("ghatiya/ghatia", 'pathetic'),
+    *_framed("moti/motee", 'fat'),
+    ("badsurat/badsoorat", 'ugly'),
+    ("chup/chupp kar/ho/raho/reh", 'shut up'),
+    ("रंडी", 'whore'),
+    ("कुतिया", 'bitch'),
+    ("छिनाल", 'slut'),
+    ("हरामी/हरामजादा/हरामजादी/कमीना/कमीनी/चूतिया/चुतिया", 'bastard'),
+    ("मादरचोद/बहनचोद/भेनचोद", 'fuck you'),
+    ("मर जा/जाओ", 'die'),
+    ("तुझसे/तुमसे नफरत", 'hate you'),
+    ("बेवकूफ/बेवकुफ", 'stupid'),
+    ("पागल", 'idiot'),
+    ("निकम्मा/निकम्मी/बेकार", 'useless'),
+    ("घटिया", 'pathetic'),
+    ("चुप कर/हो/रहो", 'shut up'),
+
+    # Stalking
+    ("peecha/picha/pichha/peechha karta/karti/karte/kar/karna/kiya", 'following me'),
+    ("ghar ke bahar/baahar", 'outside my house'),
+    ("nazar/najar rakhta/rakhti/rakhte", 'watching me'),
+    ("पीछा", 'following me'),
+    ("घर के बाहर", 'outside my house'),
+    ("नजर रखता/रखती/रखते", 'watching me'),
+
+    # Physical
+    ("thappad/thapad/chaanta/chanta", 'slapped'),
+    ("laat/lath maari/mari/maara/mara", 'kicked'),
+    ("dhakka/dhakkaa diya/mara/maara/de", 'pushed'),
+    ("haath/hath pakda/pakad/pakdaa/pakdi", 'grabbed me'),
+    ("pitai/pitaai", 'beaten'),
+    ("gala/galaa dabaya/dabaaya", 'choked'),
+    ("थप्पड/चांटा", 'slapped'),
+    ("लात मारी/मारा", 'kicked'),
+    ("धक्का", 'pushed'),
+    ("हाथ पकडा/पकड", 'grabbed me'),
+    ("पिटाई", 'beaten'),
+
+    # Cyber
+    ("photo/photos/pic/pics/video viral/leak", 'leaked photos'),
+    ("फोटो/वीडियो वायरल/लीक", 'leaked photos'),
+
+    # Workplace
+    ("naukri/naukari se nikal/nikaal", 'career threat'),
+    ("नौकरी से निकाल", 'career threat'),
+
+    # Repetition and boundaries
+    ("baar/bar baar/bar", 'again and again'),
+    ("rojana", 'every day'),
+    *_framed("roz/roj/rozana", 'every day', _BEFORE_DAILY, _AFTER_DAILY),
+    ("roz roz", 'every day'),
+    ("roj roj", 'every day'),
+    ("har din/roz", 'every day'),
+    ("mana/manaa kiya/karne/karke", 'despite saying no'),
+    ("dar/darr lagta/lagti/lag", 'scared'),
+    ("बार बार", 'again and again'),
+    ("रोज/रोजाना", 'every day'),
+    ("हर दिन", 'every day'),
+    ("मना किया/करने", 'despite saying no'),
+    ("डर", 'scared'),
+]
+
+
+def _compile(lexicon: List[Tuple[str, str]]) -> Dict[str, List[Tuple[Tuple[frozenset, ...], str]]]:
+    """First-word variant -> [(variant sets of the remaining words, English gloss)]."""
+    index = {}
+    for phrase, gloss in lexicon:
+        words = [frozenset(word.split('/')) for word in phrase.translate(_DEVANAGARI_TABLE).split()]
+        for first in words[0]:
+            index.setdefault(first, []).append((tuple(words[1:]), gloss))
+    return index
+
+
+_PHRASE_INDEX = _compile(HINGLISH_LEXICON)
+_TRIGGERS = frozenset(_PHRASE_INDEX)
+
+
+def find_glosses(text: str) -> List[str]:
+    """English glosses of the Hindi/Hinglish phrases in ``text`` (already normalized), in order."""
+    tokens = text.lower().translate(_SEPARATOR_TABLE).split()
+    if _TRIGGERS.isdisjoint(tokens):
+        return []
+
+    glosses = []
+    for i, token in enumerate(tokens):
+        for rest, gloss in _PHRASE_INDEX.get(token, ()):
+            following = tokens[i + 1:i + 1 + len(rest)]
+            if len(following) == len(rest) and all(t in variants for t, variants in zip(following, rest)):
+                if gloss not in glosses:
+                    glosses.append(gloss)
+    return glosses
+
+
+def transliterate(text: str) -> str:
+    """
+    Normalize script variants and append English glosses of recognized Hindi/Hinglish terms.
+    English-only text is returned unchanged.
+    """
+    if not text.isascii():
+        text = text.translate(_DEVANAGARI_TABLE)
+    glosses = find_glosses(text)
+    if not glosses:
+        return text
+    return f"{text} ({'; '.join(glosses)})"
+
+
+def benchmark(n: int = 20000) -> Dict[str, float]:
+    """Texts per second for English-only and mixed-script input."""
+    samples = {
+        'english': "My colleague keeps sending me messages late at night and I asked him to stop.",
+        'hinglish': "Woh roz mera peecha karta hai aur bolta hai jaan se maar dunga, bahut dar lagta hai.",
+        'devanagari': "वह रोज़ मेरा पीछा करता है और कहता है कि जान से मार दूंगा। मुझे डर लगता है।",
+        'mixed': "He said main tujhe dekh lunga and called me कुतिया in front of everyone.",
+    }
+    results = {}
+    for name, sample in samples.items():
+        texts = [f"{sample} {i}" for i in range(n)]
+        start = time.perf_counter()
+        for text in texts:
+            transliterate(text)
+        results[name] = n / (time.perf_counter() - start)
+    return results
+
+
+if __name__ == '__main__':
+    for name, rate in benchmark().items():
+        print(f"{name:<12}{rate:>12,.0f} texts/s")
+    sys.exit(0)
@@ -0,0 +1,185 @@
+"""
+Severity-ranked triage queue for report backlogs.
+
+Reports are streamed through HarassmentDetector.score_batch and only the K most
+urgent are kept, in a bounded min-heap whose root is the least urgent report
+kept so far. A batch is compared against that root with NumPy first, so most
+reports never reach the heap, and the top K of 10 million reports needs O(K +
+batch size) memory and no full sort. New reports can be added at any time.
+
+Priority is lexicographic: severity, then the number of boundary-violating
+intents (coercion, no_consent, ignoring_boundaries), then rule_score, then
+whether the report is harassment at all, then confidence. Ties go to the
+report that arrived first.
+
+Usage:
+    python triage.py reports.jsonl|reports.csv|reports.txt [--top 100] [--text-field text]
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+import sys
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+import numpy as np
+
+from batch_rules import BOUNDARY_INTENTS, SEVERITY_LEVELS
+from detector import HarassmentDetector
+from preprocess import Document
+from utils import json_default, read_records
+
+# Bits of each priority component, most significant first; see priority_key
+_INTENT_BITS = 4
+_SCORE_BITS = 20
+_CONFIDENCE_BITS = 16
+
+
+def priority_key(severity_level, boundary_intents, rule_score, is_harassment, confidence):
+    """
+    Pack the priority components into one int64 (scalars or arrays) that orders
+    like the tuple (severity_level, boundary_intents, rule_score, is_harassment,
+    confidence). Intent counts and rule scores saturate at 15 and about a million;
+    confidence is kept to 1/65535.
+    """
+    key = np.asarray(severity_level, dtype=np.int64)
+    key = (key << _INTENT_BITS) | np.minimum(boundary_intents, (1 << _INTENT_BITS) - 1)
+    key = (key << _SCORE_BITS) | np.minimum(rule_score, (1 << _SCORE_BITS) - 1)
+    key = (key << 1) | np.asarray(is_harassment, dtype=np.int64)
+    key = (key << _CONFIDENCE_BITS) | np.round(
+        np.clip(confidence, 0, 1) * ((1 << _CONFIDENCE_BITS) - 1)).astype(np.int64)
+    return key
+
+
+class TriageItem(NamedTuple):
+    """A report kept in the queue, with the fields its priority was computed from."""
+    ref: str
+    text: str
+    severity: str
+    boundary_intents: int
+    rule_score: int
+    is_harassment: bool
+    confidence: float
+    category: str
+    priority: int
+
+
+class TriageQueue:
+    """The ``k`` highest-priority reports seen so far."""
+
+    def __init__(self, k: int = 100, detector: Optional[HarassmentDetector] = None):
+        if k < 1:
+            raise ValueError("k must be at least 1")
+        self.k = k
+        self.detector = detector
+        # (priority, -arrival, item): the root is the lowest priority, latest arrival
+        self._heap: List[Tuple[int, int, TriageItem]] = []
+        self._arrivals = itertools.count()
+        self.seen = 0
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    @property
+    def threshold(self) -> Optional[int]:
+        """Priority a new report must exceed to enter the queue, None while it is not full."""
+        return self._heap[0][0] if len(self._heap) == self.k else None
+
+    def _offer(self, arrival: int, item: TriageItem) -> bool:
+        entry = (item.priority, -arrival, item)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+            return True
+        if entry[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, entry)
+            return True
+        return False
+
+    def push(self, ref: str, text: str, result: Dict) -> bool:
+        """
+        Offer one report already analyzed with analyze_incident.
+        Returns whether it entered the queue.
+        """
+        boundary_intents = sum(intent in BOUNDARY_INTENTS for intent in result['intent_matches'])
+        severity_level = SEVERITY_LEVELS.index(result['severity'])
+        priority = int(priority_key(severity_level, boundary_intents, result['rule_score'],
+                                    result['is_harassment'], result['confidence_score']))
+        self.seen += 1
+        return self._offer(next(self._arrivals), TriageItem(
+            ref, text, result['severity'], boundary_intents, int(result['rule_score']),
+            bool(result['is_harassment']), float(result['confidence_score']), result['category'], priority
+        ))
+
+    def add_batch(self, refs: List[str], texts: List[Union[str, Document]]) -> int:
+        """Score a batch with score_batch and offer it. Returns how many reports entered the queue."""
+        if not texts:
+            return 0
+        if self.detector is None:
+            self.detector = HarassmentDetector()
+        scores = self.detector.score_batch(texts)
+        priorities = priority_key(scores['severity_level'], scores['boundary_intents'], scores['rule_score'],
+                                  scores['is_harassment'], scores['confidence_score'])
+        first = next(self._arrivals)
+        self._arrivals = itertools.count(first + len(texts))
+        self.seen += len(texts)
+
+        # Later arrivals lose ties, so only reports strictly above the root can enter
+        candidates = np.arange(len(texts))
+        if self.threshold is not None:
+            candidates = candidates[priorities > self.threshold]
+        if len(candidates) > self.k:
+            # At most k of the batch can be kept: those above the k-th largest priority, then the earliest ties
+            values = priorities[candidates]
+            kth = np.partition(values, len(values) - self.k)[len(values) - self.k]
+            above = candidates[values > kth]
+            ties = candidates[values == kth][:self.k - len(above)]
+            candidates = np.sort(np.concatenate([above, ties]))
+
+        entered = 0
+        for i in candidates.tolist():
+            text = texts[i]
+            entered += self._offer(first + i, TriageItem(
+                refs[i], text.raw if isinstance(text, Document) else text, scores['severity'][i],
+                int(scores['boundary_intents'][i]), int(scores['rule_score'][i]),
+                bool(scores['is_harassment'][i]), float(scores['confidence_score'][i]),
+                scores['category'][i], int(priorities[i])
+            ))
+        return entered
+
+    def extend(self, reports: Iterable[Tuple[str, str]], batch_size: int = 10000) -> 'TriageQueue':
+        """Stream (ref, text) reports through the queue ``batch_size`` at a time."""
+        iterator = iter(reports)
+        while True:
+            batch = list(itertools.islice(iterator, batch_size))
+            if not batch:
+                return self
+            refs, texts = zip(*batch)
+            self.add_batch(list(refs), list(texts))
+
+    def top(self) -> List[TriageItem]:
+        """The queued reports, most urgent first (sorts only the K kept)."""
+        return [item for _, _, item in sorted(self._heap, reverse=True)]
+
+    def __iter__(self) -> Iterator[TriageItem]:
+        return iter(self.top())
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('input', help='JSON lines, CSV or plain text with one report per line')
+    parser.add_argument('--top', type=int, default=100)
+    parser.add_argument('--text-field', default='text')
+    parser.add_argument('--batch-size', type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    queue = TriageQueue(args.top).extend(read_records(args.input, args.text_field), args.batch_size)
+    for item in queue.top():
+        record = item._asdict()
+        del record['priority']
+        print(json.dumps(record, default=json_default))
+    print(f"Kept {len(queue)} of {queue.seen} reports", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
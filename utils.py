@@ -2,6 +2,12 @@
 Utility functions for the harassment detection app.
 """
 
+import csv
+import json
+from typing import Iterator, Tuple
+
+from preprocess import Document
+
 def format_confidence_score(score: float) -> str:
     """Format confidence score as percentage."""
     return f"{score * 100:.1f}%"
@@ -19,10 +25,8 @@ def get_severity_color(severity: str) -> str:
 
 def sanitize_input(text: str) -> str:
     """Basic sanitization of user input."""
-    # Remove excessive whitespace
-    text = ' '.join(text.split())
-    # Limit length
-    return text[:5000]
+    # Remove excessive whitespace and limit length (same normalization the detector uses)
+    return Document(text, max_length=5000, transliterated=False).text
 
 def validate_incident_text(text: str) -> tuple[bool, str]:
     """
@@ -39,3 +43,25 @@ def validate_incident_text(text: str) -> tuple[bool, str]:
         return False, "Description is too long. Please limit to 5000 characters."
     
     return True, ""
+
+def json_default(value):
+    """json.dumps ``default`` for the NumPy scalars (np.bool_, np.float64, ...) in analysis results."""
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def read_records(path: str, text_field: str) -> Iterator[Tuple[str, str]]:
+    """Yield (record id, text) from a JSON lines, CSV or plain text file."""
+    with open(path, encoding='utf-8', newline='') as f:
+        if path.endswith('.jsonl') or path.endswith('.json'):
+            for n, line in enumerate(f):
+                if line.strip():
+                    record = json.loads(line)
+                    yield str(record.get('id', n)), record[text_field]
+        elif path.endswith('.csv'):
+            for n, row in enumerate(csv.DictReader(f)):
+                yield str(row.get('id') or n), row[text_field]
+        else:
+            for n, line in enumerate(f):
+                if line.strip():
+                    yield str(n), line.rstrip('\n')
@@ -0,0 +1,116 @@
+"""
+Flat, array-backed TF-IDF vocabulary.
+
+A fitted TfidfVectorizer keeps ``vocabulary_`` as a dict of Python strings. Under a
+pre-fork server every lookup touches those objects' reference counts, so the pages
+holding them are copied into each worker. FlatVocabulary keeps the same mapping in
+a few NumPy arrays instead and can stand in for ``vocabulary_``.
+"""
+
+from collections.abc import Mapping
+from typing import Dict, Iterator, Optional, Sequence
+import numpy as np
+from scipy import sparse
+
+
+class FlatVocabulary(Mapping):
+    """
+    Read-only term -> feature index mapping stored as flat arrays.
+
+    Terms are kept as one sorted fixed-width array of UTF-8 bytes (one byte per
+    ASCII character instead of four for a NumPy str array). Lookups go through a
+    sorted array of the terms' hash() values; hash() is stable within a process
+    and its forked workers, and the table is rebuilt from the terms when unpickled.
+    """
+
+    def __init__(self, vocabulary: Dict[str, int], idf: Optional[np.ndarray] = None):
+        terms = sorted(vocabulary)
+        self.terms = np.array([term.encode('utf-8') for term in terms], dtype=bytes)
+        self.ids = np.array([vocabulary[term] for term in terms], dtype=np.int32)
+        # float32 idf (see compact_model.py) is kept as is
+        self.idf = None if idf is None else np.asarray(idf)
+        self._build_hash_table()
+
+    def _build_hash_table(self):
+        hashes = np.fromiter((hash(term.decode('utf-8')) for term in self.terms), dtype=np.int64,
+                             count=len(self.terms))
+        order = np.argsort(hashes)
+        self._hashes = hashes[order]
+        self._hash_ids = self.ids[order]
+
+    def __getstate__(self):
+        return {'terms': self.terms, 'ids': self.ids, 'idf': self.idf}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.terms.dtype.kind == 'U':
+            self.terms = np.char.encode(self.terms, 'utf-8')
+        self._build_hash_table()
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def __iter__(self) -> Iterator[str]:
+        return (term.decode('utf-8') for term in self.terms)
+
+    def __getitem__(self, term: str) -> int:
+        key = term.encode('utf-8')
+        pos = np.searchsorted(self.terms, key)
+        if pos < len(self.terms) and self.terms[pos] == key:
+            return int(self.ids[pos])
+        raise KeyError(term)
+
+    def lookup(self, terms: Sequence[str]) -> np.ndarray:
+        """Feature index of every term in one vectorized search, -1 for unknown terms."""
+        hashes = np.fromiter((hash(term) for term in terms), dtype=np.int64, count=len(terms))
+        pos = np.minimum(np.searchsorted(self._hashes, hashes), len(self._hashes) - 1)
+        return np.where(self._hashes[pos] == hashes, self._hash_ids[pos], -1)
+
+
+def flatten_vectorizer(vectorizer) -> FlatVocabulary:
+    """
+    Replace a fitted vectorizer's dict vocabulary with a FlatVocabulary, in place.
+    ``stop_words_`` (every term cut by max_features) is only kept for introspection and is dropped.
+    """
+    if not isinstance(vectorizer.vocabulary_, FlatVocabulary):
+        idf = vectorizer.idf_ if getattr(vectorizer, 'use_idf', False) else None
+        vectorizer.vocabulary_ = FlatVocabulary(vectorizer.vocabulary_, idf)
+    if getattr(vectorizer, 'stop_words_', None) is not None:
+        vectorizer.stop_words_ = None
+    return vectorizer.vocabulary_
+
+
+def tfidf_matrix(vectorizer, ngram_lists: Sequence[Sequence[str]]) -> sparse.csr_matrix:
+    """
+    TF-IDF rows for pre-analyzed documents using a FlatVocabulary's vectorized lookup.
+    Matches vectorizer.transform for the default settings (raw counts, idf, l1/l2 norm).
+    """
+    vocabulary = vectorizer.vocabulary_
+    lengths = np.fromiter((len(ngrams) for ngrams in ngram_lists), dtype=np.int64,
+                          count=len(ngram_lists))
+    ids = vocabulary.lookup([ngram for ngrams in ngram_lists for ngram in ngrams])
+    rows = np.repeat(np.arange(len(ngram_lists)), lengths)
+    known = ids >= 0
+    X = sparse.csr_matrix(
+        (np.ones(int(known.sum())), (rows[known], ids[known])),
+        shape=(len(ngram_lists), len(vocabulary))
+    )
+    X.sum_duplicates()
+    if vectorizer.binary:
+        X.data[:] = 1
+    if vectorizer.sublinear_tf:
+        np.log(X.data, X.data)
+        X.data += 1
+    if vocabulary.idf is not None:
+        X.data *= vocabulary.idf[X.indices]
+    if vectorizer.norm not in ('l1', 'l2'):
+        return X
+    counts = np.diff(X.indptr)
+    nonempty = counts > 0
+    norms = np.ones(len(ngram_lists))
+    if X.nnz:
+        values = X.data ** 2 if vectorizer.norm == 'l2' else np.abs(X.data)
+        sums = np.add.reduceat(values, X.indptr[:-1][nonempty])
+        norms[nonempty] = np.sqrt(sums) if vectorizer.norm == 'l2' else sums
+        X.data /= np.repeat(norms, counts)
+    return X